@@ -2,8 +2,15 @@
 # adapters/historial_sharepoint.py
 # ============================================
 import re
+import threading
+import warnings
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
 
+from core.trazas import trazado
+
 # SharePoint (historial_it_pei) -> Estándar interno de la app
 MAP_HIST_SP_TO_STD = {
     # 🔑 Clave para filtrar historial (tu app la llama 'codigo')
@@ -35,7 +42,124 @@ MAP_HIST_SP_TO_STD = {
     "Número Oficio": "numero_oficio",
 }
 
-def adaptar_historial_sharepoint(df_raw: pd.DataFrame) -> pd.DataFrame:
+# Columnas estándar que la app realmente usa (el resto se descarta al leer).
+# 'clave_sync' la agrega el almacén al sincronizar y debe conservarse.
+COLUMNAS_APP = frozenset(["nombre", "clave_sync", *MAP_HIST_SP_TO_STD.values()])
+
+# Tipos esperados por columna estándar (se validan una vez por esquema de encabezados)
+ESQUEMA_HISTORIAL = {
+    "año": "numero",
+    "cantidad_revisiones": "numero",
+    "fecha_recepcion": "fecha",
+    "fecha_derivacion": "fecha",
+    "fecha_it": "fecha",
+    "fecha_oficio": "fecha",
+}
+
+_RE_ESPACIOS = re.compile(r"\s+")
+
+# Huella del encabezado -> problemas de tipos detectados (validación única por esquema)
+_ESQUEMAS_VALIDADOS = {}
+_LOCK_ESQUEMAS = threading.Lock()
+
+
+def normalizar_codigo(x) -> str:
+    """
+    Normaliza un código de UE escalar: 23.0 -> "23", " 0123 " -> "123", NaN -> "".
+    Para columnas completas usar normalizar_codigo_serie (vectorizado).
+    """
+    if x is None or pd.isna(x):
+        return ""
+    try:
+        return str(int(float(x)))
+    except Exception:
+        return str(x).strip()
+
+
+@trazado("adapter.normalizar_codigo")
+def normalizar_codigo_serie(serie: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de normalizar_codigo para una columna completa.
+
+    - Coerción numérica por columna (pd.to_numeric) en vez de try/except por fila
+    - Los valores numéricos finitos se truncan a entero ("23.0" -> "23")
+    - El resto cae al texto original sin espacios; los nulos quedan como ""
+    """
+    numeros = pd.to_numeric(serie, errors="coerce")
+    finitos = np.isfinite(numeros.to_numpy(dtype="float64", na_value=np.nan))
+
+    if finitos.all():
+        return pd.Series(numeros.to_numpy().astype("int64").astype(str), index=serie.index, dtype=object)
+
+    resultado = np.full(len(serie), "", dtype=object)
+    texto = serie.notna().to_numpy() & ~finitos
+    if texto.any():
+        resultado[texto] = serie[texto].astype(str).str.strip().to_numpy()
+    if finitos.any():
+        resultado[finitos] = numeros[finitos].to_numpy().astype("int64").astype(str)
+    return pd.Series(resultado, index=serie.index, dtype=object)
+
+
+def _columna_estandar(c) -> str:
+    # A) Encabezado SharePoint: sin espacios extremos y con espacios simples
+    c = _RE_ESPACIOS.sub(" ", str(c).strip())
+    # B) SharePoint -> estándar app
+    c = MAP_HIST_SP_TO_STD.get(c, c)
+    # C) Convención interna: lower + underscores
+    return c.strip().lower().replace(" ", "_")
+
+
+@lru_cache(maxsize=64)
+def _mapeo_encabezado(huella: tuple) -> tuple:
+    """Mapeo compilado encabezado crudo -> estándar, cacheado por huella del encabezado."""
+    return tuple(_columna_estandar(c) for c in huella)
+
+
+def huella_encabezado(columnas) -> tuple:
+    return tuple(str(c) for c in columnas)
+
+
+def usar_columna(c) -> bool:
+    """
+    Para `usecols` de pd.read_excel: True solo si el encabezado crudo (SharePoint
+    o estándar) corresponde a una columna que la app usa.
+    """
+    return _columna_estandar(c) in COLUMNAS_APP
+
+
+def validar_esquema(df: pd.DataFrame) -> list:
+    """
+    Compara los tipos del historial (ya con nombres estándar) con ESQUEMA_HISTORIAL.
+    Retorna una lista de problemas legibles (vacía si todo calza).
+    """
+    problemas = []
+    df = df.loc[:, ~df.columns.duplicated()]
+    for col, tipo in ESQUEMA_HISTORIAL.items():
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if tipo == "fecha":
+            if pd.api.types.is_datetime64_any_dtype(serie):
+                continue
+            convertida = pd.to_datetime(serie, errors="coerce")
+        else:
+            if pd.api.types.is_numeric_dtype(serie):
+                continue
+            convertida = pd.to_numeric(serie, errors="coerce")
+        invalidos = serie[serie.notna() & convertida.isna()]
+        if len(invalidos):
+            ejemplos = ", ".join(map(str, invalidos.head(3).tolist()))
+            problemas.append(f"'{col}' ({tipo}): {len(invalidos)} valores inválidos (p. ej. {ejemplos})")
+    return problemas
+
+
+def problemas_esquema(columnas) -> list:
+    """Problemas registrados para este encabezado (None si aún no se validó)."""
+    return _ESQUEMAS_VALIDADOS.get(huella_encabezado(columnas))
+
+
+@trazado("adapter.historial")
+def adaptar_historial_sharepoint(df_raw: pd.DataFrame, copiar: bool = True) -> pd.DataFrame:
     """
     Convierte el DataFrame leído desde el Excel de SharePoint (historial_it_pei)
     a los nombres de columnas estándar que usa tu app (minúsculas con '_').
@@ -45,28 +169,15 @@ def adaptar_historial_sharepoint(df_raw: pd.DataFrame) -> pd.DataFrame:
     - Renombra según MAP_HIST_SP_TO_STD
     - Normaliza columnas a lower + underscores
     - Valida presencia de 'codigo'
-    """
-    df = df_raw.copy()
 
-    # A) Normalizar encabezados originales (SharePoint puede traer espacios extra)
-    def _norm_col(c: str) -> str:
-        c = str(c)
-        c = c.strip()
-        c = re.sub(r"\s+", " ", c)  # colapsa espacios múltiples
-        return c
-
-    df.columns = [_norm_col(c) for c in df.columns]
-
-    # B) Renombrar SharePoint -> estándar app
-    df = df.rename(columns=MAP_HIST_SP_TO_STD)
-
-    # C) Normalización final (convención interna)
-    df.columns = (
-        df.columns.astype(str)
-        .str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-    )
+    El mapeo de encabezados se compila una vez por huella del encabezado crudo
+    y se reutiliza en las siguientes cargas. Con `copiar=False` solo se
+    reetiquetan las columnas de `df_raw` (sin copiar datos): usarlo cuando el
+    DataFrame crudo no se vuelve a usar.
+    """
+    huella = huella_encabezado(df_raw.columns)
+    df = df_raw.copy() if copiar else df_raw
+    df.columns = list(_mapeo_encabezado(huella))
 
     # D) Validación mínima
     if "codigo" not in df.columns:
@@ -75,4 +186,12 @@ def adaptar_historial_sharepoint(df_raw: pd.DataFrame) -> pd.DataFrame:
             "(debe venir de 'Id_UE')."
         )
 
+    # E) Validación de tipos: solo la primera vez que aparece este encabezado
+    if huella not in _ESQUEMAS_VALIDADOS:
+        problemas = validar_esquema(df)
+        with _LOCK_ESQUEMAS:
+            _ESQUEMAS_VALIDADOS[huella] = problemas
+        if problemas:
+            warnings.warn("Historial SharePoint con tipos inesperados: " + "; ".join(problemas))
+
     return df
@@ -1,72 +1,97 @@
-import re
 import streamlit as st
 import pandas as pd
 import os
-import base64
 from datetime import datetime
-from textwrap import dedent
 
-from adapters.historial_sharepoint import adaptar_historial_sharepoint
-#from supabase import create_client
-
-def guardar_en_historial_excel(nuevo: dict, path: str):
-    """
-    Guarda un nuevo registro en el Excel historial_it_pei.xlsx
-    - Si el archivo no existe, lo crea
-    - Si existe, agrega una nueva fila
-    """
-
-    # Normalización robusta del código
-    def normalizar_codigo(x):
-        if pd.isna(x) or x is None:
-            return ""
-        try:
-            return str(int(float(x)))   # 23.0 -> "23"
-        except Exception:
-            return str(x).strip()
-
-    # 1) Dict -> DataFrame (1 fila)
-    df_nuevo = pd.DataFrame([nuevo])
+from core.config import (
+    HISTORIAL_BACKEND,
+    HISTORIAL_GUARDADO,
+    HISTORIAL_RUTA_ACTIVA,
+    HISTORIAL_SYNC_CADA_S,
+    HISTORIAL_SYNC_ESTADO_PATH,
+    HISTORIAL_SYNC_FUENTE,
+    MAX_RESULTADOS_BUSQUEDA,
+    TAMANO_PAGINA_HISTORIAL,
+    TRAZAS_ARCHIVO,
+)
+from core.formulario import (
+    ESTADO_OPCIONES,
+    ETAPAS_OPCIONES,
+    FORM_DEFAULTS,
+    TIPO_PEI_OPCIONES,
+    VIGENCIA_OPCIONES,
+    construir_registro,
+    fila_a_formulario,
+    index_of,
+    opciones_articulacion,
+)
+from core.recursos import (
+    crear_historial_de_sesion,
+    encabezado_html,
+    obtener_historial_store,
+    obtener_indice_busqueda,
+    obtener_indice_unidades,
+    version_unidades,
+)
+from core.trazas import (
+    activas as trazas_activas,
+    exportar_metricas,
+    iniciar_ejecucion,
+    resumen,
+    tramo,
+    tramos_de_ejecucion,
+)
+from storage.historial_store import COLUMNAS_ORDEN, a_fecha
+from storage.sync_sharepoint import crear_fuente, sincronizar_historial
+from storage.validacion import faltantes_para_emitir, periodo_valido
 
-    # 2) Asegurar columna normalizada
-    df_nuevo["codigo_ue_norm"] = df_nuevo["codigo"].apply(normalizar_codigo)
+# =====================================
+# ✅ PARTE INTEGRADA
+# =====================================
+# La lógica de dominio (configuración, formulario, almacenamiento, índices) vive en core/
+# y storage/; los recursos se crean una vez por proceso. Aquí solo queda la UI.
+iniciar_ejecucion()
 
-    # 3) Crear archivo si no existe
-    if not os.path.exists(path):
-        df_nuevo.to_excel(path, index=False, engine="openpyxl")
+def mostrar_panel_tiempos():
+    if not trazas_activas():
         return
+    metricas = resumen()
+    with st.sidebar.expander("⏱️ Tiempos (admin)", expanded=False):
+        ejecucion = tramos_de_ejecucion()
+        if ejecucion:
+            st.caption("Este rerun")
+            st.dataframe(
+                pd.DataFrame([{"tramo": n, "ms": round(seg * 1000, 2)} for n, seg in ejecucion]),
+                hide_index=True,
+            )
+        if metricas["tramos"]:
+            st.caption("Acumulado del proceso (p50 / p95)")
+            st.dataframe(pd.DataFrame.from_dict(metricas["tramos"], orient="index").round(2))
+        if metricas["caches"]:
+            st.caption("Cachés")
+            st.dataframe(pd.DataFrame.from_dict(metricas["caches"], orient="index"))
+    if TRAZAS_ARCHIVO:
+        exportar_metricas(TRAZAS_ARCHIVO)
+
+def detener():
+    # st.stop() mostrando antes el panel de tiempos (si está activo)
+    mostrar_panel_tiempos()
+    st.stop()
 
-    # 4) Leer historial existente
-    df_hist = pd.read_excel(path, engine="openpyxl")
-    df_hist.columns = df_hist.columns.astype(str).str.strip()
-
-    # 5) Concatenar y sobrescribir
-    df_final = pd.concat([df_hist, df_nuevo], ignore_index=True, sort=False)
-    df_final.to_excel(path, index=False, engine="openpyxl")
-
+@st.cache_data(ttl=HISTORIAL_SYNC_CADA_S, show_spinner=False)
+def sincronizar_con_sharepoint():
+    # Como máximo una sincronización cada HISTORIAL_SYNC_CADA_S segundos para todo el proceso
+    return sincronizar_historial(
+        obtener_historial_store(),
+        crear_fuente(HISTORIAL_SYNC_FUENTE),
+        HISTORIAL_SYNC_ESTADO_PATH,
+    )
 
-# =====================================
-# ✅ PARTE INTEGRADA
-# =====================================
-HISTORIAL_PATH = "data/historial_it_pei.xlsx"
-
-FORM_DEFAULTS = {
-    "tipo_pei": "Formulado",
-    "etapa_revision": "IT Emitido",
-    "fecha_recepcion": None,
-    "articulacion": "",
-    "fecha_derivacion": None,
-    "periodo": "",
-    "cantidad_revisiones": 0,
-    "comentario": "",
-    "vigencia": "Sí",
-    "estado": "En proceso",
-    "expediente": "",
-    "fecha_it": None,
-    "fecha_oficio": None,
-    "numero_it": "",
-    "numero_oficio": "",
-}
+def historial_de_sesion():
+    # Store del proceso + caché de precarga propia de esta sesión
+    if "historial_sesion" not in st.session_state:
+        st.session_state["historial_sesion"] = crear_historial_de_sesion()
+    return st.session_state["historial_sesion"]
 
 FORM_STATE_KEY = "pei_form_data"
 
@@ -76,164 +101,28 @@ def init_form_state():
 def reset_form_state():
     st.session_state[FORM_STATE_KEY] = FORM_DEFAULTS.copy()
 
-def index_of(options, value, fallback=0):
-    try:
-        return options.index(value)
-    except Exception:
-        return fallback
-
 def set_form_state_from_row(row: pd.Series):
-    form = FORM_DEFAULTS.copy()
-
-    def _safe_str(x):
-        return "" if pd.isna(x) else str(x).strip()
-
-    def _safe_int(x):
-        try:
-            return int(x)
-        except Exception:
-            return 0
-
-    def _safe_date(x):
-        if pd.isna(x) or x is None or str(x).strip() == "":
-            return None
-        try:
-            return pd.to_datetime(x).date()
-        except Exception:
-            return None
-
-    # Normalizador tolerante para valores de selectbox (mayúsculas, espacios, guiones bajos)
-    def norm_choice(val, mapping: dict, default: str):
-        s = _safe_str(val).lower()
-        s = re.sub(r"\s+", " ", s)      # colapsa espacios múltiples
-        s = s.replace("_", " ").strip() # "en_proceso" -> "en proceso"
-        return mapping.get(s, default)
-
-    # Mapeos a los valores EXACTOS que usa tu formulario
-    estado_map = {
-        "emitido": "Emitido",
-        "en proceso": "En proceso",
-        "proceso": "En proceso",
-    }
-
-    vigencia_map = {
-        "sí": "Sí",
-        "si": "Sí",
-        "no": "No",
-    }
-
-    tipo_pei_map = {
-        "formulado": "Formulado",
-        "ampliado": "Ampliado",
-        "actualizado": "Actualizado",
-    }
-
-    etapa_map = {
-        "it emitido": "IT Emitido",
-        "para emisión de it": "Para emisión de IT",
-        "para emision de it": "Para emisión de IT",
-        "revisión dncp": "Revisión DNCP",
-        "revision dncp": "Revisión DNCP",
-        "revisión dnse": "Revisión DNSE",
-        "revision dnse": "Revisión DNSE",
-        "revisión dnpe": "Revisión DNPE",
-        "revision dnpe": "Revisión DNPE",
-        "subsanación del pliego": "Subsanación del pliego",
-        "subsanacion del pliego": "Subsanación del pliego",
-    }
-
-    # --- CARGA NORMALIZADA ---
-    form["tipo_pei"] = norm_choice(
-        row.get("tipo_pei", FORM_DEFAULTS["tipo_pei"]),
-        tipo_pei_map,
-        FORM_DEFAULTS["tipo_pei"]
-    )
-
-    form["etapa_revision"] = norm_choice(
-        row.get("etapa_revision", FORM_DEFAULTS["etapa_revision"]),
-        etapa_map,
-        FORM_DEFAULTS["etapa_revision"]
-    )
-
-    form["fecha_recepcion"] = _safe_date(row.get("fecha_recepcion"))
-    form["articulacion"] = _safe_str(row.get("articulacion", ""))
-    form["fecha_derivacion"] = _safe_date(row.get("fecha_derivacion"))
-    form["periodo"] = _safe_str(row.get("periodo", ""))
-    form["cantidad_revisiones"] = _safe_int(row.get("cantidad_revisiones", 0))
-    form["comentario"] = _safe_str(row.get("comentario", ""))
-
-    form["vigencia"] = norm_choice(
-        row.get("vigencia", FORM_DEFAULTS["vigencia"]),
-        vigencia_map,
-        FORM_DEFAULTS["vigencia"]
-    )
-
-    # ESTE ES EL CAMBIO CLAVE PARA TU BUG:
-    form["estado"] = norm_choice(
-        row.get("estado", FORM_DEFAULTS["estado"]),
-        estado_map,
-        FORM_DEFAULTS["estado"]
-    )
+    st.session_state[FORM_STATE_KEY] = fila_a_formulario(row)
 
-    form["expediente"] = _safe_str(row.get("expediente", ""))
-    form["fecha_it"] = _safe_date(row.get("fecha_it"))
-    form["numero_it"] = _safe_str(row.get("numero_it", ""))
-    form["fecha_oficio"] = _safe_date(row.get("fecha_oficio"))
-    form["numero_oficio"] = _safe_str(row.get("numero_oficio", ""))
-
-    st.session_state[FORM_STATE_KEY] = form
-
-
-# =====================================
-# 🏛️ Carga y búsqueda de unidades ejecutoras
-# =====================================
-@st.cache_data
-def cargar_unidades_ejecutoras():
-    return pd.read_excel("data/unidades_ejecutoras.xlsx", engine="openpyxl")
-
-df_ue = cargar_unidades_ejecutoras()
-df_ue["codigo"] = df_ue["codigo"].astype(str).str.strip()
-df_ue["NG"] = df_ue["NG"].astype(str).str.strip()
 
 # ================================
 # 1) Validar y preparar responsables
 # ================================
-if "Responsable_Institucional" not in df_ue.columns:
-    st.error("❌ Falta la columna 'Responsable_Institucional' en unidades_ejecutoras.xlsx")
-    st.stop()
-
-df_ue["Responsable_Institucional"] = (
-    df_ue["Responsable_Institucional"]
-    .fillna("")
-    .astype(str)
-    .str.strip()
-)
+try:
+    with tramo("ue.indice"):
+        indice_ue = obtener_indice_unidades(version_unidades())
+except ValueError as e:
+    st.error(f"❌ {e}")
+    detener()
 
-responsables = sorted([r for r in df_ue["Responsable_Institucional"].unique() if r])
+responsables = indice_ue.responsables
 
 # st.image("logo.png", width=160)
 #"st.title("Registro de IT del Plan Estratégico Institucional (PEI)")
 
-def get_image_base64(path):
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
-
-def render_header():
-    logo_base64 = get_image_base64("logo.png")
-
-    html = f"""
-<div style="display:flex; align-items:center; gap:16px; margin-top:-10px; padding:6px 0;">
-  <img src="data:image/png;base64,{logo_base64}" width="140" style="display:block;">
-  <h1 style="margin:0; font-size:2.1rem; font-weight:600; line-height:1.2;">
-    Registro de IT del Plan Estratégico Institucional (PEI)
-  </h1>
-</div>
-"""
-
-    st.markdown(dedent(html), unsafe_allow_html=True)
-
-
-render_header()
+# Logo en base64 y HTML del encabezado: se arman una vez por proceso (core.recursos)
+with tramo("render.encabezado"):
+    st.markdown(encabezado_html(), unsafe_allow_html=True)
 
 #st.markdown("<h1 style='color:red'>PRUEBA</h1>", unsafe_allow_html=True)
 
@@ -263,6 +152,62 @@ st.markdown(
 )
 
 
+# ================================
+# Tablero (supervisión): responde desde el cubo de agregados, sin recorrer el historial
+# ================================
+DIMENSIONES_TABLERO = {
+    "Responsable": "responsable",
+    "Sector": "sector",
+    "Nivel de gobierno": "NG",
+    "Estado": "estado",
+    "Etapa de revisión": "etapa_revision",
+    "Año": "año",
+}
+
+def render_tablero():
+    st.subheader("📊 Tablero de IT PEI")
+    store = obtener_historial_store()
+    with tramo("tablero.cubo"):
+        cubo = store.cubo()
+
+    filtros = {}
+    columnas_filtro = st.columns(3)
+    for i, (etiqueta, dimension) in enumerate(DIMENSIONES_TABLERO.items()):
+        valores = sorted(v for v in cubo[dimension].unique() if v)
+        with columnas_filtro[i % 3]:
+            filtros[dimension] = st.multiselect(etiqueta, valores, key=f"tablero_{dimension}")
+
+    etiquetas_por = st.multiselect(
+        "Agrupar por",
+        list(DIMENSIONES_TABLERO),
+        default=["Estado"],
+        key="tablero_por",
+    )
+    por = [DIMENSIONES_TABLERO[e] for e in etiquetas_por]
+
+    with tramo("tablero.consulta"):
+        total = store.consultar(filtros, por=[])
+        detalle = store.consultar(filtros, por=por)
+
+    fila = total.iloc[0] if not total.empty else None
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Registros IT", int(fila["registros"]) if fila is not None else 0)
+    c2.metric("Con plazo calculable", int(fila["con_plazo"]) if fila is not None else 0)
+    promedio = fila["plazo_promedio_dias"] if fila is not None else None
+    c3.metric(
+        "Plazo promedio recepción → IT (días)",
+        "-" if promedio is None or pd.isna(promedio) else f"{promedio:.1f}",
+    )
+
+    st.dataframe(detalle, use_container_width=True, hide_index=True)
+    if len(por) == 1 and not detalle.empty:
+        st.bar_chart(detalle.set_index(por[0])["registros"])
+
+vista = st.sidebar.radio("Vista", ["📝 Registro", "📊 Tablero"], key="vista")
+if vista == "📊 Tablero":
+    render_tablero()
+    detener()
+
 # ================================
 # 2) Filtro 1: Responsable Institucional
 # ================================
@@ -277,24 +222,42 @@ resp_sel = st.selectbox(
 
 if not resp_sel:
     st.info("Selecciona un responsable para habilitar la búsqueda de Unidades Ejecutoras.")
-    st.stop()
+    detener()
 
 # ================================
-# 3) Filtrar df_ue por responsable + Filtro 2: UE (código o nombre)
+# 3) UEs del responsable + Filtro 2: UE (código o nombre)
 # ================================
-df_ue_filtrado = df_ue[df_ue["Responsable_Institucional"] == resp_sel].copy()
+# Opciones combinadas "codigo - nombre" ya precalculadas (solo del responsable)
+opciones = indice_ue.opciones_por_responsable.get(resp_sel, [])
 
-st.caption(f"Unidades ejecutoras asignadas: {len(df_ue_filtrado)}")
+st.caption(f"Unidades ejecutoras asignadas: {len(opciones)}")
 
-if df_ue_filtrado.empty:
+if not opciones:
     st.warning("No hay unidades ejecutoras asociadas a este responsable.")
-    st.stop()
+    detener()
 
-# Crear opciones combinadas para búsqueda (solo del filtrado)
-opciones = [
-    f"{str(row['codigo']).strip()} - {str(row['nombre']).strip()}"
-    for _, row in df_ue_filtrado.iterrows()
-]
+# Precarga en segundo plano del historial de sus pliegos: los siguientes clics en
+# "📂 Historial PEI" se resuelven desde la caché de la sesión
+with tramo("historial.precarga_envio"):
+    historial_de_sesion().precargar(indice_ue.codigos_por_responsable.get(resp_sel, []))
+
+# Búsqueda en el servidor (índice de trigramas): solo viajan al navegador los mejores resultados
+busqueda = st.text_input(
+    "🔎 Buscar pliego por código o nombre (tolera tildes y errores de tipeo)",
+    placeholder="Ej.: 1314, educación, municipalidad tamburco..."
+)
+buscar_en_todas = st.checkbox("Buscar en todas las unidades ejecutoras", value=False)
+
+if busqueda.strip():
+    with tramo("ue.busqueda"):
+        resultados = obtener_indice_busqueda(version_unidades()).buscar(
+            busqueda,
+            k=MAX_RESULTADOS_BUSQUEDA,
+            codigos=None if buscar_en_todas else indice_ue.codigos_por_responsable.get(resp_sel, []),
+        )
+    opciones = [f"{cod} - {nom}" for cod, nom, _ in resultados]
+    if not opciones:
+        st.info("No se encontraron pliegos para esa búsqueda.")
 
 seleccion = st.selectbox(
     "Escriba o seleccione el código o nombre del pliego",
@@ -307,15 +270,15 @@ seleccion = st.selectbox(
 # Opciones
 # ================================
 if seleccion:
-    codigo = seleccion.split(" - ")[0].strip()
-
-    # 4) Ajuste: usar df_ue_filtrado en vez de df_ue
-    fila = df_ue_filtrado[df_ue_filtrado["codigo"] == codigo]
+    codigo = indice_ue.opcion_a_codigo[seleccion]
+    info_ue = indice_ue.info_por_codigo.get(codigo)
+    # Responsable asignado a la UE (vacío si el maestro no lo registra)
+    responsable_ue = info_ue["responsable"] if info_ue and info_ue["responsable"] not in ("", "nan") else ""
 
-    if not fila.empty:
-        sector = fila["sector"].iloc[0] if "sector" in fila.columns else ""
-        nivel_gob = fila["NG"].iloc[0]
-        responsable = fila["Responsable_Institucional"].iloc[0] if "Responsable_Institucional" in fila.columns else "No registrado"
+    if info_ue:
+        sector = info_ue["sector"]
+        nivel_gob = info_ue["NG"]
+        responsable = info_ue["responsable"] or "No registrado"
 
         st.markdown(
             f"""
@@ -335,6 +298,11 @@ if seleccion:
             """,
             unsafe_allow_html=True
         )
+        if responsable_ue and responsable_ue != resp_sel:
+            st.warning(
+                f"Esta unidad ejecutora está asignada a {responsable_ue}; "
+                "el registro se guardará a su nombre."
+            )
 
 
     col1, col2 = st.columns(2)
@@ -353,63 +321,69 @@ if seleccion:
 # Procesamiento según opción
 # ================================
 if "modo" in st.session_state and seleccion:
-    codigo = seleccion.split(" - ")[0].strip()
+    codigo = indice_ue.opcion_a_codigo[seleccion]
 
     # ================================
     # MODO: HISTORIAL
     # ================================
     if st.session_state["modo"] == "historial":
-        try:
-            # 1) Lee el Excel (hoy local, mañana SharePoint)
-            historial_raw = pd.read_excel(HISTORIAL_PATH, engine="openpyxl")
-
-            # 2) ✅ Adapter SharePoint -> estándar interno
-            historial = adaptar_historial_sharepoint(historial_raw)
-
-            # 3) Validación de columna clave
-            if "codigo" not in historial.columns:
-                st.error("❌ El historial no tiene la columna clave 'codigo'. Revisa el Excel de SharePoint.")
-                st.write("Columnas detectadas:", historial.columns.tolist())
-                st.stop()
-
-            # 4) Normalización de clave (igual que ya tenías)
-            def normalizar_codigo(x):
-                if pd.isna(x):
-                    return ""
-                try:
-                    return str(int(float(x)))
-                except Exception:
-                    return str(x).strip()
+        if HISTORIAL_SYNC_FUENTE:
+            try:
+                with tramo("historial.sync"):
+                    sincronizar_con_sharepoint()
+            except Exception as e:
+                st.warning(f"⚠️ No se pudo sincronizar con SharePoint (se muestra el historial local): {e}")
+
+        store = historial_de_sesion()
+        # Paginación en el store (LIMIT/OFFSET en los backends SQL): solo viajan las filas visibles
+        clave_limite = f"historial_limite_{codigo}"
+        limite = st.session_state.setdefault(clave_limite, TAMANO_PAGINA_HISTORIAL)
+
+        colo, cold = st.columns([2, 1])
+        with colo:
+            ordenar_por = st.selectbox(
+                "Ordenar por", COLUMNAS_ORDEN,
+                format_func=lambda c: {"fecha_recepcion": "Fecha de recepción", "fecha_it": "Fecha del IT"}[c],
+            )
+        with cold:
+            descendente = st.radio("Orden", ["Más recientes", "Más antiguos"], horizontal=True) == "Más recientes"
 
-            historial["codigo_ue_norm"] = historial["codigo"].apply(normalizar_codigo)
+        try:
+            with tramo("historial.contar"):
+                total = store.contar_por_codigo(codigo)
+            with tramo("historial.pagina"):
+                df_historial = store.pagina_por_codigo(
+                    codigo, limite=limite, ordenar_por=ordenar_por, descendente=descendente
+                )
 
         except FileNotFoundError:
-            st.error(f"No se encontró el archivo: {HISTORIAL_PATH}")
-            st.stop()
+            st.error(f"No se encontró el archivo: {HISTORIAL_RUTA_ACTIVA}")
+            detener()
         except Exception as e:
             st.error(f"Error al leer el historial: {e}")
-            st.stop()
-
-        codigo_norm = normalizar_codigo(codigo)
-
-        df_historial = historial[historial["codigo_ue_norm"] == codigo_norm].copy()
+            detener()
 
-        st.write("Filas encontradas para este pliego:", len(df_historial))
+        st.write("Filas encontradas para este pliego:", total)
 
-        if df_historial.empty:
+        if total == 0:
             st.info("No existe historial para este pliego (según la clave de comparación).")
         else:
-            if "fecha_recepcion" in df_historial.columns:
-                df_historial["fecha_recepcion"] = pd.to_datetime(
-                    df_historial["fecha_recepcion"], errors="coerce"
-                )
+            with tramo("render.historial"):
+                for col in COLUMNAS_ORDEN:
+                    if col in df_historial.columns:
+                        df_historial[col] = a_fecha(df_historial[col])
+
+                st.dataframe(df_historial, use_container_width=True, hide_index=True)
+                st.caption(f"Mostrando {len(df_historial)} de {total}")
 
-            st.dataframe(df_historial.tail(5), use_container_width=True, hide_index=True)
+            if len(df_historial) < total:
+                if st.button("⬇️ Cargar más"):
+                    st.session_state[clave_limite] = limite + TAMANO_PAGINA_HISTORIAL
+                    st.rerun()
 
-            if "fecha_recepcion" in df_historial.columns:
-                ultimo = df_historial.sort_values("fecha_recepcion", ascending=False).iloc[0]
-            else:
-                ultimo = df_historial.iloc[-1]
+            # El último registro (por fecha_recepcion) no depende del orden elegido en la tabla
+            with tramo("historial.ultimo"):
+                ultimo = store.ultimo_registro(codigo)
 
             st.success("Último registro encontrado.")
 
@@ -441,25 +415,16 @@ if "modo" in st.session_state and seleccion:
                 year_now = datetime.now().year
                 año = st.text_input("Año", value=str(year_now), disabled=True)
 
-                tipo_pei_opts = ["Formulado", "Ampliado", "Actualizado"]
                 tipo_pei = st.selectbox(
                     "Tipo de PEI",
-                    tipo_pei_opts,
-                    index=index_of(tipo_pei_opts, form["tipo_pei"], 0)
+                    TIPO_PEI_OPCIONES,
+                    index=index_of(TIPO_PEI_OPCIONES, form["tipo_pei"], 0)
                 )
 
-                etapas_opts = [
-                    "IT Emitido",
-                    "Para emisión de IT",
-                    "Revisión DNCP",
-                    "Revisión DNSE",
-                    "Revisión DNPE",
-                    "Subsanación del pliego"
-                ]
                 etapa_revision = st.selectbox(
                     "Etapas de revisión",
-                    etapas_opts,
-                    index=index_of(etapas_opts, form["etapa_revision"], 0)
+                    ETAPAS_OPCIONES,
+                    index=index_of(ETAPAS_OPCIONES, form["etapa_revision"], 0)
                 )
 
             with col2:
@@ -468,22 +433,13 @@ if "modo" in st.session_state and seleccion:
                     value=form["fecha_recepcion"] if form["fecha_recepcion"] else datetime.now().date()
                 )
 
-                # 4) Ajuste: nivel desde df_ue_filtrado
-                nivel = df_ue_filtrado.loc[df_ue_filtrado["codigo"] == codigo, "NG"].values[0]
-
-                if nivel == "Gobierno regional":
-                    opciones_articulacion = ["PEDN 2050", "PDRC"]
-                elif nivel == "Gobierno nacional":
-                    opciones_articulacion = ["PEDN 2050", "PESEM NO vigente", "PESEM vigente"]
-                elif nivel in ["Municipalidad distrital", "Municipalidad provincial"]:
-                    opciones_articulacion = ["PEDN 2050", "PDRC", "PDLC Provincial", "PDLC Distrital"]
-                else:
-                    opciones_articulacion = []
+                # Nivel de gobierno desde el índice precalculado
+                articulacion_opts = opciones_articulacion(info_ue["NG"])
 
                 articulacion = st.selectbox(
                     "Articulación",
-                    opciones_articulacion,
-                    index=index_of(opciones_articulacion, form["articulacion"], 0) if opciones_articulacion else 0
+                    articulacion_opts,
+                    index=index_of(articulacion_opts, form["articulacion"], 0) if articulacion_opts else 0
                 )
 
                 fecha_derivacion = st.date_input(
@@ -497,8 +453,7 @@ if "modo" in st.session_state and seleccion:
                     value=form["periodo"]
                 )
 
-                pattern = r"^\d{4}-\d{4}$"
-                if periodo and not re.match(pattern, periodo):
+                if not periodo_valido(periodo):
                     st.error("⚠️ Formato inválido. Usa el formato: 2025-2027")
 
                 cantidad_revisiones = st.number_input(
@@ -515,18 +470,16 @@ if "modo" in st.session_state and seleccion:
                 )
 
             with col4:
-                vigencia_opts = ["Sí", "No"]
                 vigencia = st.selectbox(
                     "Vigencia",
-                    vigencia_opts,
-                    index=index_of(vigencia_opts, form["vigencia"], 0)
+                    VIGENCIA_OPCIONES,
+                    index=index_of(VIGENCIA_OPCIONES, form["vigencia"], 0)
                 )
 
-                estado_opts = ["En proceso", "Emitido"]
                 estado = st.selectbox(
                     "Estado",
-                    estado_opts,
-                    index=index_of(estado_opts, form["estado"], 0)
+                    ESTADO_OPCIONES,
+                    index=index_of(ESTADO_OPCIONES, form["estado"], 0)
                 )
 
             st.write("## Datos del Informe Técnico")
@@ -550,10 +503,9 @@ if "modo" in st.session_state and seleccion:
                 numero_it = st.text_input("Número de I.T", value=form["numero_it"])
                 numero_oficio = st.text_input("Número del Oficio", value=form["numero_oficio"])
 
-            expediente_ok = bool(str(expediente).strip())
-            fecha_it_ok = fecha_it is not None
-            numero_it_ok = bool(str(numero_it).strip())
-            puede_emitir = expediente_ok and fecha_it_ok and numero_it_ok
+            puede_emitir = not faltantes_para_emitir(
+                {"expediente": expediente, "fecha_it": fecha_it, "numero_it": numero_it}
+            )
 
             if estado == "Emitido" and not puede_emitir:
                 st.caption(
@@ -566,49 +518,59 @@ if "modo" in st.session_state and seleccion:
             if submitted:
                 if estado == "Emitido" and not puede_emitir:
                     st.error("❌ No se puede guardar como 'Emitido'. Completa Expediente (SGD), Fecha de I.T y Número de I.T.")
-                    st.stop()
-
-                nombre_ue = seleccion.split(" - ")[1].strip()
-
-                # responsable ya viene del bloque de tarjeta, pero por seguridad:
-                responsable_actual = resp_sel
-
-                nuevo = {
-                    "codigo": codigo,
-                    "nombre": nombre_ue,
-                    "año": año,
-                    "periodo": periodo,
-                    "vigencia": vigencia,
-                    "tipo_pei": tipo_pei,
-                    "estado": estado,
-                    "responsable_institucional": responsable_actual,
-                    "cantidad_revisiones": cantidad_revisiones,
-                    "fecha_recepcion": str(fecha_recepcion),
-                    "fecha_derivacion": str(fecha_derivacion),
-                    "etapa_revision": etapa_revision,
-                    "comentario": comentario,
-                    "articulacion": articulacion,
-                    "expediente": expediente,
-                    "fecha_it": str(fecha_it),
-                    "numero_it": numero_it,
-                    "fecha_oficio": str(fecha_oficio),
-                    "numero_oficio": numero_oficio
-                }
+                    detener()
+
+                nombre_ue = info_ue["nombre"]
+
+                # El responsable es el de la UE elegida (con "Buscar en todas" puede no ser resp_sel)
+                responsable_actual = responsable_ue or resp_sel
+
+                nuevo = construir_registro(
+                    codigo=codigo,
+                    nombre=nombre_ue,
+                    año=año,
+                    periodo=periodo,
+                    vigencia=vigencia,
+                    tipo_pei=tipo_pei,
+                    estado=estado,
+                    responsable_institucional=responsable_actual,
+                    cantidad_revisiones=cantidad_revisiones,
+                    fecha_recepcion=fecha_recepcion,
+                    fecha_derivacion=fecha_derivacion,
+                    etapa_revision=etapa_revision,
+                    comentario=comentario,
+                    articulacion=articulacion,
+                    expediente=expediente,
+                    fecha_it=fecha_it,
+                    numero_it=numero_it,
+                    fecha_oficio=fecha_oficio,
+                    numero_oficio=numero_oficio,
+                )
 
                 try:
-                    guardar_en_historial_excel(nuevo, HISTORIAL_PATH)
-                    st.success("✅ Registro guardado en el historial.")
+                    with tramo("historial.guardar"):
+                        if HISTORIAL_GUARDADO == "upsert":
+                            reemplazado = historial_de_sesion().agregar_o_reemplazar(nuevo)
+                        else:
+                            historial_de_sesion().agregar(nuevo)
+                            reemplazado = False
+                    if reemplazado:
+                        st.success("✅ Registro actualizado (ya existía uno con el mismo expediente, N° de IT y fecha de recepción).")
+                    else:
+                        st.success("✅ Registro guardado en el historial.")
                     st.session_state["modo"] = "historial"
                     st.rerun()
                 except Exception as e:
-                    st.error(f"❌ Error al guardar en el Excel: {e}")
+                    st.error(f"❌ Error al guardar en el historial: {e}")
 
-                st.write("📄 HISTORIAL_PATH:", HISTORIAL_PATH)
-                st.write("📍 Ruta absoluta:", os.path.abspath(HISTORIAL_PATH))
+                st.write(f"📄 Historial ({HISTORIAL_BACKEND}):", HISTORIAL_RUTA_ACTIVA)
+                st.write("📍 Ruta absoluta:", os.path.abspath(HISTORIAL_RUTA_ACTIVA))
 
-                if os.path.exists(HISTORIAL_PATH):
+                if os.path.exists(HISTORIAL_RUTA_ACTIVA):
                     st.write("✅ Existe en este entorno.")
-                    st.write("🕒 Última modificación (mtime):", datetime.fromtimestamp(os.path.getmtime(HISTORIAL_PATH)))
-                    st.write("📦 Tamaño (bytes):", os.path.getsize(HISTORIAL_PATH))
+                    st.write("🕒 Última modificación (mtime):", datetime.fromtimestamp(os.path.getmtime(HISTORIAL_RUTA_ACTIVA)))
+                    st.write("📦 Tamaño (bytes):", os.path.getsize(HISTORIAL_RUTA_ACTIVA))
                 else:
                     st.write("❌ No existe en este entorno.")
+
+mostrar_panel_tiempos()
@@ -0,0 +1,261 @@
+# ============================================
+# benchmarks/bench_historial.py
+# ============================================
+"""
+Benchmarks reproducibles de carga, adapter, búsqueda y guardado con datos sintéticos.
+
+    python -m benchmarks.bench_historial --filas 1000 10000 100000 --salida bench.json
+    python -m benchmarks.bench_historial --filas 1000000 --backends sqlite postgres
+
+Los libros sintéticos se generan una sola vez por (filas, semilla) en --datos.
+Resultados en JSON (tiempo mediano/mínimo y memoria pico por caso) para comparar versiones.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from adapters.historial_sharepoint import MAP_HIST_SP_TO_STD, adaptar_historial_sharepoint
+from core.formulario import fila_a_formulario
+from storage.espejo_columnar import sincronizar_espejo
+from storage.exportacion_excel import escribir_xlsx
+from storage.historial_postgres import PoolSQLite, PostgresHistorialStore
+from storage.historial_store import CacheHistorial, ExcelHistorialStore, SQLiteHistorialStore, preparar_historial
+from storage.lectura_streaming import buscar_codigo_streaming
+from storage.unidades_ejecutoras import (
+    construir_indice_unidades,
+    leer_unidades_ejecutoras,
+    preparar_unidades_ejecutoras,
+)
+
+BACKENDS = ("excel", "sqlite", "postgres")
+
+_NG = ["Gobierno nacional", "Gobierno regional", "Municipalidad provincial", "Municipalidad distrital"]
+_SECTORES = [f"SECTOR {i:02d}" for i in range(30)]
+_ESTADOS = ["EMITIDO", "EN PROCESO"]
+_TIPOS = ["FORMULADO", "AMPLIADO", "ACTUALIZADO"]
+_ETAPAS = ["IT Emitido", "Para emisión de IT", "Revisión DNCP", "Revisión DNSE", "Revisión DNPE"]
+
+
+# =====================================
+# Datos sintéticos
+# =====================================
+def generar_unidades(filas: int, semilla: int = 0) -> pd.DataFrame:
+    """unidades_ejecutoras con el mismo esquema que el maestro real."""
+    rng = np.random.default_rng(semilla)
+    codigos = np.arange(1, filas + 1) * 7 + 10
+    responsables = [f"Responsable {i:03d}" for i in range(max(filas // 40, 1))]
+    return pd.DataFrame({
+        "codigo": codigos,
+        "nombre": [f"UNIDAD EJECUTORA {c} DE PRUEBA" for c in codigos],
+        "NG": rng.choice(_NG, filas),
+        "sector": rng.choice(_SECTORES, filas),
+        "Responsable_Institucional": rng.choice(responsables, filas),
+    })
+
+
+def generar_historial(filas: int, codigos, semilla: int = 0) -> pd.DataFrame:
+    """historial_it_pei con encabezados de SharePoint (entrada de adaptar_historial_sharepoint)."""
+    rng = np.random.default_rng(semilla + 1)
+    recepcion = pd.Timestamp("2016-01-01") + pd.to_timedelta(rng.integers(0, 3650, filas), unit="D")
+    anio = recepcion.year
+    encabezados = {std: sp for sp, std in MAP_HIST_SP_TO_STD.items()}
+    datos = {
+        "codigo": rng.choice(np.asarray(codigos, dtype=float), filas),
+        "año": anio.astype(float),
+        "periodo": [f"{a + 1}-{a + 3}" for a in anio],
+        "vigencia": rng.choice(["SI", "NO"], filas),
+        "tipo_pei": rng.choice(_TIPOS, filas),
+        "estado": rng.choice(_ESTADOS, filas, p=[0.85, 0.15]),
+        "responsable_institucional": rng.choice([f"Responsable {i:03d}" for i in range(50)], filas),
+        "cantidad_revisiones": rng.integers(0, 5, filas).astype(float),
+        "etapa_revision": rng.choice(_ETAPAS, filas),
+        "fecha_recepcion": recepcion,
+        "fecha_derivacion": recepcion + pd.to_timedelta(rng.integers(0, 20, filas), unit="D"),
+        "expediente": [f"{a}-{n:07d}" for a, n in zip(anio, rng.integers(0, 10**7, filas))],
+        "fecha_it": recepcion + pd.to_timedelta(rng.integers(5, 90, filas), unit="D"),
+        "numero_it": [f"{n:06d}-{a}-DNCPPEI" for a, n in zip(anio, rng.integers(0, 10**6, filas))],
+        "comentario": "",
+    }
+    df = pd.DataFrame({encabezados[c]: v for c, v in datos.items()})
+    df.insert(1, "nombre", [f"UNIDAD EJECUTORA {int(c)} DE PRUEBA" for c in datos["codigo"]])
+    return df
+
+
+def preparar_datos(directorio: str, filas: int, semilla: int) -> dict:
+    """Genera (o reutiliza) los libros sintéticos para `filas`."""
+    os.makedirs(directorio, exist_ok=True)
+    rutas = {
+        "unidades": os.path.join(directorio, f"unidades_ejecutoras_{filas}_{semilla}.xlsx"),
+        "historial": os.path.join(directorio, f"historial_it_pei_{filas}_{semilla}.xlsx"),
+    }
+    # Unidades: el maestro nacional no pasa de unas decenas de miles de filas
+    n_unidades = min(filas, 50_000)
+    df_ue = generar_unidades(n_unidades, semilla)
+    if not os.path.exists(rutas["unidades"]):
+        df_ue.to_excel(rutas["unidades"], index=False, engine="openpyxl")
+    if not os.path.exists(rutas["historial"]):
+        generar_historial(filas, df_ue["codigo"], semilla).to_excel(rutas["historial"], index=False, engine="openpyxl")
+    rutas["codigos"] = df_ue["codigo"].astype(str).tolist()
+    return rutas
+
+
+# =====================================
+# Medición
+# =====================================
+def medir(funcion, repeticiones: int = 3) -> dict:
+    """Tiempo mediano/mínimo de `funcion()` y memoria pico (tracemalloc) de una corrida extra."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "segundos_mediana": statistics.median(tiempos),
+        "segundos_min": min(tiempos),
+        "repeticiones": repeticiones,
+        "memoria_pico_mb": pico / 1e6,
+    }
+
+
+def _registro_nuevo(codigo: str) -> dict:
+    return {
+        "codigo": codigo, "nombre": "UNIDAD DE PRUEBA", "año": "2026", "periodo": "2026-2028",
+        "vigencia": "Sí", "tipo_pei": "Formulado", "estado": "En proceso",
+        "responsable_institucional": "Responsable 000", "cantidad_revisiones": 0,
+        "fecha_recepcion": "2026-01-15", "fecha_derivacion": "2026-01-16",
+        "etapa_revision": "Revisión DNCP", "comentario": "", "articulacion": "PEDN 2050",
+        "expediente": "", "fecha_it": "2026-01-20", "numero_it": "", "fecha_oficio": "2026-01-21",
+        "numero_oficio": "",
+    }
+
+
+def _crear_store(backend: str, trabajo: str, historial_xlsx: str):
+    """Store del backend con el historial sintético ya cargado."""
+    if backend == "excel":
+        destino = os.path.join(trabajo, "historial_excel.xlsx")
+        shutil.copyfile(historial_xlsx, destino)
+        return ExcelHistorialStore(destino, cache=CacheHistorial())
+    if backend == "sqlite":
+        return SQLiteHistorialStore(os.path.join(trabajo, "historial.sqlite"), seed_xlsx=historial_xlsx)
+    store = PostgresHistorialStore(PoolSQLite(os.path.join(trabajo, "historial_pg.sqlite")), dialecto="sqlite")
+    store.importar_excel(historial_xlsx)
+    return store
+
+
+def correr(filas: int, backends, repeticiones: int, directorio_datos: str, semilla: int = 0) -> list:
+    rutas = preparar_datos(directorio_datos, filas, semilla)
+    codigo = rutas["codigos"][len(rutas["codigos"]) // 2]
+    resultados = []
+
+    def agregar(caso, backend, medicion):
+        resultados.append({"caso": caso, "filas": filas, "backend": backend, **medicion})
+        memoria = medicion["memoria_pico_mb"]
+        print(f"{filas:>9} {backend or '-':<9} {caso:<28} {medicion['segundos_mediana']:.4f} s "
+              f"{'-' if memoria is None else f'{memoria:.1f}'} MB", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix="bench_it_pei_") as trabajo:
+        # ---------- unidades ejecutoras ----------
+        ue_xlsx = os.path.join(trabajo, "unidades_ejecutoras.xlsx")
+        shutil.copyfile(rutas["unidades"], ue_xlsx)
+        agregar("ue_carga_excel", None, medir(
+            lambda: preparar_unidades_ejecutoras(pd.read_excel(ue_xlsx, engine="openpyxl")), repeticiones))
+        sincronizar_espejo(ue_xlsx, preparar=preparar_unidades_ejecutoras)
+        agregar("ue_carga_espejo", None, medir(lambda: leer_unidades_ejecutoras(ue_xlsx), repeticiones))
+        df_ue = leer_unidades_ejecutoras(ue_xlsx)
+        agregar("ue_indice", None, medir(lambda: construir_indice_unidades(df_ue), repeticiones))
+
+        # ---------- adapter ----------
+        crudo = pd.read_excel(rutas["historial"], engine="openpyxl")
+        agregar("historial_lectura_excel", None, medir(
+            lambda: pd.read_excel(rutas["historial"], engine="openpyxl"), 1))
+        agregar("historial_adaptar", None, medir(lambda: adaptar_historial_sharepoint(crudo), repeticiones))
+        agregar("historial_preparar", None, medir(lambda: preparar_historial(crudo.copy()), repeticiones))
+        exportado = os.path.join(trabajo, "exportado.xlsx")
+        agregar("historial_exportar_to_excel", None, medir(
+            lambda: crudo.to_excel(exportado, index=False, engine="openpyxl"), 1))
+        agregar("historial_exportar_streaming", None, medir(lambda: escribir_xlsx(exportado, crudo), 1))
+        del crudo
+        agregar("historial_buscar_streaming", None, medir(
+            lambda: buscar_codigo_streaming(rutas["historial"], codigo), 1))
+
+        # ---------- backends ----------
+        for backend in backends:
+            inicio = time.perf_counter()
+            store = _crear_store(backend, trabajo, rutas["historial"])
+            segundos = time.perf_counter() - inicio
+            agregar("store_carga_inicial", backend, {
+                "segundos_mediana": segundos, "segundos_min": segundos, "repeticiones": 1, "memoria_pico_mb": None,
+            })
+            store.leer_todo()   # caché / espejo en caliente para el backend Excel
+            agregar("store_buscar_por_codigo", backend, medir(lambda: store.buscar_por_codigo(codigo), repeticiones))
+            agregar("store_ultimo_registro", backend, medir(lambda: store.ultimo_registro(codigo), repeticiones))
+            ultimo = store.ultimo_registro(codigo)
+            agregar("formulario_desde_fila", backend, medir(lambda: fila_a_formulario(ultimo), repeticiones))
+            agregar("store_agregar", backend, medir(lambda: store.agregar(_registro_nuevo(codigo)), repeticiones))
+
+    return resultados
+
+
+def _version_codigo() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_historial", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--datos", default=os.path.join(tempfile.gettempdir(), "bench_it_pei_datos"))
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto, stdout)")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    for filas in args.filas:
+        resultados.extend(correr(filas, args.backends, args.repeticiones, args.datos, args.semilla))
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version_codigo": _version_codigo(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "semilla": args.semilla,
+        "resultados": resultados,
+    }
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# ============================================
+# core/config.py
+# ============================================
+import os
+
+HISTORIAL_PATH = "data/historial_it_pei.xlsx"
+LOGO_PATH = "logo.png"
+
+# Backend del historial: "sqlite" (append-only, recomendado), "postgres" (Supabase),
+# "particionado" (Parquet por año/sector) o "excel" (legado)
+HISTORIAL_BACKEND = os.environ.get("HISTORIAL_BACKEND", "sqlite")
+HISTORIAL_DB_PATH = os.environ.get("HISTORIAL_DB_PATH", "data/historial_it_pei.sqlite")
+# Cadena de conexión Postgres (en Supabase: Project Settings -> Database -> Connection string)
+HISTORIAL_POSTGRES_DSN = os.environ.get("HISTORIAL_POSTGRES_DSN", "")
+# Backend particionado: directorio y dimensión de la UE además del año ("sector", "NG" o vacío)
+HISTORIAL_PARTICIONES_DIR = os.environ.get("HISTORIAL_PARTICIONES_DIR", "data/historial_particionado")
+HISTORIAL_PARTICION_UE = os.environ.get("HISTORIAL_PARTICION_UE", "sector")
+HISTORIAL_RUTA_ACTIVA = {
+    "sqlite": HISTORIAL_DB_PATH,
+    "particionado": HISTORIAL_PARTICIONES_DIR,
+    "postgres": "postgres (servidor)",
+}.get(HISTORIAL_BACKEND, HISTORIAL_PATH)
+
+# Guardado del formulario: "upsert" (reemplaza el registro con el mismo pliego, expediente,
+# N° de IT y fecha de recepción) o "agregar" (siempre agrega una fila, comportamiento anterior)
+HISTORIAL_GUARDADO = os.environ.get("HISTORIAL_GUARDADO", "upsert")
+
+# Escritura en lotes (picos de registro): journal durable + volcado en segundo plano.
+# Compatible con HISTORIAL_GUARDADO="upsert": el upsert se encola y se resuelve al volcar
+HISTORIAL_EN_LOTES = os.environ.get("HISTORIAL_EN_LOTES", "0") == "1"
+HISTORIAL_JOURNAL_PATH = os.environ.get("HISTORIAL_JOURNAL_PATH", "data/historial_journal.jsonl")
+
+# Sincronización incremental desde SharePoint (ruta local del export o URL); vacío = desactivada
+HISTORIAL_SYNC_FUENTE = os.environ.get("HISTORIAL_SYNC_FUENTE", "")
+HISTORIAL_SYNC_ESTADO_PATH = os.environ.get("HISTORIAL_SYNC_ESTADO_PATH", "data/historial_sync_estado.json")
+HISTORIAL_SYNC_CADA_S = int(os.environ.get("HISTORIAL_SYNC_CADA_S", "300"))
+
+# Plano de datos compartido entre workers (directorio de instantáneas Arrow); vacío = desactivado.
+# El escritor se ejecuta aparte: python -m storage.plano_compartido
+PLANO_COMPARTIDO_DIR = os.environ.get("IT_PEI_PLANO_COMPARTIDO", "")
+PLANO_COMPARTIDO_CADA_S = float(os.environ.get("IT_PEI_PLANO_COMPARTIDO_CADA_S", "30"))
+
+# Trazas por tramo (IT_PEI_TRAZAS=1): export JSON opcional del resumen
+TRAZAS_ARCHIVO = os.environ.get("IT_PEI_TRAZAS_ARCHIVO", "")
+
+MAX_RESULTADOS_BUSQUEDA = 25
+
+# Precarga del historial de los pliegos del responsable elegido (0 hilos = desactivada)
+PRECARGA_HILOS = int(os.environ.get("PRECARGA_HILOS", "4"))
+PRECARGA_MAX_PLIEGOS = int(os.environ.get("PRECARGA_MAX_PLIEGOS", "64"))   # por sesión
+PRECARGA_MAX_EDAD_S = float(os.environ.get("PRECARGA_MAX_EDAD_S", "120"))
+# Filas por página del historial de un pliego ("Cargar más" suma otra página)
+TAMANO_PAGINA_HISTORIAL = 5
+
+# Tablero: recálculo completo del cubo de agregados como máximo cada N segundos
+# (entre medio se actualiza en cada guardado de este proceso)
+AGREGADOS_MAX_EDAD_S = float(os.environ.get("AGREGADOS_MAX_EDAD_S", "300"))
@@ -0,0 +1,214 @@
+# ============================================
+# core/formulario.py
+# ============================================
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Opciones EXACTAS de los selectbox del formulario
+TIPO_PEI_OPCIONES = ["Formulado", "Ampliado", "Actualizado"]
+ETAPAS_OPCIONES = [
+    "IT Emitido",
+    "Para emisión de IT",
+    "Revisión DNCP",
+    "Revisión DNSE",
+    "Revisión DNPE",
+    "Subsanación del pliego",
+]
+VIGENCIA_OPCIONES = ["Sí", "No"]
+ESTADO_OPCIONES = ["En proceso", "Emitido"]
+
+# Articulación disponible según el nivel de gobierno de la UE
+ARTICULACION_POR_NIVEL = {
+    "Gobierno regional": ["PEDN 2050", "PDRC"],
+    "Gobierno nacional": ["PEDN 2050", "PESEM NO vigente", "PESEM vigente"],
+    "Municipalidad distrital": ["PEDN 2050", "PDRC", "PDLC Provincial", "PDLC Distrital"],
+    "Municipalidad provincial": ["PEDN 2050", "PDRC", "PDLC Provincial", "PDLC Distrital"],
+}
+
+FORM_DEFAULTS = {
+    "tipo_pei": "Formulado",
+    "etapa_revision": "IT Emitido",
+    "fecha_recepcion": None,
+    "articulacion": "",
+    "fecha_derivacion": None,
+    "periodo": "",
+    "cantidad_revisiones": 0,
+    "comentario": "",
+    "vigencia": "Sí",
+    "estado": "En proceso",
+    "expediente": "",
+    "fecha_it": None,
+    "fecha_oficio": None,
+    "numero_it": "",
+    "numero_oficio": "",
+}
+
+# Mapeos a los valores EXACTOS que usa el formulario (se construyen una sola vez)
+ESTADO_MAP = {
+    "emitido": "Emitido",
+    "en proceso": "En proceso",
+    "proceso": "En proceso",
+}
+
+VIGENCIA_MAP = {
+    "sí": "Sí",
+    "si": "Sí",
+    "no": "No",
+}
+
+TIPO_PEI_MAP = {
+    "formulado": "Formulado",
+    "ampliado": "Ampliado",
+    "actualizado": "Actualizado",
+}
+
+ETAPA_MAP = {
+    "it emitido": "IT Emitido",
+    "para emisión de it": "Para emisión de IT",
+    "para emision de it": "Para emisión de IT",
+    "revisión dncp": "Revisión DNCP",
+    "revision dncp": "Revisión DNCP",
+    "revisión dnse": "Revisión DNSE",
+    "revision dnse": "Revisión DNSE",
+    "revisión dnpe": "Revisión DNPE",
+    "revision dnpe": "Revisión DNPE",
+    "subsanación del pliego": "Subsanación del pliego",
+    "subsanacion del pliego": "Subsanación del pliego",
+}
+
+# Columnas (y su orden) del registro que guarda el formulario
+CAMPOS_REGISTRO = [
+    "codigo", "nombre", "año", "periodo", "vigencia", "tipo_pei", "estado",
+    "responsable_institucional", "cantidad_revisiones", "fecha_recepcion",
+    "fecha_derivacion", "etapa_revision", "comentario", "articulacion",
+    "expediente", "fecha_it", "numero_it", "fecha_oficio", "numero_oficio",
+]
+
+_RE_ESPACIOS = re.compile(r"[\s_]+")
+
+
+def plegar(texto) -> str:
+    """Clave de comparación: minúsculas, sin tildes ni puntos, espacios simples ('I.T emitido ' -> 'it emitido')."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower().replace(".", ""))
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    return _RE_ESPACIOS.sub(" ", texto).strip()
+
+
+# Columnas del historial con valores de un catálogo cerrado: opciones canónicas + sinónimos
+CATALOGOS = {
+    "estado": (ESTADO_OPCIONES, ESTADO_MAP),
+    "vigencia": (VIGENCIA_OPCIONES, VIGENCIA_MAP),
+    "tipo_pei": (TIPO_PEI_OPCIONES, TIPO_PEI_MAP),
+    "etapa_revision": (ETAPAS_OPCIONES, ETAPA_MAP),
+}
+
+# Tablas precompiladas: valor plegado -> valor canónico (una vez, al importar el módulo)
+_TABLAS_CANONICAS = {
+    col: {plegar(k): v for k, v in {**{o: o for o in opciones}, **mapa}.items()}
+    for col, (opciones, mapa) in CATALOGOS.items()
+}
+
+
+def index_of(options, value, fallback=0):
+    try:
+        return options.index(value)
+    except Exception:
+        return fallback
+
+
+def opciones_articulacion(nivel) -> list:
+    return ARTICULACION_POR_NIVEL.get(nivel, [])
+
+
+def _safe_str(x):
+    return "" if pd.isna(x) else str(x).strip()
+
+
+def _safe_int(x):
+    try:
+        return int(x)
+    except Exception:
+        return 0
+
+
+def _safe_date(x):
+    if pd.isna(x) or x is None or str(x).strip() == "":
+        return None
+    try:
+        return pd.to_datetime(x).date()
+    except Exception:
+        return None
+
+
+def canonizar_valor(val, columna: str, default: str):
+    """Valor suelto -> opción canónica de `columna` (tolera mayúsculas, tildes, espacios y '_')."""
+    opciones = CATALOGOS[columna][0]
+    if val in opciones:   # ya canónico (historial pasado por canonizar_historial)
+        return val
+    return _TABLAS_CANONICAS[columna].get(plegar(_safe_str(val)), default)
+
+
+def canonizar_columna(serie: pd.Series, columna: str) -> pd.Series:
+    """
+    Columna del historial -> categórica con los valores canónicos del formulario.
+
+    - El plegado y el mapeo se hacen solo sobre los valores únicos (pd.factorize);
+      las filas se resuelven con indexación de numpy
+    - Categorías: primero las opciones del formulario, luego los valores fuera de
+      catálogo (se conservan, sin espacios sobrantes); vacíos -> nulo
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    opciones = CATALOGOS[columna][0]
+    tabla = _TABLAS_CANONICAS[columna]
+
+    canonicos = []
+    for u in unicos:
+        texto = str(u).strip()
+        canonicos.append(tabla.get(plegar(texto), texto) if texto else None)
+
+    categorias = list(opciones) + sorted({c for c in canonicos if c is not None} - set(opciones))
+    posicion = {c: i for i, c in enumerate(categorias)}
+    traduccion = np.asarray([posicion.get(c, -1) if c is not None else -1 for c in canonicos] + [-1])
+    # codigos == -1 (nulos) cae en el -1 agregado al final de `traduccion`
+    nuevos = traduccion[codigos]
+    return pd.Series(
+        pd.Categorical.from_codes(nuevos, categories=categorias), index=serie.index, name=serie.name
+    )
+
+
+def canonizar_historial(df: pd.DataFrame) -> pd.DataFrame:
+    """Aplica canonizar_columna a las columnas de CATALOGOS presentes (en el mismo DataFrame)."""
+    for columna in CATALOGOS:
+        if columna in df.columns:
+            df[columna] = canonizar_columna(df[columna], columna)
+    return df
+
+
+def fila_a_formulario(row: pd.Series) -> dict:
+    """Registro del historial -> valores iniciales del formulario (sin Streamlit)."""
+    form = FORM_DEFAULTS.copy()
+
+    for columna in CATALOGOS:
+        form[columna] = canonizar_valor(row.get(columna, FORM_DEFAULTS[columna]), columna, FORM_DEFAULTS[columna])
+
+    form["fecha_recepcion"] = _safe_date(row.get("fecha_recepcion"))
+    form["articulacion"] = _safe_str(row.get("articulacion", ""))
+    form["fecha_derivacion"] = _safe_date(row.get("fecha_derivacion"))
+    form["periodo"] = _safe_str(row.get("periodo", ""))
+    form["cantidad_revisiones"] = _safe_int(row.get("cantidad_revisiones", 0))
+    form["comentario"] = _safe_str(row.get("comentario", ""))
+
+    form["expediente"] = _safe_str(row.get("expediente", ""))
+    form["fecha_it"] = _safe_date(row.get("fecha_it"))
+    form["numero_it"] = _safe_str(row.get("numero_it", ""))
+    form["fecha_oficio"] = _safe_date(row.get("fecha_oficio"))
+    form["numero_oficio"] = _safe_str(row.get("numero_oficio", ""))
+    return form
+
+
+def construir_registro(**valores) -> dict:
+    """Valores del formulario -> registro del historial, en el orden de CAMPOS_REGISTRO (fechas como texto ISO)."""
+    return {c: str(valores[c]) if c.startswith("fecha_") else valores[c] for c in CAMPOS_REGISTRO}
@@ -0,0 +1,161 @@
+# ============================================
+# core/recursos.py
+# ============================================
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from textwrap import dedent
+
+from core import config
+from storage.agregados import HistorialStoreConAgregados
+from storage.busqueda_ue import IndiceBusquedaUE
+from storage.escritura_lotes import HistorialStoreEnLotes
+from storage.historial_store import crear_historial_store
+from storage.plano_compartido import (
+    INSTANTANEA_UNIDADES,
+    CacheHistorialCompartida,
+    LectorPlano,
+)
+from storage.precarga_historial import HistorialPrecargado
+from storage.unidades_ejecutoras import (
+    construir_indice_unidades,
+    leer_unidades_ejecutoras,
+    version_unidades_ejecutoras,
+)
+
+try:
+    import streamlit as st
+    from streamlit import runtime as st_runtime
+except ImportError:   # sin Streamlit (scripts, benchmarks): memo por proceso con lru_cache
+    st = None
+    st_runtime = None
+
+# Recursos compartidos por todas las sesiones del proceso: se crean una sola vez
+# (o una vez por versión de datos) y se tratan como solo lectura.
+
+
+def recurso_compartido(max_entradas: int = 1):
+    """
+    Memo de un recurso del proceso.
+
+    - Dentro de la app: st.cache_resource (singleton compartido por todas las sesiones)
+    - Fuera de Streamlit: functools.lru_cache con el mismo tamaño
+    """
+    if st is not None and st_runtime.exists():
+        return st.cache_resource(max_entries=max_entradas, show_spinner=False)
+    return lru_cache(maxsize=max_entradas)
+
+
+@recurso_compartido()
+def obtener_historial_store():
+    """
+    Un solo store (y un solo pool de conexiones) por proceso, con el cubo de
+    agregados del tablero mantenido en cada guardado.
+    """
+    lector = obtener_lector_plano()
+    store = crear_historial_store(
+        config.HISTORIAL_BACKEND,
+        xlsx_path=config.HISTORIAL_PATH,
+        db_path=config.HISTORIAL_DB_PATH,
+        dsn=config.HISTORIAL_POSTGRES_DSN,
+        cache=CacheHistorialCompartida(lector) if lector is not None else None,
+        particiones_dir=config.HISTORIAL_PARTICIONES_DIR,
+        particion_ue=config.HISTORIAL_PARTICION_UE,
+        proveedor_info_ue=info_unidades,
+    )
+    if config.HISTORIAL_EN_LOTES:
+        store = HistorialStoreEnLotes(store, config.HISTORIAL_JOURNAL_PATH)
+    return HistorialStoreConAgregados(store, info_unidades, max_edad_s=config.AGREGADOS_MAX_EDAD_S)
+
+
+@recurso_compartido()
+def obtener_lector_plano():
+    """Lector del plano de datos compartido (IT_PEI_PLANO_COMPARTIDO), o None si está desactivado."""
+    return LectorPlano(config.PLANO_COMPARTIDO_DIR) if config.PLANO_COMPARTIDO_DIR else None
+
+
+def _instantanea_unidades():
+    lector = obtener_lector_plano()
+    return lector.obtener(INSTANTANEA_UNIDADES) if lector is not None else None
+
+
+def version_unidades():
+    """
+    Versión de unidades ejecutoras (clave de los índices): la instantánea publicada
+    en modo compartido o, si no hay, los mtimes del Excel y su espejo.
+    """
+    instantanea = _instantanea_unidades()
+    if instantanea is not None:
+        return ("plano", instantanea.version)
+    return version_unidades_ejecutoras()
+
+
+def unidades_ejecutoras():
+    """DataFrame de unidades ejecutoras: mapeado desde el plano compartido si está publicado."""
+    instantanea = _instantanea_unidades()
+    return instantanea.df if instantanea is not None else leer_unidades_ejecutoras()
+
+
+@recurso_compartido()
+def obtener_pool_precarga():
+    """Pool de hilos de la precarga del historial, compartido por todas las sesiones."""
+    return ThreadPoolExecutor(max_workers=config.PRECARGA_HILOS, thread_name_prefix="precarga-historial")
+
+
+def crear_historial_de_sesion():
+    """Historial para una sesión: el store del proceso con la caché de precarga propia de la sesión."""
+    return HistorialPrecargado(
+        obtener_historial_store(),
+        obtener_pool_precarga() if config.PRECARGA_HILOS > 0 else None,
+        max_pliegos=config.PRECARGA_MAX_PLIEGOS,
+        max_edad_s=config.PRECARGA_MAX_EDAD_S,
+    )
+
+
+def info_unidades():
+    """(versión, info_por_codigo) de unidades ejecutoras: dimensiones sector/NG/responsable del cubo."""
+    version = version_unidades()
+    return version, obtener_indice_unidades(version).info_por_codigo
+
+
+@recurso_compartido()
+def obtener_indice_unidades(version):
+    """Índice precalculado de unidades ejecutoras; se reconstruye solo si cambia `version`."""
+    return construir_indice_unidades(unidades_ejecutoras())
+
+
+@recurso_compartido()
+def obtener_indice_busqueda(version):
+    """Índice de búsqueda difusa sobre TODAS las unidades ejecutoras (una vez por versión)."""
+    return IndiceBusquedaUE.desde_dataframe(unidades_ejecutoras())
+
+
+@recurso_compartido(4)
+def _imagen_base64(path: str, mtime: float) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+
+def imagen_base64(path: str) -> str:
+    """Base64 de una imagen, leída y codificada una sola vez por (ruta, mtime)."""
+    return _imagen_base64(path, os.path.getmtime(path))
+
+
+@recurso_compartido()
+def _encabezado_html(mtime: float) -> str:
+    logo_base64 = _imagen_base64(config.LOGO_PATH, mtime)
+    html = f"""
+<div style="display:flex; align-items:center; gap:16px; margin-top:-10px; padding:6px 0;">
+  <img src="data:image/png;base64,{logo_base64}" width="140" style="display:block;">
+  <h1 style="margin:0; font-size:2.1rem; font-weight:600; line-height:1.2;">
+    Registro de IT del Plan Estratégico Institucional (PEI)
+  </h1>
+</div>
+"""
+    return dedent(html)
+
+
+def encabezado_html() -> str:
+    """HTML del encabezado con el logo embebido (se arma una vez por versión del logo)."""
+    return _encabezado_html(os.path.getmtime(config.LOGO_PATH))
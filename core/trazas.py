@@ -0,0 +1,132 @@
+# ============================================
+# core/trazas.py
+# ============================================
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+import numpy as np
+
+logger = logging.getLogger("it_pei.trazas")
+
+# Desactivado por defecto: IT_PEI_TRAZAS=1 para medir
+_ACTIVAS = os.environ.get("IT_PEI_TRAZAS", "0") == "1"
+MUESTRAS_POR_TRAMO = 1000
+
+_NULO = nullcontext()
+_lock = threading.Lock()
+_muestras = defaultdict(lambda: deque(maxlen=MUESTRAS_POR_TRAMO))   # tramo -> duraciones (s)
+_aciertos = defaultdict(lambda: [0, 0])                             # caché -> [aciertos, fallos]
+_local = threading.local()                                          # tramos de la ejecución actual
+
+
+def activas() -> bool:
+    return _ACTIVAS
+
+
+def activar(valor: bool = True) -> None:
+    global _ACTIVAS
+    _ACTIVAS = bool(valor)
+
+
+@contextmanager
+def _tramo_medido(nombre: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        with _lock:
+            _muestras[nombre].append(duracion)
+        ejecucion = getattr(_local, "ejecucion", None)
+        if ejecucion is not None:
+            ejecucion.append((nombre, duracion))
+        logger.debug("tramo=%s ms=%.3f", nombre, duracion * 1000)
+
+
+def tramo(nombre: str):
+    """
+    Context manager que mide un tramo del flujo:
+
+        with tramo("historial.lectura"):
+            ...
+
+    Desactivado, retorna un contexto nulo compartido (sin medir ni asignar memoria).
+    """
+    return _tramo_medido(nombre) if _ACTIVAS else _NULO
+
+
+def trazado(nombre: str):
+    """Decorador equivalente a envolver la función en `tramo(nombre)`."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _ACTIVAS:
+                return funcion(*args, **kwargs)
+            with _tramo_medido(nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def contar_cache(nombre: str, acierto: bool) -> None:
+    """Registra un acierto/fallo de la caché `nombre` (para la tasa de aciertos)."""
+    if not _ACTIVAS:
+        return
+    with _lock:
+        _aciertos[nombre][0 if acierto else 1] += 1
+
+
+def iniciar_ejecucion() -> None:
+    """Marca el inicio de un rerun: tramos_de_ejecucion() devuelve solo lo medido desde aquí."""
+    _local.ejecucion = [] if _ACTIVAS else None
+
+
+def tramos_de_ejecucion() -> list:
+    """[(tramo, segundos), ...] del rerun actual, en orden de término."""
+    return list(getattr(_local, "ejecucion", None) or [])
+
+
+def resumen() -> dict:
+    """
+    Métricas acumuladas en el proceso:
+    - tramos: nombre -> {n, p50_ms, p95_ms, max_ms, total_s}
+    - caches: nombre -> {aciertos, fallos, tasa_aciertos}
+    """
+    with _lock:
+        muestras = {k: np.asarray(v) for k, v in _muestras.items() if v}
+        aciertos = {k: tuple(v) for k, v in _aciertos.items()}
+
+    tramos = {
+        nombre: {
+            "n": int(len(d)),
+            "p50_ms": float(np.percentile(d, 50) * 1000),
+            "p95_ms": float(np.percentile(d, 95) * 1000),
+            "max_ms": float(d.max() * 1000),
+            "total_s": float(d.sum()),
+        }
+        for nombre, d in sorted(muestras.items())
+    }
+    caches = {
+        nombre: {"aciertos": a, "fallos": f, "tasa_aciertos": a / (a + f) if a + f else None}
+        for nombre, (a, f) in sorted(aciertos.items())
+    }
+    return {"tramos": tramos, "caches": caches}
+
+
+def exportar_metricas(path: str) -> None:
+    """Agrega una línea JSON con el resumen actual (para seguimiento externo)."""
+    linea = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "pid": os.getpid(), **resumen()}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(linea, ensure_ascii=False) + "\n")
+
+
+def reiniciar() -> None:
+    with _lock:
+        _muestras.clear()
+        _aciertos.clear()
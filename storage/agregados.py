@@ -0,0 +1,231 @@
+# ============================================
+# storage/agregados.py
+# ============================================
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from adapters.historial_sharepoint import normalizar_codigo_serie
+from core.formulario import canonizar_historial
+from storage.historial_store import HistorialStore, a_fecha, calcular_clave_natural, registro_con_clave
+
+# Dimensiones del cubo materializado (las de la UE salen de unidades_ejecutoras)
+DIMENSIONES = ["responsable", "sector", "NG", "estado", "etapa_revision", "año"]
+MEDIDAS = ["registros", "con_plazo", "suma_dias", "suma_dias2"]
+
+
+def calcular_cubo(df: pd.DataFrame, info_por_codigo: dict) -> pd.DataFrame:
+    """
+    Historial (columnas estándar) -> cubo agregado por DIMENSIONES.
+
+    - registros: filas; con_plazo: filas con fecha_recepcion y fecha_it válidas
+    - suma_dias / suma_dias2: suma (y suma de cuadrados) del plazo
+      fecha_recepcion -> fecha_it en días, para promedio y desviación
+    """
+    if df.empty:
+        return pd.DataFrame(columns=DIMENSIONES + MEDIDAS)
+
+    codigos = normalizar_codigo_serie(df["codigo"]) if "codigo_ue_norm" not in df.columns else df["codigo_ue_norm"]
+    codigos = codigos.astype(str)
+    info = pd.DataFrame.from_dict(info_por_codigo, orient="index") if info_por_codigo else pd.DataFrame()
+
+    def dimension_ue(campo):
+        if campo not in info.columns:
+            return pd.Series("", index=df.index)
+        return codigos.map(info[campo]).fillna("").astype(str).to_numpy()
+
+    def columna(campo):
+        if campo not in df.columns:
+            return pd.Series("", index=df.index)
+        serie = df[campo]
+        return serie.astype(object).where(serie.notna(), "").astype(str).str.strip().to_numpy()
+
+    def fecha(campo):
+        if campo not in df.columns:
+            return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+        return a_fecha(df[campo])
+
+    anio = pd.to_numeric(df["año"], errors="coerce") if "año" in df.columns else pd.Series(np.nan, index=df.index)
+    dias = (fecha("fecha_it") - fecha("fecha_recepcion")).dt.days.to_numpy(dtype=float)
+    valido = ~np.isnan(dias)
+
+    base = pd.DataFrame({
+        "responsable": dimension_ue("responsable"),
+        "sector": dimension_ue("sector"),
+        "NG": dimension_ue("NG"),
+        "estado": columna("estado"),
+        "etapa_revision": columna("etapa_revision"),
+        "año": anio.fillna(-1).astype(int).astype(str).replace("-1", "").to_numpy(),
+        "registros": 1,
+        "con_plazo": valido.astype(int),
+        "suma_dias": np.where(valido, dias, 0.0),
+        "suma_dias2": np.where(valido, dias * dias, 0.0),
+    })
+    return base.groupby(DIMENSIONES, sort=False, as_index=False)[MEDIDAS].sum()
+
+
+def sumar_cubos(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Suma de dos cubos: costo proporcional al tamaño del cubo, no al del historial."""
+    if a.empty:
+        return b
+    if b.empty:
+        return a
+    return pd.concat([a, b], ignore_index=True).groupby(DIMENSIONES, sort=False, as_index=False)[MEDIDAS].sum()
+
+
+def restar_cubos(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Resta `b` de `a` (registros reemplazados); descarta las celdas que quedan sin registros."""
+    if b.empty:
+        return a
+    negado = b.copy()
+    negado[MEDIDAS] = -negado[MEDIDAS]
+    res = sumar_cubos(a, negado)
+    return res[res["registros"] > 0].reset_index(drop=True)
+
+
+def consultar_cubo(cubo: pd.DataFrame, filtros: dict = None, por=("estado",)) -> pd.DataFrame:
+    """
+    Responde desde el cubo: filtra por `filtros` ({dimension: valor o lista}) y
+    agrupa por `por`. Agrega promedio y desviación estándar del plazo en días.
+    """
+    vista = cubo
+    for dimension, valores in (filtros or {}).items():
+        if valores is None or (isinstance(valores, (list, tuple, set)) and not valores):
+            continue
+        valores = list(valores) if isinstance(valores, (list, tuple, set)) else [valores]
+        vista = vista[vista[dimension].isin([str(v) for v in valores])]
+
+    por = list(por)
+    if por:
+        res = vista.groupby(por, sort=True, as_index=False)[MEDIDAS].sum()
+    else:
+        res = vista[MEDIDAS].sum().to_frame().T
+
+    n = res["con_plazo"].replace(0, np.nan)
+    res["plazo_promedio_dias"] = (res["suma_dias"] / n).round(1)
+    varianza = (res["suma_dias2"] / n - (res["suma_dias"] / n) ** 2).clip(lower=0)
+    res["plazo_desv_dias"] = np.sqrt(varianza).round(1)
+    return res.drop(columns=["suma_dias", "suma_dias2"]).sort_values("registros", ascending=False, ignore_index=True)
+
+
+class HistorialStoreConAgregados(HistorialStore):
+    """
+    Envoltura de un HistorialStore que mantiene un cubo materializado de conteos
+    y plazos por responsable, sector, NG, estado, etapa y año.
+
+    - El cubo se calcula una vez leyendo el historial completo
+    - Cada agregar()/agregar_lote() suma al cubo solo los registros nuevos
+    - agregar_o_reemplazar() resta los registros reemplazados y suma el nuevo
+    - reemplazar_por_clave()/importar_excel() (sync, carga masiva) lo marcan para
+      recalcular en la próxima consulta
+    - `proveedor_info_ue() -> (version, info_por_codigo)`: si cambia la versión de
+      unidades ejecutoras (p. ej. reasignación de responsables), se recalcula
+    - `max_edad_s`: recálculo completo periódico, para ver escrituras de otros procesos
+    """
+
+    def __init__(self, store: HistorialStore, proveedor_info_ue, max_edad_s: float = 300.0):
+        self.store = store
+        self.proveedor_info_ue = proveedor_info_ue
+        self.max_edad_s = max_edad_s
+        self._lock = threading.Lock()
+        self._cubo = None
+        self._version_ue = None
+        self._calculado = 0.0
+
+    # ---------- cubo ----------
+    def _vigente(self, version_ue) -> bool:
+        return (
+            self._cubo is not None
+            and self._version_ue == version_ue
+            and time.monotonic() - self._calculado < self.max_edad_s
+        )
+
+    def cubo(self) -> pd.DataFrame:
+        version_ue, info = self.proveedor_info_ue()
+        with self._lock:
+            if not self._vigente(version_ue):
+                self._cubo = calcular_cubo(self.store.leer_todo(), info)
+                self._version_ue = version_ue
+                self._calculado = time.monotonic()
+            return self._cubo
+
+    def consultar(self, filtros: dict = None, por=("estado",)) -> pd.DataFrame:
+        return consultar_cubo(self.cubo(), filtros, por)
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._cubo = None
+
+    def _sumar(self, nuevos: list, quitados: pd.DataFrame = None) -> None:
+        with self._lock:
+            if self._cubo is None:
+                return   # se calculará completo en la próxima consulta
+            _, info = self.proveedor_info_ue()
+            cubo = self._cubo
+            if quitados is not None and not quitados.empty:
+                cubo = restar_cubos(cubo, calcular_cubo(canonizar_historial(quitados.copy()), info))
+            df = canonizar_historial(pd.DataFrame(nuevos))
+            self._cubo = sumar_cubos(cubo, calcular_cubo(df, info))
+
+    def _coincidentes(self, nuevo: dict):
+        """Filas que reemplazaría el upsert de `nuevo` (mismo criterio que HistorialStore)."""
+        df, partes = registro_con_clave(nuevo)
+        if partes is None:
+            return None
+        existentes = self.store.buscar_por_codigo(nuevo["codigo"])
+        if existentes.empty:
+            return existentes
+        return existentes[calcular_clave_natural(existentes) == calcular_clave_natural(df).iloc[0]]
+
+    # ---------- escritura ----------
+    def agregar(self, nuevo: dict) -> None:
+        self.store.agregar(nuevo)
+        self._sumar([nuevo])
+
+    def agregar_lote(self, nuevos: list) -> int:
+        n = self.store.agregar_lote(nuevos)
+        if nuevos:
+            self._sumar(nuevos)
+        return n
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        # Las filas a reemplazar se leen antes de escribir: su aporte se resta del cubo
+        previos = self._coincidentes(nuevo) if self._cubo is not None else None
+        reemplazado = self.store.agregar_o_reemplazar(nuevo)
+        if reemplazado and (previos is None or previos.empty):
+            self.invalidar()   # otro proceso escribió la clave en el medio
+        else:
+            self._sumar([nuevo], quitados=previos if reemplazado else None)
+        return reemplazado
+
+    def importar_excel(self, path: str) -> int:
+        n = self.store.importar_excel(path)
+        self.invalidar()
+        return n
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        n = self.store.reemplazar_por_clave(df, claves_eliminar)
+        self.invalidar()
+        return n
+
+    # ---------- lectura (delegada) ----------
+    def leer_todo(self) -> pd.DataFrame:
+        return self.store.leer_todo()
+
+    def leer_por_anio(self, anios) -> pd.DataFrame:
+        return self.store.leer_por_anio(anios)
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        return self.store.buscar_por_codigo(codigo)
+
+    def ultimo_registro(self, codigo):
+        return self.store.ultimo_registro(codigo)
+
+    def contar_por_codigo(self, codigo) -> int:
+        return self.store.contar_por_codigo(codigo)
+
+    def pagina_por_codigo(self, codigo, limite: int = 5, desplazamiento: int = 0,
+                          ordenar_por: str = "fecha_recepcion", descendente: bool = True) -> pd.DataFrame:
+        return self.store.pagina_por_codigo(codigo, limite, desplazamiento, ordenar_por, descendente)
@@ -0,0 +1,71 @@
+# ============================================
+# storage/archivos.py
+# ============================================
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:   # POSIX
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def bloqueo_exclusivo(path: str, timeout: float = 60.0):
+    """
+    Lock advisory entre procesos sobre `<path>.lock`.
+
+    Serializa a los escritores del mismo archivo (varias sesiones o varios
+    workers de Streamlit). Los lectores no lo toman: leen siempre un archivo
+    completo gracias a escritura_atomica.
+    """
+    lock_path = f"{path}.lock"
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    inicio = time.monotonic()
+    try:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() - inicio > timeout:
+                    raise TimeoutError(f"No se pudo bloquear {path} en {timeout:.0f} s.")
+                time.sleep(0.05)
+        yield
+    finally:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        os.close(fd)
+
+
+@contextmanager
+def escritura_atomica(path: str):
+    """
+    Entrega una ruta temporal en el mismo directorio que `path`; al salir sin
+    errores la renombra sobre `path` con os.replace (atómico). Un lector nunca
+    ve un archivo a medio escribir: o el anterior completo o el nuevo completo.
+    """
+    directorio = os.path.dirname(os.path.abspath(path))
+    base, ext = os.path.splitext(os.path.basename(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{base}.", suffix=ext, dir=directorio)
+    os.close(fd)
+    try:
+        yield tmp_path
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,134 @@
+# ============================================
+# storage/busqueda_ue.py
+# ============================================
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+_RE_NO_ALFANUM = re.compile(r"[^0-9a-z]+")
+
+
+def plegar_texto(texto) -> str:
+    """Minúsculas, sin tildes y con separadores simples: 'Educación - UGEL' -> 'educacion ugel'."""
+    if texto is None or (isinstance(texto, float) and np.isnan(texto)):
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    return _RE_NO_ALFANUM.sub(" ", texto).strip()
+
+
+def _trigramas(texto: str, prefijo_abierto: bool = False) -> set:
+    """
+    Trigramas por palabra con relleno ('  ab', 'abc', 'bc ').
+    Con `prefijo_abierto`, la última palabra no se cierra: 'educ' coincide con 'educacion'.
+    """
+    palabras = texto.split()
+    gramas = set()
+    for i, palabra in enumerate(palabras):
+        cierre = "" if (prefijo_abierto and i == len(palabras) - 1) else " "
+        p = "  " + palabra + cierre
+        gramas.update(p[j:j + 3] for j in range(len(p) - 2))
+    return gramas
+
+
+class IndiceBusquedaUE:
+    """
+    Índice de búsqueda difusa/prefijo sobre código y nombre de las unidades ejecutoras.
+
+    - Índice invertido de trigramas sobre texto plegado (sin tildes, minúsculas)
+    - Conteo de coincidencias vectorizado y ponderado por IDF (np.bincount sobre los postings)
+    - Tolera errores de tipeo (coincidencia parcial de trigramas) y tildes
+    - Bonificaciones: código exacto > prefijo de código > prefijo del nombre > subcadena
+    - El prefijo de código se resuelve con bisect sobre los códigos ordenados
+    """
+
+    def __init__(self, codigos, nombres):
+        self.codigos = np.asarray([str(c).strip() for c in codigos], dtype=object)
+        self.nombres = np.asarray([str(n).strip() for n in nombres], dtype=object)
+        self._plegados = [plegar_texto(n) for n in self.nombres]
+        self._posicion = {c: i for i, c in enumerate(self.codigos)}
+        self._largo = np.asarray([len(n) for n in self._plegados], dtype=np.int32)
+
+        # Códigos ordenados como texto: un prefijo es un rango contiguo (bisect, O(log n))
+        orden = sorted(range(len(self.codigos)), key=lambda i: self.codigos[i])
+        self._codigos_ordenados = [self.codigos[i] for i in orden]
+        self._orden_codigos = np.asarray(orden, dtype=np.int64)
+
+        postings = {}
+        for i, (codigo, nombre) in enumerate(zip(self.codigos, self._plegados)):
+            for g in _trigramas(f"{plegar_texto(codigo)} {nombre}"):
+                postings.setdefault(g, []).append(i)
+        self._postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+        # Peso IDF: los trigramas frecuentes ('ion', 'de ') aportan poco
+        n = max(len(self.codigos), 1)
+        self._peso = {g: float(np.log1p(n / len(ids))) for g, ids in self._postings.items()}
+
+    @classmethod
+    def desde_dataframe(cls, df: pd.DataFrame) -> "IndiceBusquedaUE":
+        return cls(df["codigo"].tolist(), df["nombre"].tolist())
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def buscar(self, consulta: str, k: int = 10, codigos=None, minimo: float = 0.45) -> list:
+        """
+        Top-k [(codigo, nombre, puntaje)] ordenado por relevancia.
+
+        - `codigos` restringe la búsqueda a un subconjunto (p. ej. las UEs de un responsable)
+        - `minimo` descarta coincidencias débiles (fracción ponderada de trigramas)
+        """
+        q = plegar_texto(consulta)
+        if not q or not len(self.codigos):
+            return []
+
+        gramas_q = list(_trigramas(q, prefijo_abierto=True))
+        presentes = [g for g in gramas_q if g in self._postings]
+        if not presentes:
+            return []
+        # Fracción (ponderada por IDF) de los trigramas de la consulta presentes en cada UE.
+        # Un trigrama ausente del índice pesa como el más raro posible.
+        peso_max = float(np.log1p(len(self.codigos)))
+        total = sum(self._peso.get(g, peso_max) for g in gramas_q)
+        puntaje = np.bincount(
+            np.concatenate([self._postings[g] for g in presentes]),
+            weights=np.concatenate([np.full(len(self._postings[g]), self._peso[g]) for g in presentes]),
+            minlength=len(self.codigos),
+        ) / total
+
+        # Bonificación por código (búsqueda exacta o por prefijo)
+        q_codigo = q.replace(" ", "")
+        if q_codigo.isdigit():
+            pos = self._posicion.get(q_codigo)
+            if pos is not None:
+                puntaje[pos] += 2.0
+            desde = bisect_left(self._codigos_ordenados, q_codigo)
+            hasta = bisect_left(self._codigos_ordenados, q_codigo + "\uffff")
+            puntaje[self._orden_codigos[desde:hasta]] += 0.5
+
+        if codigos is not None:
+            permitidos = np.zeros(len(self.codigos), dtype=bool)
+            permitidos[[self._posicion[c] for c in codigos if c in self._posicion]] = True
+            puntaje[~permitidos] = 0.0
+
+        candidatos = np.flatnonzero(puntaje >= minimo)
+        if not len(candidatos):
+            return []
+
+        # Prefijo/subcadena del nombre: solo sobre los mejores candidatos
+        n_previos = min(len(candidatos), max(k * 20, 200))
+        previos = candidatos[np.argpartition(-puntaje[candidatos], n_previos - 1)[:n_previos]]
+        for i in previos:
+            nombre = self._plegados[i]
+            if nombre.startswith(q):
+                puntaje[i] += 0.3
+            elif q in nombre:
+                puntaje[i] += 0.2
+
+        k = min(k, len(previos))
+        mejores = previos[np.argpartition(-puntaje[previos], k - 1)[:k]]
+        # Mayor puntaje primero; a igual puntaje, el nombre más corto (más específico)
+        mejores = mejores[np.lexsort((mejores, self._largo[mejores], -puntaje[mejores]))]
+        return [(self.codigos[i], self.nombres[i], float(puntaje[i])) for i in mejores]
@@ -0,0 +1,298 @@
+# ============================================
+# storage/carga_masiva.py
+# ============================================
+"""
+Carga y exportación masiva del historial y de unidades ejecutoras, fuera de Streamlit.
+
+    python -m storage.carga_masiva importar export1.xlsx [export2.xlsx ...] [--validacion estricta]
+    python -m storage.carga_masiva exportar salida.parquet [--codigo 10 --anio 2024 --estado Emitido]
+    python -m storage.carga_masiva exportar exports/ --por-anio
+    python -m storage.carga_masiva exportar delta.xlsx --delta data/export_estado.json
+    python -m storage.carga_masiva importar-ue nuevo_unidades.xlsx
+    python -m storage.carga_masiva exportar-ue salida.csv [--responsable "Juan Pérez"]
+
+El backend del historial es el mismo que usa la app (core.config: HISTORIAL_BACKEND,
+HISTORIAL_DB_PATH, HISTORIAL_POSTGRES_DSN).
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from core import config
+from storage.archivos import bloqueo_exclusivo, escritura_atomica
+from storage.espejo_columnar import sincronizar_espejo
+from storage.exportacion_excel import escribir_hojas, escribir_xlsx
+from storage.historial_store import (
+    HistorialStore,
+    calcular_clave_sync,
+    completar_clave_sync,
+    crear_historial_store,
+    filtrar_anios,
+    leer_excel_historial,
+    preparar_historial,
+)
+from storage.sync_sharepoint import cargar_estado, guardar_estado, hash_filas
+from storage.unidades_ejecutoras import (
+    UNIDADES_EJECUTORAS_PATH,
+    construir_indice_unidades,
+    leer_unidades_ejecutoras,
+    preparar_unidades_ejecutoras,
+)
+from storage.validacion import validar_historial
+
+# Qué hacer con las filas que no cumplen las reglas del formulario
+VALIDACIONES = ("estricta", "reporte", "ninguna")
+
+
+def _leer_y_preparar(path: str) -> pd.DataFrame:
+    """Lectura + adapter de un archivo (se ejecuta en un proceso del pool)."""
+    df = preparar_historial(leer_excel_historial(path))
+    df["archivo_origen"] = os.path.basename(path)
+    return df
+
+
+def _tasa(filas: int, segundos: float) -> str:
+    return f"{filas} filas en {segundos:.2f} s ({filas / segundos if segundos > 0 else 0:,.0f} filas/s)"
+
+
+def importar_historial(
+    store: HistorialStore,
+    paths: list,
+    validacion: str = "reporte",
+    procesos: int = None,
+    rechazados_path: str = None,
+) -> dict:
+    """
+    Importa uno o más exports de SharePoint (o Excels de la app) al store.
+
+    - Lectura y adapter en paralelo: un proceso por archivo
+    - Validación con las reglas del formulario (periodo, requisitos de 'Emitido'):
+        estricta -> descarta las filas inválidas; reporte -> las importa y las cuenta;
+        ninguna  -> no valida
+    - Duplicados exactos (entre archivos o dentro de uno) se descartan
+    - Se escribe con reemplazar_por_clave: reimportar el mismo export no duplica filas
+    - Retorna estadísticas y tiempos por etapa
+    """
+    if validacion not in VALIDACIONES:
+        raise ValueError(f"Validación desconocida: {validacion!r} (usa {', '.join(VALIDACIONES)}).")
+
+    tiempos = {}
+    inicio = time.perf_counter()
+    if len(paths) > 1 and procesos != 1:
+        with ProcessPoolExecutor(max_workers=procesos or min(len(paths), os.cpu_count() or 1)) as pool:
+            partes = list(pool.map(_leer_y_preparar, paths))
+    else:
+        partes = [_leer_y_preparar(p) for p in paths]
+    df = pd.concat(partes, ignore_index=True, sort=False) if partes else pd.DataFrame()
+    tiempos["lectura"] = time.perf_counter() - inicio
+    leidas = len(df)
+
+    t = time.perf_counter()
+    errores = validar_historial(df) if validacion != "ninguna" else pd.Series("", index=df.index)
+    invalidas = errores != ""
+    if rechazados_path and invalidas.any():
+        df[invalidas].assign(errores=errores[invalidas]).to_csv(rechazados_path, index=False)
+    if validacion == "estricta":
+        df = df[~invalidas]
+    tiempos["validacion"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    contenido = [c for c in df.columns if c not in ("clave_sync", "archivo_origen")]
+    duplicadas = df.duplicated(subset=contenido)
+    df = df[~duplicadas].drop(columns=["archivo_origen"])
+    # Claves recalculadas sobre el conjunto completo (el contador de ocurrencias cruza archivos)
+    df = df.assign(clave_sync=calcular_clave_sync(df)) if len(df) else df
+    tiempos["deduplicacion"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    escritas = store.reemplazar_por_clave(df) if len(df) else 0
+    tiempos["escritura"] = time.perf_counter() - t
+    tiempos["total"] = time.perf_counter() - inicio
+
+    return {
+        "archivos": len(paths),
+        "leidas": leidas,
+        "invalidas": int(invalidas.sum()),
+        "descartadas_por_validacion": int(invalidas.sum()) if validacion == "estricta" else 0,
+        "duplicadas": int(duplicadas.sum()),
+        "escritas": escritas,
+        "segundos": tiempos,
+        "filas_por_segundo": leidas / tiempos["total"] if tiempos["total"] > 0 else 0.0,
+    }
+
+
+def filtrar_historial(store: HistorialStore, codigo=None, anio=None, estado=None, responsable=None) -> pd.DataFrame:
+    """
+    Corte del historial; con `codigo` se usa la búsqueda indexada del store y
+    con `anio`, la lectura por año (poda de particiones en el backend particionado).
+    """
+    if codigo is not None:
+        df = store.buscar_por_codigo(codigo)
+        if anio is not None:
+            df = filtrar_anios(df, [anio])
+    else:
+        df = store.leer_por_anio([anio]) if anio is not None else store.leer_todo()
+    if estado is not None and "estado" in df.columns:
+        df = df[df["estado"].astype(str).str.strip().str.lower() == estado.strip().lower()]
+    if responsable is not None and "responsable_institucional" in df.columns:
+        df = df[df["responsable_institucional"].astype(str).str.strip() == responsable.strip()]
+    return df.reset_index(drop=True)
+
+
+def exportar_df(df: pd.DataFrame, path: str) -> None:
+    """Escribe según la extensión: .xlsx, .csv o .parquet (atómico)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".xlsx", ".csv", ".parquet"):
+        raise ValueError(f"Formato de exportación no soportado: {extension!r} (usa .xlsx, .csv o .parquet).")
+    if extension == ".xlsx":
+        escribir_xlsx(path, df)   # write-only: memoria acotada por lote
+        return
+    with escritura_atomica(path) as tmp_path:
+        if extension == ".csv":
+            df.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+        else:
+            # Parquet necesita tipos homogéneos por columna (mismo criterio que el espejo)
+            from storage.espejo_columnar import tipar_para_arrow
+
+            tipar_para_arrow(df).to_parquet(tmp_path, index=False)
+
+
+def exportar_por_anio(df: pd.DataFrame, directorio: str, prefijo: str = "historial") -> dict:
+    """
+    Un libro por año en `directorio` (<prefijo>_<año>.xlsx; filas sin año ->
+    <prefijo>_sin_anio.xlsx). Retorna {ruta: filas}.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    anios = pd.to_numeric(df["año"], errors="coerce") if "año" in df.columns else pd.Series(float("nan"), index=df.index)
+    escritos = {}
+    for anio, parte in df.groupby(anios.fillna(-1).astype(int), sort=True):
+        nombre = f"{prefijo}_{anio}.xlsx" if anio >= 0 else f"{prefijo}_sin_anio.xlsx"
+        ruta = os.path.join(directorio, nombre)
+        escritos[ruta] = escribir_xlsx(ruta, parte)
+    return escritos
+
+
+def exportar_delta(df: pd.DataFrame, path: str, estado_path: str) -> dict:
+    """
+    Exporta solo lo que cambió desde la exportación anterior (misma marca de agua
+    que la sincronización: clave_sync -> hash de fila guardado en `estado_path`).
+
+    - Hoja 'delta': filas nuevas o modificadas
+    - Hoja 'eliminados': claves exportadas antes que ya no están
+    - El estado se actualiza solo después de escribir el libro
+    """
+    with bloqueo_exclusivo(estado_path):
+        estado = cargar_estado(estado_path)
+        df = completar_clave_sync(df.copy())
+        hashes = hash_filas(df)
+        claves = df["clave_sync"]
+        previos = estado.get("hashes", {})
+
+        cambiados = (claves.map(previos).fillna("") != hashes).to_numpy()
+        eliminadas = sorted(set(previos) - set(claves))
+        escribir_hojas(path, {
+            "delta": df[cambiados],
+            "eliminados": pd.DataFrame({"clave_sync": eliminadas}),
+        })
+        guardar_estado(estado_path, {**estado, "hashes": dict(zip(claves, hashes))})
+    return {"filas": len(df), "nuevas_o_modificadas": int(cambiados.sum()), "eliminadas": len(eliminadas)}
+
+
+def importar_unidades(origen: str, destino: str = UNIDADES_EJECUTORAS_PATH) -> int:
+    """
+    Reemplaza el maestro de unidades ejecutoras: valida que el índice de la app
+    se pueda construir, copia el Excel de forma atómica y regenera el espejo.
+    """
+    df = preparar_unidades_ejecutoras(pd.read_excel(origen, engine="openpyxl"))
+    construir_indice_unidades(df)   # ValueError si falta alguna columna requerida
+    with bloqueo_exclusivo(destino):
+        with escritura_atomica(destino) as tmp_path:
+            shutil.copyfile(origen, tmp_path)
+    sincronizar_espejo(destino, preparar=preparar_unidades_ejecutoras)
+    return len(df)
+
+
+def _crear_store_desde_entorno() -> HistorialStore:
+    return crear_historial_store(
+        config.HISTORIAL_BACKEND,
+        xlsx_path=config.HISTORIAL_PATH,
+        db_path=config.HISTORIAL_DB_PATH,
+        dsn=config.HISTORIAL_POSTGRES_DSN,
+        particiones_dir=config.HISTORIAL_PARTICIONES_DIR,
+        particion_ue=config.HISTORIAL_PARTICION_UE,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m storage.carga_masiva", description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("importar", help="Importa exports de SharePoint al historial")
+    p.add_argument("archivos", nargs="+")
+    p.add_argument("--validacion", choices=VALIDACIONES, default="reporte")
+    p.add_argument("--procesos", type=int, default=None)
+    p.add_argument("--rechazados", help="CSV con las filas que no cumplen las reglas del formulario")
+
+    p = sub.add_parser("exportar", help="Exporta un corte del historial (.xlsx, .csv o .parquet)")
+    p.add_argument("salida")
+    p.add_argument("--codigo")
+    p.add_argument("--anio", type=int)
+    p.add_argument("--estado")
+    p.add_argument("--responsable")
+    p.add_argument("--por-anio", action="store_true", help="Un .xlsx por año; `salida` es un directorio")
+    p.add_argument("--delta", metavar="ESTADO", help="Solo filas nuevas/modificadas desde la exportación anterior")
+
+    p = sub.add_parser("importar-ue", help="Reemplaza unidades_ejecutoras.xlsx y regenera su espejo")
+    p.add_argument("origen")
+    p.add_argument("--destino", default=UNIDADES_EJECUTORAS_PATH)
+
+    p = sub.add_parser("exportar-ue", help="Exporta unidades ejecutoras (.xlsx, .csv o .parquet)")
+    p.add_argument("salida")
+    p.add_argument("--responsable")
+    p.add_argument("--sector")
+
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    if args.comando == "importar":
+        stats = importar_historial(
+            _crear_store_desde_entorno(), args.archivos,
+            validacion=args.validacion, procesos=args.procesos, rechazados_path=args.rechazados,
+        )
+        for clave, valor in stats.items():
+            print(f"{clave}: {valor}")
+        print(_tasa(stats["leidas"], stats["segundos"]["total"]))
+    elif args.comando == "exportar":
+        df = filtrar_historial(
+            _crear_store_desde_entorno(), codigo=args.codigo, anio=args.anio,
+            estado=args.estado, responsable=args.responsable,
+        )
+        if args.por_anio:
+            for ruta, filas in exportar_por_anio(df, args.salida).items():
+                print(f"{ruta}: {filas} filas")
+        elif args.delta:
+            print(exportar_delta(df, args.salida, args.delta))
+        else:
+            exportar_df(df, args.salida)
+        print(f"{args.salida}: " + _tasa(len(df), time.perf_counter() - inicio))
+    elif args.comando == "importar-ue":
+        filas = importar_unidades(args.origen, args.destino)
+        print(f"{args.destino}: " + _tasa(filas, time.perf_counter() - inicio))
+    else:
+        df = leer_unidades_ejecutoras()
+        if args.responsable:
+            df = df[df["Responsable_Institucional"].astype(str) == args.responsable]
+        if args.sector:
+            df = df[df["sector"].astype(str) == args.sector]
+        exportar_df(df.reset_index(drop=True), args.salida)
+        print(f"{args.salida}: " + _tasa(len(df), time.perf_counter() - inicio))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# ============================================
+# storage/compactar_historial.py
+# ============================================
+"""
+Compactación de un libro de historial: elimina los registros repetidos por
+clave natural (pliego, expediente, N° de IT y fecha de recepción), conservando
+la última versión de cada uno.
+
+    python -m storage.compactar_historial data/historial_it_pei.xlsx [--salida compacto.xlsx]
+
+Sin --salida, el libro se reemplaza en su lugar (escritura atómica, con el
+mismo bloqueo que usan los guardados de la app).
+"""
+import argparse
+import sys
+import time
+
+import pandas as pd
+from openpyxl import Workbook
+
+from adapters.historial_sharepoint import adaptar_historial_sharepoint, normalizar_codigo_serie
+from storage.archivos import bloqueo_exclusivo, escritura_atomica
+from storage.historial_store import calcular_clave_natural, coalescer_columnas_duplicadas
+from storage.lectura_streaming import TAMANO_LOTE, iterar_lotes_crudos, nombres_unicos
+
+
+def _claves_lote(encabezado, filas: list) -> pd.Series:
+    """Clave natural de cada fila cruda (solo las columnas con título pasan por el adapter)."""
+    nombres = nombres_unicos(encabezado)
+    posiciones = [i for i, c in enumerate(nombres) if c is not None]
+    lote = pd.DataFrame(
+        [[fila[i] if i < len(fila) else None for i in posiciones] for fila in filas],
+        columns=[nombres[i] for i in posiciones],
+    )
+    df = coalescer_columnas_duplicadas(adaptar_historial_sharepoint(lote, copiar=False))
+    df["codigo_ue_norm"] = normalizar_codigo_serie(df["codigo"])
+    return calcular_clave_natural(df)
+
+
+def compactar_excel(path: str, salida: str = None, tamano_lote: int = TAMANO_LOTE) -> dict:
+    """
+    Dos pasadas por lotes sobre el libro (memoria ~ un lote + una entrada por clave):
+
+    1) Índice hash clave natural -> posición de su última aparición
+    2) Se reescriben solo las filas que son la última aparición de su clave
+       (las filas sin expediente ni N° de IT se conservan siempre)
+
+    Las filas se copian tal cual: mismo encabezado (incluidas columnas sin título
+    o repetidas) y mismas posiciones. Retorna estadísticas.
+    """
+    salida = salida or path
+    inicio = time.perf_counter()
+
+    with bloqueo_exclusivo(path):
+        ultima = {}
+        leidas = 0
+        for encabezado, filas in iterar_lotes_crudos(path, tamano_lote=tamano_lote):
+            for posicion, clave in enumerate(_claves_lote(encabezado, filas), start=leidas):
+                if clave:
+                    ultima[clave] = posicion
+            leidas += len(filas)
+
+        conservar = set(ultima.values())
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        escritas = 0
+        posicion = 0
+        encabezado = False
+        for crudo, filas in iterar_lotes_crudos(path, tamano_lote=tamano_lote):
+            if not encabezado:
+                ws.append(list(crudo))
+                encabezado = True
+            for clave, fila in zip(_claves_lote(crudo, filas), filas):
+                if not clave or posicion in conservar:
+                    ws.append(list(fila))
+                    escritas += 1
+                posicion += 1
+
+        with escritura_atomica(salida) as tmp_path:
+            wb.save(tmp_path)
+
+    return {
+        "leidas": leidas,
+        "escritas": escritas,
+        "duplicadas": leidas - escritas,
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m storage.compactar_historial", description=__doc__.split("\n\n")[0])
+    parser.add_argument("libro")
+    parser.add_argument("--salida", help="Libro compactado (por defecto se reemplaza el original)")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE)
+    args = parser.parse_args(argv)
+
+    stats = compactar_excel(args.libro, args.salida, args.tamano_lote)
+    for clave, valor in stats.items():
+        print(f"{clave}: {valor}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
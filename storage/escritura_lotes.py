@@ -0,0 +1,373 @@
+# ============================================
+# storage/escritura_lotes.py
+# ============================================
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import ExitStack
+from itertools import groupby
+
+import pandas as pd
+
+from adapters.historial_sharepoint import normalizar_codigo
+from storage.archivos import bloqueo_exclusivo
+from storage.historial_store import (
+    HistorialStore,
+    calcular_clave_natural,
+    filtrar_anios,
+    ordenar_por_fecha,
+    registro_con_clave,
+)
+
+# Marca de las entradas del journal que se guardan con upsert (no llega al store)
+CAMPO_OPERACION = "_operacion"
+
+
+def _leer_journal(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    registros = []
+    with open(path, "r", encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                registros.append(json.loads(linea))
+            except json.JSONDecodeError:
+                # Última línea truncada por una caída: nunca fue confirmada
+                break
+    return registros
+
+
+def _quitar(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _es_upsert(registro: dict) -> bool:
+    return registro.get(CAMPO_OPERACION) == "upsert"
+
+
+def _sin_marca(registro: dict) -> dict:
+    return {k: v for k, v in registro.items() if k != CAMPO_OPERACION}
+
+
+def _combinar(historial: pd.DataFrame, pendientes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Historial volcado + pendientes, como quedará tras el volcado: de cada clave
+    natural con un upsert pendiente se conserva solo la última fila.
+    """
+    if pendientes.empty:
+        return historial
+    combinado = pd.concat([historial, pendientes], ignore_index=True, sort=False)
+    if CAMPO_OPERACION in combinado.columns:
+        clave = calcular_clave_natural(combinado)
+        claves_upsert = set(clave[(combinado[CAMPO_OPERACION] == "upsert") & (clave != "")])
+        if claves_upsert:
+            combinado = combinado[~(clave.isin(claves_upsert) & clave.duplicated(keep="last"))]
+        combinado = combinado.drop(columns=CAMPO_OPERACION)
+    return combinado.reset_index(drop=True)
+
+
+class HistorialStoreEnLotes(HistorialStore):
+    """
+    Envoltura de un HistorialStore que agrupa los guardados en lotes.
+
+    - agregar() escribe el registro en un journal (JSON lines + fsync) y
+      retorna de inmediato: el registro ya es durable
+    - agregar_o_reemplazar() también va al journal, marcado como upsert: la
+      clave natural se resuelve al volcar con store.agregar_o_reemplazar()
+    - Un hilo en segundo plano vuelca los pendientes con store.agregar_lote()
+      al llegar a `max_lote` registros o tras `max_espera_s` segundos
+    - Las lecturas combinan lo ya volcado con lo pendiente (se lee lo escrito)
+    - Cada proceso escribe su propio journal (`<journal_path>.<pid>-<id>`) y lo
+      mantiene bloqueado mientras vive: ningún otro worker lo rota ni lo borra
+    - Al arrancar, bajo el lock de `journal_path`, se adoptan los journals de
+      procesos que ya no existen (su lock está libre): sus registros pasan al
+      journal propio y se reencolan una sola vez (entrega al-menos-una-vez)
+
+    Invariante del journal: `<journal>.flushing` contiene el lote en vuelo y
+    `<journal>` los pendientes que llegaron después.
+    """
+
+    def __init__(self, store: HistorialStore, journal_path: str,
+                 max_lote: int = 50, max_espera_s: float = 2.0):
+        self.store = store
+        self.journal_base = journal_path
+        self.journal_path = f"{journal_path}.{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.flushing_path = f"{self.journal_path}.flushing"
+        self.max_lote = max_lote
+        self.max_espera_s = max_espera_s
+
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        # Lock de por vida sobre el journal propio: marca al proceso como vivo
+        self._vida = ExitStack()
+        self._vida.enter_context(bloqueo_exclusivo(self.journal_path, timeout=0))
+
+        self._cond = threading.Condition()
+        self._volcado = threading.Lock()   # un solo volcado en vuelo a la vez
+        self._pendientes = self._adoptar_huerfanos()
+        self._en_vuelo = []
+        self._primer_pendiente = time.monotonic() if self._pendientes else None
+        self._cerrado = False
+
+        self._latencias = deque(maxlen=200)
+        self._lotes = 0
+        self._escritos = 0
+        self._errores = 0
+        self._ultimo_error = None
+
+        self._hilo = threading.Thread(target=self._bucle, name="historial-escritor", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    # ---------- recuperación ----------
+    def _journals_ajenos(self) -> list:
+        directorio = os.path.dirname(os.path.abspath(self.journal_base))
+        prefijo = os.path.basename(self.journal_base) + "."
+        propio = os.path.basename(self.journal_path)
+        ids = set()
+        for nombre in os.listdir(directorio):
+            if nombre.startswith(prefijo):
+                ids.add(nombre[len(prefijo):].split(".")[0])
+        ids -= {"flushing", "lock", propio[len(prefijo):]}
+        return [f"{self.journal_base}.{i}" for i in sorted(ids)]
+
+    def _adoptar_huerfanos(self) -> list:
+        """
+        Pasa al journal propio los registros de journals sin dueño: los de procesos
+        terminados y el journal compartido de versiones anteriores (`journal_path`).
+        """
+        with bloqueo_exclusivo(self.journal_base):   # una sola recuperación a la vez
+            registros = _leer_journal(f"{self.journal_base}.flushing") + _leer_journal(self.journal_base)
+            adoptados = [self.journal_base]
+            for journal in self._journals_ajenos():
+                try:
+                    with bloqueo_exclusivo(journal, timeout=0):
+                        registros += _leer_journal(f"{journal}.flushing") + _leer_journal(journal)
+                except TimeoutError:
+                    continue   # su proceso sigue vivo
+                adoptados.append(journal)
+
+            if registros:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    for registro in registros:
+                        f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            for journal in adoptados:
+                _quitar(journal)
+                _quitar(f"{journal}.flushing")
+                if journal != self.journal_base:
+                    _quitar(f"{journal}.lock")
+        return registros
+
+    # ---------- escritura ----------
+    def agregar(self, nuevo: dict) -> None:
+        self._encolar(nuevo)
+
+    def _encolar(self, nuevo: dict) -> None:
+        linea = json.dumps(nuevo, ensure_ascii=False, default=str) + "\n"
+        with self._cond:
+            if self._cerrado:
+                raise RuntimeError("La cola de escritura del historial está cerrada.")
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pendientes.append(json.loads(linea))
+            if self._primer_pendiente is None:
+                self._primer_pendiente = time.monotonic()
+            self._cond.notify()
+
+    def agregar_lote(self, nuevos: list) -> int:
+        for nuevo in nuevos:
+            self.agregar(nuevo)
+        return len(nuevos)
+
+    def _rotar_journal(self) -> None:
+        """Mueve el journal actual al archivo del lote en vuelo (se llama con el lock tomado)."""
+        if not os.path.exists(self.journal_path):
+            return
+        if os.path.exists(self.flushing_path):
+            # Un volcado previo falló: el lote en vuelo acumula lo nuevo
+            with open(self.journal_path, "r", encoding="utf-8") as src, \
+                    open(self.flushing_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.flushing_path)
+
+    def _debe_volcar(self) -> bool:
+        if not self._pendientes:
+            return False
+        if self._cerrado or len(self._pendientes) >= self.max_lote:
+            return True
+        return time.monotonic() - self._primer_pendiente >= self.max_espera_s
+
+    def volcar(self) -> int:
+        """Vuelca ahora todos los pendientes. Retorna cuántos registros se escribieron."""
+        with self._volcado:
+            return self._volcar()
+
+    def _volcar(self) -> int:
+        with self._cond:
+            if not self._pendientes:
+                return 0
+            lote, self._pendientes = self._pendientes, []
+            self._en_vuelo = lote
+            self._primer_pendiente = None
+            self._rotar_journal()
+
+        inicio = time.perf_counter()
+        try:
+            # En orden: tramos de altas en un solo agregar_lote, upserts uno por uno
+            for upsert, tramo_lote in groupby(lote, key=_es_upsert):
+                registros = [_sin_marca(r) for r in tramo_lote]
+                if upsert:
+                    for registro in registros:
+                        self.store.agregar_o_reemplazar(registro)
+                else:
+                    self.store.agregar_lote(registros)
+        except Exception as e:
+            with self._cond:
+                self._pendientes = lote + self._pendientes
+                self._en_vuelo = []
+                self._primer_pendiente = time.monotonic()
+                self._errores += 1
+                self._ultimo_error = str(e)
+            raise
+
+        with self._cond:
+            if os.path.exists(self.flushing_path):
+                os.remove(self.flushing_path)
+            self._en_vuelo = []
+            self._latencias.append(time.perf_counter() - inicio)
+            self._lotes += 1
+            self._escritos += len(lote)
+        return len(lote)
+
+    def _bucle(self) -> None:
+        while True:
+            with self._cond:
+                while not self._debe_volcar():
+                    if self._cerrado:
+                        return
+                    if self._pendientes:
+                        restante = self.max_espera_s - (time.monotonic() - self._primer_pendiente)
+                        self._cond.wait(timeout=max(restante, 0.01))
+                    else:
+                        self._cond.wait()
+            try:
+                self.volcar()
+            except Exception:
+                # Se reintenta en el siguiente ciclo; el journal conserva los registros
+                time.sleep(self.max_espera_s)
+
+    def cerrar(self) -> None:
+        """Vuelca lo pendiente y detiene el hilo escritor."""
+        with self._cond:
+            if self._cerrado:
+                return
+            self._cerrado = True
+            self._cond.notify_all()
+        self._hilo.join(timeout=30)
+        with self._cond:
+            vacio = not self._pendientes and not self._en_vuelo
+        self._vida.close()
+        if vacio:
+            _quitar(self.journal_path)
+            _quitar(f"{self.journal_path}.lock")
+        # Si quedó algo sin volcar, el journal queda sin dueño y lo adopta el próximo proceso
+
+    # ---------- métricas ----------
+    def metricas(self) -> dict:
+        with self._cond:
+            latencias = sorted(self._latencias)
+            return {
+                "profundidad_cola": len(self._pendientes) + len(self._en_vuelo),
+                "lotes_volcados": self._lotes,
+                "registros_volcados": self._escritos,
+                "errores": self._errores,
+                "ultimo_error": self._ultimo_error,
+                "latencia_ultima_s": self._latencias[-1] if self._latencias else None,
+                "latencia_p50_s": latencias[len(latencias) // 2] if latencias else None,
+                "latencia_max_s": latencias[-1] if latencias else None,
+            }
+
+    # ---------- lectura (volcado + pendiente) ----------
+    def _pendientes_df(self, codigo=None) -> pd.DataFrame:
+        with self._cond:
+            registros = list(self._en_vuelo) + list(self._pendientes)
+        if codigo is not None:
+            codigo_norm = normalizar_codigo(codigo)
+            registros = [r for r in registros if normalizar_codigo(r.get("codigo")) == codigo_norm]
+        df = pd.DataFrame(registros)
+        if not df.empty:
+            df["codigo_ue_norm"] = [normalizar_codigo(c) for c in df["codigo"]]
+        return df
+
+    def leer_todo(self) -> pd.DataFrame:
+        pendientes = self._pendientes_df()
+        return _combinar(self.store.leer_todo(), pendientes)
+
+    def leer_por_anio(self, anios) -> pd.DataFrame:
+        pendientes = filtrar_anios(self._pendientes_df(), anios)
+        return _combinar(self.store.leer_por_anio(anios), pendientes)
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        pendientes = self._pendientes_df(codigo)
+        df = self.store.buscar_por_codigo(codigo)
+        if pendientes.empty:
+            return df
+        return ordenar_por_fecha(_combinar(df, pendientes))
+
+    def ultimo_registro(self, codigo):
+        if self._pendientes_df(codigo).empty:
+            return self.store.ultimo_registro(codigo)
+        return super().ultimo_registro(codigo)
+
+    def contar_por_codigo(self, codigo) -> int:
+        if self._pendientes_df(codigo).empty:
+            return self.store.contar_por_codigo(codigo)
+        return len(self.buscar_por_codigo(codigo))   # un upsert pendiente puede no sumar filas
+
+    def pagina_por_codigo(self, codigo, limite: int = 5, desplazamiento: int = 0,
+                          ordenar_por: str = "fecha_recepcion", descendente: bool = True) -> pd.DataFrame:
+        if self._pendientes_df(codigo).empty:
+            return self.store.pagina_por_codigo(codigo, limite, desplazamiento, ordenar_por, descendente)
+        return super().pagina_por_codigo(codigo, limite, desplazamiento, ordenar_por, descendente)
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        """
+        Encola el upsert (retorna sin escribir en el store). El resultado se
+        anticipa con la clave natural contra lo volcado y lo pendiente del pliego.
+        """
+        df, partes = registro_con_clave(nuevo)
+        if partes is None:
+            self._encolar(nuevo)
+            return False
+        existentes = self.buscar_por_codigo(nuevo["codigo"])
+        reemplaza = (
+            not existentes.empty
+            and bool((calcular_clave_natural(existentes) == calcular_clave_natural(df).iloc[0]).any())
+        )
+        self._encolar({**nuevo, CAMPO_OPERACION: "upsert"})
+        return reemplaza
+
+    def importar_excel(self, path: str) -> int:
+        self.volcar()
+        return self.store.importar_excel(path)
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        self.volcar()
+        return self.store.reemplazar_por_clave(df, claves_eliminar)
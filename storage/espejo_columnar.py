@@ -0,0 +1,152 @@
+# ============================================
+# storage/espejo_columnar.py
+# ============================================
+import os
+import sys
+
+import pandas as pd
+
+from core.trazas import contar_cache, tramo
+from storage.archivos import bloqueo_exclusivo, escritura_atomica
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:   # sin pyarrow: se lee siempre el Excel
+    pa = None
+    feather = None
+
+# Columnas de baja cardinalidad que se guardan como categóricas en el espejo
+COLUMNAS_CATEGORICAS = [
+    "NG",
+    "sector",
+    "Responsable_Institucional",
+    "estado",
+    "vigencia",
+    "tipo_pei",
+    "etapa_revision",
+]
+
+
+def ruta_espejo(xlsx_path: str) -> str:
+    """data/unidades_ejecutoras.xlsx -> data/unidades_ejecutoras.feather"""
+    return os.path.splitext(xlsx_path)[0] + ".feather"
+
+
+def espejo_vigente(xlsx_path: str, espejo_path: str = None) -> bool:
+    """True si el espejo existe y es igual o más reciente que el Excel."""
+    espejo_path = espejo_path or ruta_espejo(xlsx_path)
+    if feather is None or not os.path.exists(espejo_path):
+        return False
+    if not os.path.exists(xlsx_path):
+        return True
+    return os.path.getmtime(espejo_path) >= os.path.getmtime(xlsx_path)
+
+
+def tipar_para_arrow(df: pd.DataFrame, categoricas=COLUMNAS_CATEGORICAS) -> pd.DataFrame:
+    """
+    Deja el DataFrame con tipos que Arrow pueda guardar sin ambigüedad.
+
+    - Columnas de `categoricas` presentes -> category
+    - Columnas object con tipos mezclados (p. ej. fechas y texto) -> texto, conservando nulos
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        serie = df[col]
+        if serie.dtype == object:
+            tipo = pd.api.types.infer_dtype(serie, skipna=True)
+            if tipo not in ("string", "empty"):
+                serie = serie.where(serie.isna(), serie.astype(str))
+        if col in categoricas and not isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype("category")
+        df[col] = serie
+    return df
+
+
+def escribir_espejo(df: pd.DataFrame, espejo_path: str) -> None:
+    """Escribe el espejo Feather sin compresión (apto para memory-map) de forma atómica."""
+    if feather is None:
+        raise ImportError("Se requiere pyarrow para escribir el espejo columnar.")
+    tabla = pa.Table.from_pandas(tipar_para_arrow(df), preserve_index=False)
+    with escritura_atomica(espejo_path) as tmp_path:
+        feather.write_feather(tabla, tmp_path, compression="uncompressed")
+
+
+def leer_espejo(espejo_path: str, columnas=None, memory_map: bool = True) -> pd.DataFrame:
+    """Lee el espejo; con `memory_map=True` Arrow mapea el archivo en vez de copiarlo."""
+    if feather is None:
+        raise ImportError("Se requiere pyarrow para leer el espejo columnar.")
+    tabla = feather.read_table(espejo_path, columns=columnas, memory_map=memory_map)
+    return tabla.to_pandas()
+
+
+def invalidar_espejo(xlsx_path: str) -> None:
+    """
+    Descarta el espejo tras reescribir el Excel (p. ej. un guardado): O(1), sin
+    reescribirlo. La próxima lectura en frío lo reconstruye (cargar_con_espejo).
+    """
+    espejo_path = ruta_espejo(xlsx_path)
+    with bloqueo_exclusivo(espejo_path):
+        try:
+            os.remove(espejo_path)
+        except FileNotFoundError:
+            pass
+
+
+def sincronizar_espejo(xlsx_path: str, preparar=None, espejo_path: str = None, usecols=None) -> pd.DataFrame:
+    """
+    Lee el Excel, aplica `preparar(df) -> df` (adapter/limpieza) y reescribe el espejo.
+    `usecols` (como en pd.read_excel) limita las columnas que se parsean.
+    Retorna el DataFrame preparado.
+    """
+    espejo_path = espejo_path or ruta_espejo(xlsx_path)
+    df = pd.read_excel(xlsx_path, engine="openpyxl", usecols=usecols)
+    if preparar is not None:
+        df = preparar(df)
+    if feather is not None:
+        with bloqueo_exclusivo(espejo_path):
+            escribir_espejo(df, espejo_path)
+    return df
+
+
+def cargar_con_espejo(
+    xlsx_path: str, preparar=None, columnas=None, memory_map: bool = True, usecols=None
+) -> pd.DataFrame:
+    """
+    Loader que prefiere el espejo columnar si está vigente; si no, lo reconstruye
+    desde el Excel. Sin pyarrow, equivale a leer el Excel y aplicar `preparar`.
+    """
+    espejo_path = ruta_espejo(xlsx_path)
+    if espejo_vigente(xlsx_path, espejo_path):
+        try:
+            with tramo("espejo.lectura"):
+                df = leer_espejo(espejo_path, columnas=columnas, memory_map=memory_map)
+            contar_cache("espejo_columnar", True)
+            return df
+        except Exception:
+            pass   # espejo corrupto o de otra versión: se reconstruye
+
+    contar_cache("espejo_columnar", False)
+    with tramo("excel.lectura"):
+        df = sincronizar_espejo(xlsx_path, preparar=preparar, espejo_path=espejo_path, usecols=usecols)
+    if feather is not None:
+        df = tipar_para_arrow(df)
+    return df[columnas] if columnas is not None else df
+
+
+if __name__ == "__main__":
+    # Paso de build/sync: python -m storage.espejo_columnar [xlsx ...]
+    from adapters.historial_sharepoint import usar_columna
+    from storage.historial_store import preparar_historial
+    from storage.unidades_ejecutoras import preparar_unidades_ejecutoras
+
+    preparadores = {
+        "unidades_ejecutoras": (preparar_unidades_ejecutoras, None),
+        "historial_it_pei": (preparar_historial, usar_columna),
+    }
+    rutas = sys.argv[1:] or ["data/unidades_ejecutoras.xlsx", "data/historial_it_pei.xlsx"]
+    for ruta in rutas:
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        preparar, usecols = preparadores.get(nombre, (None, None))
+        df = sincronizar_espejo(ruta, preparar=preparar, usecols=usecols)
+        print(f"{ruta} -> {ruta_espejo(ruta)} ({len(df)} filas)")
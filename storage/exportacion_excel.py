@@ -0,0 +1,59 @@
+# ============================================
+# storage/exportacion_excel.py
+# ============================================
+import pandas as pd
+from openpyxl import Workbook
+
+from core.trazas import tramo
+from storage.archivos import escritura_atomica
+
+# Filas que se convierten a valores nativos de una vez (acota la memoria por lote)
+TAMANO_LOTE_ESCRITURA = 10_000
+
+
+def _celdas(serie: pd.Series) -> list:
+    """Columna -> valores nativos de Python que openpyxl escribe directo (nulos -> None)."""
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def _lotes(datos):
+    """Un DataFrame o un iterable de DataFrames -> iterable de DataFrames."""
+    return [datos] if isinstance(datos, pd.DataFrame) else datos
+
+
+def escribir_hojas(path: str, hojas: dict, tamano_lote: int = TAMANO_LOTE_ESCRITURA) -> int:
+    """
+    Escribe un .xlsx en modo write-only de openpyxl (escritura atómica).
+
+    - `hojas`: {nombre: DataFrame o iterable de DataFrames con las mismas columnas}
+    - Las filas se vuelcan al archivo a medida que se agregan: no se arma el
+      libro completo en memoria (a diferencia de DataFrame.to_excel)
+    - Cada lote se convierte por columnas a valores nativos, no celda a celda
+    - Retorna el total de filas escritas
+    """
+    wb = Workbook(write_only=True)
+    total = 0
+    with tramo("excel.escritura_streaming"):
+        for nombre, datos in hojas.items():
+            ws = wb.create_sheet(title=str(nombre)[:31])
+            encabezado = None
+            for lote in _lotes(datos):
+                if encabezado is None:
+                    encabezado = list(lote.columns)
+                    ws.append([str(c) for c in encabezado])
+                if list(lote.columns) != encabezado:
+                    lote = lote.reindex(columns=encabezado)
+                for inicio in range(0, len(lote), tamano_lote):
+                    parte = lote.iloc[inicio:inicio + tamano_lote]
+                    for fila in zip(*(_celdas(parte.iloc[:, i]) for i in range(parte.shape[1]))):
+                        ws.append(fila)
+                    total += len(parte)
+
+        with escritura_atomica(path) as tmp_path:
+            wb.save(tmp_path)
+    return total
+
+
+def escribir_xlsx(path: str, datos, hoja: str = "historial") -> int:
+    """Un DataFrame (o lotes) a un libro de una sola hoja. Retorna las filas escritas."""
+    return escribir_hojas(path, {hoja: datos})
@@ -0,0 +1,472 @@
+# ============================================
+# storage/historial_particionado.py
+# ============================================
+"""
+Historial particionado por año (y opcionalmente por sector o NG de la UE).
+
+    <directorio>/vigente/anio=2025/sector=Salud/parte-<ns>-<id>.parquet
+    <directorio>/archivo/anio=2019/sector=Salud/parte-<ns>-<id>.parquet
+
+Cada guardado agrega un Parquet pequeño en la partición de sus filas; las
+consultas por año o por pliego solo listan y abren las carpetas que les
+corresponden. Los años cerrados se pueden pasar a `archivo/` (compactados y
+con zstd), fuera del área de escritura.
+
+    python -m storage.historial_particionado importar data/historial_it_pei.xlsx
+    python -m storage.historial_particionado archivar --hasta 2022
+    python -m storage.historial_particionado compactar
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+from adapters.historial_sharepoint import normalizar_codigo, normalizar_codigo_serie
+from core.trazas import contar_cache, tramo
+from storage.archivos import bloqueo_exclusivo, escritura_atomica
+from storage.historial_store import (
+    COLUMNAS_BASE,
+    HistorialStore,
+    anio_de_registro,
+    calcular_clave_natural,
+    firma_archivo,
+    leer_excel_historial,
+    ordenar_por_fecha,
+    preparar_historial,
+    registro_con_clave,
+    valor_texto,
+)
+from storage.unidades_ejecutoras import (
+    construir_indice_unidades,
+    leer_unidades_ejecutoras,
+    version_unidades_ejecutoras,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:   # sin pyarrow: el backend particionado no está disponible
+    pa = None
+    pc = None
+    pq = None
+
+CAMPO_ANIO = "anio"
+DIMENSIONES_UE = ("sector", "NG")
+VIGENTE = "vigente"
+ARCHIVO = "archivo"
+# Compresión por área: rápida para lo que se escribe seguido, densa para lo archivado
+COMPRESION = {VIGENTE: "snappy", ARCHIVO: "zstd"}
+SIN_DATO = "(sin dato)"
+NULO_HIVE = "__HIVE_DEFAULT_PARTITION__"
+# Tablas Arrow de partes ya leídas que se conservan por proceso
+CACHE_PARTES_BYTES = 64 * 1024 * 1024
+
+
+def info_unidades_local():
+    """(versión, info_por_codigo) leyendo unidades_ejecutoras.xlsx (CLIs y procesos sin la app)."""
+    version = version_unidades_ejecutoras()
+    return version, _indice_local(version).info_por_codigo
+
+
+@lru_cache(maxsize=1)
+def _indice_local(version):
+    return construir_indice_unidades(leer_unidades_ejecutoras())
+
+
+def _tabla_texto(df: pd.DataFrame):
+    """Filas -> tabla Arrow con COLUMNAS_BASE como texto (mismo criterio que Postgres)."""
+    datos = df.reindex(columns=COLUMNAS_BASE)
+    return pa.table({c: pa.array([valor_texto(v) for v in datos[c]], type=pa.string()) for c in COLUMNAS_BASE})
+
+
+def _nombre_parte() -> str:
+    # El prefijo en ns mantiene el orden de escritura dentro de cada partición
+    return f"parte-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+
+
+def _valor_segmento(nombre: str, campo: str):
+    """'anio=2024' -> '2024'; None para la partición nula; False si la carpeta no es de `campo`."""
+    prefijo = f"{campo}="
+    if not nombre.startswith(prefijo):
+        return False
+    valor = unquote(nombre[len(prefijo):])
+    return None if valor == NULO_HIVE else valor
+
+
+def _listar(carpeta: str) -> list:
+    try:
+        return sorted(e.name for e in os.scandir(carpeta) if e.is_dir())
+    except FileNotFoundError:
+        return []
+
+
+def _a_dataframe(tablas: list, codigos=None) -> pd.DataFrame:
+    """Tablas de partes -> DataFrame con COLUMNAS_BASE, filtrado por codigo_ue_norm en Arrow."""
+    if not tablas:
+        return pd.DataFrame(columns=COLUMNAS_BASE)
+    tabla = pa.concat_tables(tablas, promote_options="default")
+    if codigos is not None:
+        tabla = tabla.filter(pc.is_in(tabla["codigo_ue_norm"], value_set=pa.array(sorted(codigos), pa.string())))
+    return tabla.to_pandas().reindex(columns=COLUMNAS_BASE)
+
+
+class _CachePartes:
+    """
+    Tablas Arrow de las partes leídas, validadas por (mtime, tamaño) igual que la
+    caché del Excel: una parte reescrita se vuelve a leer. LRU acotada por bytes.
+    Abrir un Parquet cuesta más que filtrarlo en memoria, y las partes cambian poco.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_PARTES_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._tablas = OrderedDict()   # ruta -> (firma, tabla)
+        self._bytes = 0
+
+    def leer(self, ruta: str):
+        # Firma ANTES de leer: si la parte cambia en medio, la próxima lectura la relee
+        firma = firma_archivo(ruta)
+        if firma is None:
+            raise FileNotFoundError(ruta)
+        with self._lock:
+            entrada = self._tablas.get(ruta)
+            if entrada is not None and entrada[0] == firma:
+                self._tablas.move_to_end(ruta)
+                contar_cache("partes_historial", True)
+                return entrada[1]
+        contar_cache("partes_historial", False)
+        tabla = pq.read_table(ruta)
+        with self._lock:
+            anterior = self._tablas.pop(ruta, None)
+            if anterior is not None:
+                self._bytes -= anterior[1].nbytes
+            self._tablas[ruta] = (firma, tabla)
+            self._bytes += tabla.nbytes
+            while self._bytes > self.max_bytes and len(self._tablas) > 1:
+                _, (_, vieja) = self._tablas.popitem(last=False)
+                self._bytes -= vieja.nbytes
+        return tabla
+
+    def descartar(self, ruta: str) -> None:
+        with self._lock:
+            anterior = self._tablas.pop(ruta, None)
+            if anterior is not None:
+                self._bytes -= anterior[1].nbytes
+
+
+class ParticionadoHistorialStore(HistorialStore):
+    """
+    Almacén del historial en Parquet con particiones estilo Hive.
+
+    - Partición por año (columna 'año'; si falta, año de fecha_recepcion) y,
+      con `dimension_ue` ("sector" o "NG"), por esa dimensión de la UE según
+      `proveedor_info_ue() -> (version, info_por_codigo)`
+    - leer(anios=..., codigos=...) poda particiones antes de listar archivos:
+      el año en curso o un pliego no abren el resto del historial
+    - agregar/agregar_lote escriben una parte nueva por partición (no reescriben)
+    - Upsert y reemplazar_por_clave reescriben solo las partes que contienen las
+      filas afectadas (reemplazo atómico de cada archivo)
+    - archivar(hasta) mueve los años cerrados a `archivo/`; las lecturas los
+      siguen viendo salvo incluir_archivo=False
+    - Todas las columnas se guardan como texto; los escritores se serializan con
+      un lock entre procesos y los lectores no bloquean
+    - Las partes leídas quedan en una caché por proceso validada por (mtime, tamaño)
+    - Si un pliego cambia de sector/NG, compactar() lo reubica
+    """
+
+    def __init__(self, directorio: str, dimension_ue: str = "", proveedor_info_ue=None, seed_xlsx: str = None,
+                 cache_bytes: int = CACHE_PARTES_BYTES):
+        if pa is None:
+            raise ImportError("El backend 'particionado' requiere pyarrow.")
+        if dimension_ue and dimension_ue not in DIMENSIONES_UE:
+            raise ValueError(
+                f"Dimensión de partición desconocida: {dimension_ue!r} (usa {', '.join(DIMENSIONES_UE)} o vacío)."
+            )
+        self.directorio = os.path.abspath(directorio)
+        self.dimension_ue = dimension_ue or None
+        self.proveedor_info_ue = proveedor_info_ue or info_unidades_local
+        self._info = None   # (versión, codigo_norm -> valor de la dimensión)
+        self._cache = _CachePartes(cache_bytes)
+        os.makedirs(self._raiz(VIGENTE), exist_ok=True)
+
+        if seed_xlsx and os.path.exists(seed_xlsx):
+            with self._bloqueo():
+                if self._vacio():
+                    self._escribir(preparar_historial(leer_excel_historial(seed_xlsx)))
+
+    # ---------- particiones ----------
+    def _raiz(self, area: str) -> str:
+        return os.path.join(self.directorio, area)
+
+    def _bloqueo(self):
+        return bloqueo_exclusivo(os.path.join(self.directorio, "escritura"))
+
+    def _valores_ue(self, codigos: pd.Series) -> pd.Series:
+        """codigo_ue_norm -> valor de la dimensión de partición (SIN_DATO si la UE no está)."""
+        version, info = self.proveedor_info_ue()
+        if self._info is None or self._info[0] != version:
+            mapa = {}
+            for codigo, datos in info.items():
+                valor = str(datos.get(self.dimension_ue) or "").strip()
+                mapa[normalizar_codigo(codigo)] = valor if valor and valor.lower() != "nan" else SIN_DATO
+            self._info = (version, mapa)
+        mapa = self._info[1]
+        return pd.Series([mapa.get(c, SIN_DATO) for c in codigos.astype(str)], index=codigos.index, dtype=object)
+
+    def _carpetas(self, df: pd.DataFrame, area: str) -> pd.Series:
+        """Carpeta de partición de cada fila."""
+        anios = anio_de_registro(df)
+        carpetas = pd.Series(
+            [f"{CAMPO_ANIO}={NULO_HIVE if pd.isna(a) else int(a)}" for a in anios], index=df.index, dtype=object
+        )
+        if self.dimension_ue:
+            valores = self._valores_ue(df["codigo_ue_norm"])
+            carpetas = carpetas + os.sep + f"{self.dimension_ue}=" + valores.map(lambda v: quote(v, safe=""))
+        return self._raiz(area) + os.sep + carpetas
+
+    def _partes(self, areas, anios=None, valores_ue=None) -> list:
+        """
+        [(area, carpeta, anio, [archivos])] de las particiones que pasan la poda.
+        Solo se listan las carpetas de los años (y valores de la dimensión) pedidos.
+        """
+        anios = None if anios is None else {None if a is None else int(a) for a in anios}
+        partes = []
+        for area in areas:
+            raiz = self._raiz(area)
+            for nombre in _listar(raiz):
+                valor = _valor_segmento(nombre, CAMPO_ANIO)
+                if valor is False:
+                    continue
+                anio = None if valor is None else int(valor)
+                if anios is not None and anio not in anios:
+                    continue
+                carpetas = [os.path.join(raiz, nombre)]
+                if self.dimension_ue:
+                    carpetas = [
+                        os.path.join(carpetas[0], sub) for sub in _listar(carpetas[0])
+                        if _valor_segmento(sub, self.dimension_ue) is not False
+                        and (valores_ue is None or _valor_segmento(sub, self.dimension_ue) in valores_ue)
+                    ]
+                for carpeta in carpetas:
+                    archivos = sorted(
+                        os.path.join(carpeta, f) for f in os.listdir(carpeta)
+                        if f.endswith(".parquet") and not f.startswith((".", "_"))
+                    )
+                    if archivos:
+                        partes.append((area, carpeta, anio, archivos))
+        return partes
+
+    def _vacio(self) -> bool:
+        return not self._partes((VIGENTE, ARCHIVO))
+
+    # ---------- lectura ----------
+    def _tablas(self, partes) -> list:
+        return [self._cache.leer(ruta) for parte in partes for ruta in parte[3]]
+
+    def leer(self, anios=None, codigos=None, incluir_archivo: bool = True) -> pd.DataFrame:
+        """
+        Historial filtrado con poda de particiones.
+
+        - `anios`: años a leer (None = todos); solo se abren esas carpetas
+        - `codigos`: pliegos a leer; con partición por sector/NG solo se abren
+          las carpetas de la dimensión de esos pliegos
+        - `incluir_archivo=False`: ignora los años archivados
+        """
+        areas = (VIGENTE, ARCHIVO) if incluir_archivo else (VIGENTE,)
+        codigos_norm = None
+        valores_ue = None
+        if codigos is not None:
+            codigos_norm = {normalizar_codigo(c) for c in codigos}
+            if self.dimension_ue:
+                valores_ue = set(self._valores_ue(pd.Series(sorted(codigos_norm), dtype=object)))
+        with tramo("historial.lectura_particiones"):
+            for intento in range(3):
+                try:
+                    tablas = self._tablas(self._partes(areas, anios, valores_ue))
+                    break
+                except FileNotFoundError:
+                    # Una compactación borró partes entre el listado y la lectura: se vuelve a listar
+                    if intento == 2:
+                        raise
+            return _a_dataframe(tablas, codigos_norm)
+
+    def leer_todo(self) -> pd.DataFrame:
+        return self.leer()
+
+    def leer_por_anio(self, anios) -> pd.DataFrame:
+        return self.leer(anios=anios)
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        return ordenar_por_fecha(self.leer(codigos=[codigo]))
+
+    # ---------- escritura ----------
+    def _escribir_archivo(self, ruta: str, tabla, area: str) -> None:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with escritura_atomica(ruta) as tmp_path:
+            pq.write_table(tabla, tmp_path, compression=COMPRESION[area])
+
+    def _escribir(self, df: pd.DataFrame, area: str = VIGENTE) -> int:
+        """Una parte nueva por partición presente en `df`. Retorna las filas escritas."""
+        if df.empty:
+            return 0
+        df = df.reset_index(drop=True)
+        for carpeta, idx in df.groupby(self._carpetas(df, area), sort=False).groups.items():
+            self._escribir_archivo(os.path.join(carpeta, _nombre_parte()), _tabla_texto(df.loc[idx]), area)
+        return len(df)
+
+    def _reescribir(self, codigos, quitar, df: pd.DataFrame) -> int:
+        """
+        Quita de las partes de `codigos` las filas donde `quitar(DataFrame) -> máscara`
+        es verdadera y escribe `df`.
+
+        - Cada parte afectada se reemplaza de forma atómica
+        - Las filas de `df` de la misma partición entran en ese mismo reemplazo
+          (un upsert sin cambio de año/sector nunca deja la fila ausente ni duplicada)
+        - Retorna las filas quitadas
+        """
+        df = df.reset_index(drop=True)
+        carpetas = self._carpetas(df, VIGENTE) if not df.empty else pd.Series(dtype=object)
+        pendientes = set(carpetas)
+        valores_ue = set(self._valores_ue(pd.Series(sorted(codigos), dtype=object))) if self.dimension_ue else None
+        quitadas = 0
+        for area, carpeta, _, archivos in self._partes((VIGENTE, ARCHIVO), valores_ue=valores_ue):
+            for ruta in archivos:
+                tabla = self._cache.leer(ruta)
+                if not pc.any(pc.is_in(tabla["codigo_ue_norm"], value_set=pa.array(sorted(codigos), pa.string()))).as_py():
+                    continue
+                mascara = quitar(tabla.to_pandas())
+                if not mascara.any():
+                    continue
+                quitadas += int(mascara.sum())
+                tabla = tabla.filter(pa.array(~mascara))
+                if carpeta in pendientes:
+                    tabla = pa.concat_tables([tabla, _tabla_texto(df[carpetas == carpeta])], promote_options="default")
+                    pendientes.discard(carpeta)
+                if tabla.num_rows:
+                    self._escribir_archivo(ruta, tabla, area)
+                else:
+                    os.remove(ruta)
+                    self._cache.descartar(ruta)
+        self._escribir(df[carpetas.isin(pendientes)] if not df.empty else df)
+        return quitadas
+
+    def agregar(self, nuevo: dict) -> None:
+        self.agregar_lote([nuevo])
+
+    def agregar_lote(self, nuevos: list) -> int:
+        if not nuevos:
+            return 0
+        df = pd.DataFrame(nuevos)
+        df["codigo_ue_norm"] = normalizar_codigo_serie(df["codigo"])
+        with self._bloqueo():
+            return self._escribir(df)
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        """Quita las filas del pliego con la misma clave natural y escribe `nuevo`, bajo el lock."""
+        df, partes = registro_con_clave(nuevo)
+        if partes is None:
+            with self._bloqueo():
+                self._escribir(df)
+            return False
+        clave = calcular_clave_natural(df).iloc[0]
+        with self._bloqueo():
+            quitadas = self._reescribir(
+                {df["codigo_ue_norm"].iloc[0]}, lambda parte: (calcular_clave_natural(parte) == clave).to_numpy(), df
+            )
+        return quitadas > 0
+
+    def importar_excel(self, path: str) -> int:
+        """Importa un Excel (formato SharePoint o el generado por la app) repartido en sus particiones."""
+        df = preparar_historial(leer_excel_historial(path))
+        with self._bloqueo():
+            return self._escribir(df)
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        claves = set(claves_eliminar) | (set(df["clave_sync"].dropna()) if not df.empty else set())
+        with self._bloqueo():
+            if claves:
+                # La clave empieza por codigo_ue_norm: solo se revisan las partes de esos pliegos
+                codigos = {str(c).split("|", 1)[0] for c in claves}
+                self._reescribir(codigos, lambda parte: parte["clave_sync"].isin(claves).to_numpy(), df)
+            else:
+                self._escribir(df)
+        return len(df)
+
+    # ---------- mantenimiento ----------
+    def _mover(self, partes, destino: str) -> dict:
+        """Reescribe cada partición de `partes` en `destino` (una parte por partición) y borra las originales."""
+        filas = 0
+        for parte in partes:
+            _, carpeta, _, archivos = parte
+            df = _a_dataframe(self._tablas([parte]))
+            filas += self._escribir(df, destino)
+            for ruta in archivos:
+                os.remove(ruta)
+                self._cache.descartar(ruta)
+            for vacia in (carpeta, os.path.dirname(carpeta)):
+                if vacia != self._raiz(VIGENTE) and vacia != self._raiz(ARCHIVO) and not os.listdir(vacia):
+                    os.rmdir(vacia)
+        return {"particiones": len(partes), "archivos": sum(len(p[3]) for p in partes), "filas": filas}
+
+    def archivar(self, hasta_anio: int) -> dict:
+        """
+        Mueve a `archivo/` los años <= `hasta_anio` (compactados, zstd). Las filas
+        sin año quedan vigentes. Pensado para correr fuera de horario: mientras se
+        mueve una partición, un lector puede ver sus filas repetidas un instante.
+        """
+        with self._bloqueo():
+            partes = [p for p in self._partes((VIGENTE,)) if p[2] is not None and p[2] <= int(hasta_anio)]
+            return self._mover(partes, ARCHIVO)
+
+    def compactar(self) -> dict:
+        """
+        Junta las partes vigentes en un archivo por partición y reubica los pliegos
+        cuyo sector/NG cambió en unidades_ejecutoras. Mismas salvedades que archivar().
+        """
+        with self._bloqueo():
+            return self._mover(self._partes((VIGENTE,)), VIGENTE)
+
+    def anios(self, incluir_archivo: bool = True) -> list:
+        """Años con datos (listado de carpetas, sin abrir archivos)."""
+        areas = (VIGENTE, ARCHIVO) if incluir_archivo else (VIGENTE,)
+        return sorted({p[2] for p in self._partes(areas) if p[2] is not None})
+
+
+def main(argv=None) -> int:
+    from core import config
+
+    parser = argparse.ArgumentParser(prog="python -m storage.historial_particionado", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--directorio", default=config.HISTORIAL_PARTICIONES_DIR)
+    parser.add_argument("--dimension", default=config.HISTORIAL_PARTICION_UE, help="sector, NG o vacío (solo año)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("importar", help="Reparte un Excel de historial en particiones")
+    p.add_argument("libro")
+    p = sub.add_parser("archivar", help="Mueve los años cerrados a archivo/")
+    p.add_argument("--hasta", type=int, required=True, help="Último año a archivar (inclusive)")
+    sub.add_parser("compactar", help="Una parte por partición vigente")
+    args = parser.parse_args(argv)
+
+    store = ParticionadoHistorialStore(args.directorio, dimension_ue=args.dimension)
+    inicio = time.perf_counter()
+    if args.comando == "importar":
+        print(f"filas: {store.importar_excel(args.libro)}")
+    elif args.comando == "archivar":
+        for clave, valor in store.archivar(args.hasta).items():
+            print(f"{clave}: {valor}")
+    else:
+        for clave, valor in store.compactar().items():
+            print(f"{clave}: {valor}")
+    print(f"segundos: {time.perf_counter() - inicio:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
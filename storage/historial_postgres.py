@@ -0,0 +1,209 @@
+# ============================================
+# storage/historial_postgres.py
+# ============================================
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+from adapters.historial_sharepoint import normalizar_codigo, normalizar_codigo_serie
+from storage.historial_store import (
+    COLUMNAS_BASE,
+    HistorialStore,
+    condicion_clave_natural,
+    leer_excel_historial,
+    preparar_historial,
+    registro_con_clave,
+    validar_orden,
+    valor_texto,
+)
+
+TABLA_POSTGRES = "historial_it_pei"
+TAMANO_LOTE_INSERT = 1000
+
+# Diferencias mínimas de SQL entre Postgres y el sustituto local (SQLite)
+DIALECTOS = {
+    "postgres": {"marcador": "%s", "id": "BIGSERIAL PRIMARY KEY"},
+    "sqlite": {"marcador": "?", "id": "INTEGER PRIMARY KEY AUTOINCREMENT"},
+}
+
+
+def crear_pool_postgres(dsn: str, min_size: int = 1, max_size: int = 10):
+    """
+    Pool de conexiones (psycopg 3). Crearlo una vez por proceso y compartirlo
+    entre sesiones (en la app: dentro de un st.cache_resource).
+    Sirve para Supabase usando la cadena de conexión Postgres del proyecto.
+    """
+    try:
+        from psycopg_pool import ConnectionPool
+    except ImportError as e:
+        raise ImportError(
+            "El backend 'postgres' requiere psycopg y psycopg_pool "
+            "(pip install 'psycopg[binary,pool]')."
+        ) from e
+    return ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True)
+
+
+class PoolSQLite:
+    """
+    Sustituto local del pool de Postgres (misma interfaz `connection()`),
+    para probar PostgresHistorialStore sin un servidor.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # ':memory:' solo persiste mientras viva una conexión: se reutiliza una
+        self._memoria = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+
+    @contextmanager
+    def connection(self):
+        con = self._memoria or sqlite3.connect(self.path, timeout=30)
+        try:
+            yield con
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            if self._memoria is None:
+                con.close()
+
+
+class PostgresHistorialStore(HistorialStore):
+    """
+    Almacén del historial en Postgres (o Supabase) sobre un pool compartido.
+
+    - Esquema fijo: las columnas estándar de la app, todas TEXT (las claves
+      desconocidas de un registro se ignoran)
+    - Filtro por código en el servidor, con índice (codigo_ue_norm, fecha_recepcion)
+    - Inserciones en lote con executemany, en bloques de TAMANO_LOTE_INSERT
+    - `dialecto="sqlite"` + PoolSQLite permite probarlo localmente
+    """
+
+    def __init__(self, pool, dialecto: str = "postgres", tabla: str = TABLA_POSTGRES):
+        self.pool = pool
+        self.tabla = tabla
+        self.marcador = DIALECTOS[dialecto]["marcador"]
+        self.columnas = list(COLUMNAS_BASE)
+
+        columnas_sql = ", ".join(f'"{c}" TEXT' for c in self.columnas)
+        with self.pool.connection() as con:
+            cur = con.cursor()
+            cur.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.tabla} '
+                f'(id {DIALECTOS[dialecto]["id"]}, {columnas_sql})'
+            )
+            # Tablas creadas por versiones previas: agregar las columnas que falten
+            cur.execute(f"SELECT * FROM {self.tabla} LIMIT 0")
+            existentes = {d[0] for d in cur.description}
+            for c in self.columnas:
+                if c not in existentes:
+                    cur.execute(f'ALTER TABLE {self.tabla} ADD COLUMN "{c}" TEXT')
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_codigo_fecha "
+                f"ON {self.tabla} (codigo_ue_norm, fecha_recepcion)"
+            )
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_clave_sync ON {self.tabla} (clave_sync)")
+
+    # ---------- internos ----------
+    def _consultar(self, sql: str, params=()) -> pd.DataFrame:
+        with self.pool.connection() as con:
+            cur = con.cursor()
+            cur.execute(sql, params)
+            filas = cur.fetchall()
+            nombres = [d[0] for d in cur.description]
+        df = pd.DataFrame(filas, columns=nombres)
+        return df.drop(columns=["id"], errors="ignore")
+
+    def _insertar(self, df: pd.DataFrame, claves_borrar=()) -> int:
+        """INSERT por bloques; `claves_borrar` se eliminan antes, en la misma transacción."""
+        if df.empty and not claves_borrar:
+            return 0
+        df = df.reindex(columns=self.columnas)
+        columnas_sql = ", ".join(f'"{c}"' for c in self.columnas)
+        marcadores = ", ".join(self.marcador for _ in self.columnas)
+        sql = f"INSERT INTO {self.tabla} ({columnas_sql}) VALUES ({marcadores})"
+        filas = [tuple(valor_texto(v) for v in fila) for fila in df.itertuples(index=False, name=None)]
+
+        with self.pool.connection() as con:
+            cur = con.cursor()
+            if claves_borrar:
+                cur.executemany(
+                    f"DELETE FROM {self.tabla} WHERE clave_sync = {self.marcador}",
+                    [(c,) for c in claves_borrar],
+                )
+            for i in range(0, len(filas), TAMANO_LOTE_INSERT):
+                cur.executemany(sql, filas[i:i + TAMANO_LOTE_INSERT])
+        return len(filas)
+
+    # ---------- API ----------
+    def agregar(self, nuevo: dict) -> None:
+        self.agregar_lote([nuevo])
+
+    def agregar_lote(self, nuevos: list) -> int:
+        if not nuevos:
+            return 0
+        df = pd.DataFrame(nuevos)
+        df["codigo_ue_norm"] = normalizar_codigo_serie(df["codigo"])
+        return self._insertar(df)
+
+    def leer_todo(self) -> pd.DataFrame:
+        return self._consultar(f"SELECT * FROM {self.tabla} ORDER BY id")
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        return self._consultar(
+            f"SELECT * FROM {self.tabla} WHERE codigo_ue_norm = {self.marcador} "
+            f"ORDER BY fecha_recepcion NULLS FIRST, id",
+            (normalizar_codigo(codigo),),
+        )
+
+    def ultimo_registro(self, codigo):
+        df = self._consultar(
+            f"SELECT * FROM {self.tabla} WHERE codigo_ue_norm = {self.marcador} "
+            f"ORDER BY fecha_recepcion DESC NULLS LAST, id DESC LIMIT 1",
+            (normalizar_codigo(codigo),),
+        )
+        return None if df.empty else df.iloc[0]
+
+    def contar_por_codigo(self, codigo) -> int:
+        df = self._consultar(
+            f"SELECT COUNT(*) AS n FROM {self.tabla} WHERE codigo_ue_norm = {self.marcador}",
+            (normalizar_codigo(codigo),),
+        )
+        return int(df["n"].iloc[0])
+
+    def pagina_por_codigo(self, codigo, limite: int = 5, desplazamiento: int = 0,
+                          ordenar_por: str = "fecha_recepcion", descendente: bool = True) -> pd.DataFrame:
+        """LIMIT/OFFSET en el servidor, con el mismo orden de nulos que la implementación genérica."""
+        validar_orden(ordenar_por)
+        orden = "DESC NULLS LAST" if descendente else "NULLS FIRST"
+        direccion = "DESC" if descendente else ""
+        return self._consultar(
+            f'SELECT * FROM {self.tabla} WHERE codigo_ue_norm = {self.marcador} '
+            f'ORDER BY "{ordenar_por}" {orden}, id {direccion} '
+            f"LIMIT {self.marcador} OFFSET {self.marcador}",
+            (normalizar_codigo(codigo), int(limite), int(desplazamiento)),
+        )
+
+    def importar_excel(self, path: str) -> int:
+        return self._insertar(preparar_historial(leer_excel_historial(path)))
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        claves = set(claves_eliminar) | (set(df["clave_sync"]) if not df.empty else set())
+        return self._insertar(df, claves_borrar=sorted(claves))
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        """DELETE por clave natural + INSERT en una sola transacción del servidor."""
+        df, partes = registro_con_clave(nuevo)
+        if partes is None:
+            self._insertar(df)
+            return False
+        columnas_sql = ", ".join(f'"{c}"' for c in self.columnas)
+        marcadores = ", ".join(self.marcador for _ in self.columnas)
+        fila = tuple(valor_texto(v) for v in df.reindex(columns=self.columnas).iloc[0])
+        with self.pool.connection() as con:
+            cur = con.cursor()
+            cur.execute(f"DELETE FROM {self.tabla} WHERE {condicion_clave_natural(self.marcador)}", partes)
+            borradas = cur.rowcount
+            cur.execute(f"INSERT INTO {self.tabla} ({columnas_sql}) VALUES ({marcadores})", fila)
+        return borradas > 0
@@ -0,0 +1,738 @@
+# ============================================
+# storage/historial_store.py
+# ============================================
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from datetime import date, datetime
+
+import pandas as pd
+
+from core.formulario import canonizar_historial
+from core.trazas import contar_cache, tramo
+from storage.archivos import bloqueo_exclusivo
+from storage.espejo_columnar import cargar_con_espejo, espejo_vigente, invalidar_espejo
+from storage.exportacion_excel import escribir_xlsx
+from adapters.historial_sharepoint import (
+    MAP_HIST_SP_TO_STD,
+    adaptar_historial_sharepoint,
+    normalizar_codigo,
+    normalizar_codigo_serie,
+    usar_columna,
+)
+
+# Columnas estándar que siempre existen en el almacén (el resto se agrega al vuelo)
+COLUMNAS_BASE = ["codigo_ue_norm", "codigo", "nombre"] + [
+    c for c in MAP_HIST_SP_TO_STD.values() if c != "codigo"
+] + ["clave_sync"]
+
+TABLA_HISTORIAL = "historial"
+INDICE_CODIGO_FECHA = "idx_historial_codigo_fecha"
+INDICE_CLAVE_SYNC = "idx_historial_clave_sync"
+
+# Clave natural de un registro (upsert al guardar y compactación)
+COLUMNAS_CLAVE_NATURAL = ["codigo_ue_norm", "expediente", "numero_it", "fecha_recepcion"]
+
+# Columnas por las que se puede paginar el historial de un pliego
+COLUMNAS_ORDEN = ("fecha_recepcion", "fecha_it")
+
+# Desde este tamaño, una búsqueda por código sin caché ni espejo lee el libro por lotes
+UMBRAL_STREAMING_BYTES = 64 * 1024 * 1024
+
+
+def _valor_sqlite(v):
+    """Convierte un valor de pandas/numpy a un tipo nativo que SQLite acepte."""
+    if v is None:
+        return None
+    if isinstance(v, (pd.Timestamp, datetime)):
+        if pd.isna(v):
+            return None
+        if (v.hour, v.minute, v.second, v.microsecond) == (0, 0, 0, 0):
+            return v.date().isoformat()
+        return v.isoformat()
+    if isinstance(v, date):
+        return v.isoformat()
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(v, "item"):   # numpy.int64 -> int, numpy.float64 -> float
+        return v.item()
+    return v
+
+
+def valor_texto(v):
+    """Todas las columnas son TEXT: 2.0 -> '2', fechas -> ISO, nulos -> None."""
+    v = _valor_sqlite(v)
+    if v is None:
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _conversores_sqlite(columnas) -> list:
+    """
+    Conversor por columna para SQLite: las de la clave natural se guardan como texto
+    (igual que en Postgres y el particionado), para que el upsert compare texto con texto.
+    """
+    return [valor_texto if c in COLUMNAS_CLAVE_NATURAL else _valor_sqlite for c in columnas]
+
+
+def coalescer_columnas_duplicadas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Une columnas con el mismo nombre (p. ej. 'Id_UE' renombrada a 'codigo'
+    junto a una columna 'codigo' agregada por el formulario), tomando el
+    primer valor no nulo de cada fila.
+    """
+    if not df.columns.duplicated().any():
+        return df
+
+    unicas = {}
+    for col in dict.fromkeys(df.columns):
+        bloque = df.loc[:, df.columns == col]
+        unicas[col] = bloque.bfill(axis=1).iloc[:, 0] if bloque.shape[1] > 1 else bloque.iloc[:, 0]
+    return pd.DataFrame(unicas, index=df.index)
+
+
+def a_fecha(serie: pd.Series) -> pd.Series:
+    """
+    Columna de fechas -> datetime (inválidas -> NaT). Las columnas de texto pueden
+    mezclar formatos ('2024-01-02' del formulario, '2024-01-02 00:00:00' del Excel).
+    Vale para object y para el dtype `str` de pandas 3.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return pd.to_datetime(serie, errors="coerce", format="mixed")
+
+
+def ordenar_por_fecha(df: pd.DataFrame, columna: str = "fecha_recepcion") -> pd.DataFrame:
+    """Orden estable por `columna` ascendente (fechas inválidas/nulas al inicio)."""
+    if columna not in df.columns:
+        return df.reset_index(drop=True)
+    # argsort deja los NaT al final: el "último registro" sería uno sin fecha
+    orden = a_fecha(df[columna]).reset_index(drop=True).sort_values(kind="mergesort", na_position="first")
+    return df.iloc[orden.index].reset_index(drop=True)
+
+
+def anio_de_registro(df: pd.DataFrame) -> pd.Series:
+    """
+    Año de cada fila: la columna 'año'; si falta o no es numérica, el año de
+    fecha_recepcion. Nulo si no hay ninguno de los dos.
+    """
+    if "año" in df.columns:
+        anio = pd.to_numeric(df["año"], errors="coerce")
+    else:
+        anio = pd.Series(float("nan"), index=df.index)
+    if "fecha_recepcion" in df.columns:
+        anio = anio.fillna(a_fecha(df["fecha_recepcion"]).dt.year)
+    return anio.round().astype("Int64")
+
+
+def filtrar_anios(df: pd.DataFrame, anios) -> pd.DataFrame:
+    """Filas cuyo año (ver `anio_de_registro`) está en `anios`."""
+    return df[anio_de_registro(df).isin([int(a) for a in anios]).fillna(False).to_numpy(dtype=bool)]
+
+
+def validar_orden(ordenar_por: str) -> None:
+    """ValueError si `ordenar_por` no es una de COLUMNAS_ORDEN (va a SQL como nombre de columna)."""
+    if ordenar_por not in COLUMNAS_ORDEN:
+        raise ValueError(f"No se puede ordenar el historial por {ordenar_por!r} (usa {', '.join(COLUMNAS_ORDEN)}).")
+
+
+def firma_archivo(path: str):
+    """(mtime_ns, tamaño) del archivo; None si no existe."""
+    try:
+        st_ = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st_.st_mtime_ns, st_.st_size)
+
+
+class CacheHistorial:
+    """
+    Caché de historiales ya adaptados, compartida por todas las sesiones del proceso.
+
+    - Clave: ruta absoluta; cada entrada guarda la firma (mtime, tamaño) con la que se leyó
+    - Si la firma del archivo cambia (otro proceso lo editó), la entrada se descarta
+    - Memoria acotada: como máximo `max_entradas` archivos (LRU), una sola copia por archivo
+    - Los DataFrames entregados son compartidos: tratarlos como solo lectura
+    """
+
+    def __init__(self, max_entradas: int = 4):
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # ruta -> (firma, df)
+
+    def obtener(self, path: str):
+        ruta = os.path.abspath(path)
+        firma = firma_archivo(ruta)
+        with self._lock:
+            entrada = self._entradas.get(ruta)
+            if entrada is None or firma is None or entrada[0] != firma:
+                contar_cache("historial_excel", False)
+                return None
+            self._entradas.move_to_end(ruta)
+        contar_cache("historial_excel", True)
+        return entrada[1]
+
+    def guardar(self, path: str, df: pd.DataFrame, firma=None) -> None:
+        """`firma` debe tomarse ANTES de leer el archivo, para no asociar datos viejos a una firma nueva."""
+        ruta = os.path.abspath(path)
+        firma = firma if firma is not None else firma_archivo(ruta)
+        if firma is None:
+            return
+        with self._lock:
+            self._entradas[ruta] = (firma, df)
+            self._entradas.move_to_end(ruta)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, path: str) -> None:
+        with self._lock:
+            self._entradas.pop(os.path.abspath(path), None)
+
+
+_CACHE_EXCEL = CacheHistorial()
+
+
+def _texto_columna(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[col]
+    if col.startswith("fecha_"):
+        fechas = a_fecha(serie)
+        return fechas.dt.strftime("%Y-%m-%d").fillna("").astype(object)
+    return serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+
+
+def _clave_base(df: pd.DataFrame) -> pd.Series:
+    return (
+        df["codigo_ue_norm"].astype(str)
+        + "|" + _texto_columna(df, "expediente")
+        + "|" + _texto_columna(df, "numero_it")
+        + "|" + _texto_columna(df, "fecha_recepcion")
+    )
+
+
+def calcular_clave_sync(df: pd.DataFrame) -> pd.Series:
+    """
+    Clave estable de cada fila de SharePoint para la sincronización incremental:
+    Id_UE + Expediente, afinada con Número de I.T y Fecha de recepción (un mismo
+    expediente puede tener varias revisiones). Las repeticiones exactas se
+    distinguen con un correlativo ('#0', '#1', ...).
+    """
+    base = _clave_base(df)
+    return base + "#" + base.groupby(base, sort=False).cumcount().astype(str)
+
+
+def calcular_clave_natural(df: pd.DataFrame) -> pd.Series:
+    """
+    Clave natural de cada fila (COLUMNAS_CLAVE_NATURAL, como texto normalizado).
+    Vacía si la fila no tiene expediente ni N° de IT: no se puede identificar
+    y nunca se considera duplicada.
+    """
+    identificable = (_texto_columna(df, "expediente") != "") | (_texto_columna(df, "numero_it") != "")
+    return _clave_base(df).where(identificable, "")
+
+
+def registro_con_clave(nuevo: dict):
+    """
+    Registro del formulario -> (DataFrame de una fila con 'codigo_ue_norm' y
+    'clave_sync', partes de la clave natural) para el upsert. Las partes son
+    None si el registro no es identificable.
+    """
+    df = pd.DataFrame([nuevo])
+    df["codigo_ue_norm"] = normalizar_codigo_serie(df["codigo"])
+    clave = calcular_clave_natural(df).iloc[0]
+    if not clave:
+        return df, None
+    df["clave_sync"] = clave + "#0"
+    return df, tuple(_texto_columna(df, c).iloc[0] for c in COLUMNAS_CLAVE_NATURAL)
+
+
+def condicion_clave_natural(marcador: str) -> str:
+    """
+    WHERE de los backends SQL para la clave natural (mismos criterios que _texto_columna).
+    El formulario guarda las fechas vacías como 'None'.
+    """
+    return (
+        f"codigo_ue_norm = {marcador} "
+        f"AND COALESCE(TRIM(expediente), '') = {marcador} "
+        f"AND COALESCE(TRIM(numero_it), '') = {marcador} "
+        f"AND COALESCE(SUBSTR(NULLIF(fecha_recepcion, 'None'), 1, 10), '') = {marcador}"
+    )
+
+
+def leer_excel_historial(path_o_buffer) -> pd.DataFrame:
+    """Lee un Excel de historial parseando solo las columnas que usa la app."""
+    return pd.read_excel(path_o_buffer, engine="openpyxl", usecols=usar_columna)
+
+
+def preparar_historial(df_raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Excel crudo (SharePoint o app) -> historial estándar con 'codigo_ue_norm' y 'clave_sync',
+    y estado/vigencia/tipo_pei/etapa_revision ya canónicos (categóricas).
+    """
+    historial = coalescer_columnas_duplicadas(adaptar_historial_sharepoint(df_raw, copiar=False))
+    historial = canonizar_historial(historial)
+    historial["codigo_ue_norm"] = normalizar_codigo_serie(historial["codigo"])
+    return completar_clave_sync(historial)
+
+
+def completar_clave_sync(historial: pd.DataFrame) -> pd.DataFrame:
+    """Calcula 'clave_sync' de las filas que no la traen (libros con filas de distintos orígenes)."""
+    claves = calcular_clave_sync(historial)
+    if "clave_sync" in historial.columns:
+        existentes = historial["clave_sync"]
+        claves = existentes.where(existentes.notna() & (existentes.astype(str) != ""), claves)
+    historial["clave_sync"] = claves
+    return historial
+
+
+class HistorialStore:
+    """
+    Interfaz de almacenamiento del historial de IT PEI.
+
+    Toda implementación entrega y recibe registros con las columnas estándar
+    de la app (las que produce adaptar_historial_sharepoint).
+    """
+
+    def agregar(self, nuevo: dict) -> None:
+        raise NotImplementedError
+
+    def agregar_lote(self, nuevos: list) -> int:
+        """Guarda varios registros de una vez. Por defecto, uno por uno."""
+        for nuevo in nuevos:
+            self.agregar(nuevo)
+        return len(nuevos)
+
+    def leer_todo(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def leer_por_anio(self, anios) -> pd.DataFrame:
+        """
+        Filas de los años `anios`.
+        Implementación genérica: filtra el historial completo en memoria; el
+        backend particionado solo abre las particiones de esos años.
+        """
+        return filtrar_anios(self.leer_todo(), anios).reset_index(drop=True)
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        """
+        Devuelve solo las filas del pliego `codigo`, ordenadas por
+        fecha_recepcion ascendente (el último registro es la última fila).
+        Implementación genérica: filtra el historial completo en memoria.
+        """
+        historial = self.leer_todo()
+        return ordenar_por_fecha(historial[historial["codigo_ue_norm"] == normalizar_codigo(codigo)])
+
+    def ultimo_registro(self, codigo):
+        """Último registro (por fecha_recepcion) del pliego, o None si no hay historial."""
+        df = self.buscar_por_codigo(codigo)
+        return None if df.empty else df.iloc[-1]
+
+    def contar_por_codigo(self, codigo) -> int:
+        """Cantidad de registros del pliego."""
+        return len(self.buscar_por_codigo(codigo))
+
+    def pagina_por_codigo(
+        self,
+        codigo,
+        limite: int = 5,
+        desplazamiento: int = 0,
+        ordenar_por: str = "fecha_recepcion",
+        descendente: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Una página del historial del pliego: `limite` filas desde `desplazamiento`,
+        ordenadas por `ordenar_por` (una de COLUMNAS_ORDEN). En orden descendente
+        las fechas nulas van al final.
+        Implementación genérica: ordena en memoria; los backends SQL lo resuelven en el servidor.
+        """
+        validar_orden(ordenar_por)
+        df = ordenar_por_fecha(self.buscar_por_codigo(codigo), ordenar_por)
+        if descendente:
+            df = df.iloc[::-1]
+        return df.iloc[desplazamiento:desplazamiento + limite].reset_index(drop=True)
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        """
+        Guardado con upsert por clave natural (pliego, expediente, N° de IT y fecha
+        de recepción): si ya hay registros con esa clave se reemplazan por `nuevo`,
+        si no se agrega. Retorna True si reemplazó.
+        Implementación genérica: compara contra las filas del pliego y reemplaza
+        con reemplazar_por_clave; los backends SQL lo hacen en una transacción.
+        """
+        df, partes = registro_con_clave(nuevo)
+        if partes is None:
+            self.agregar(nuevo)
+            return False
+        existentes = self.buscar_por_codigo(nuevo["codigo"])
+        coincide = (
+            calcular_clave_natural(existentes) == calcular_clave_natural(df).iloc[0]
+            if not existentes.empty else pd.Series(False, index=existentes.index)
+        )
+        if not coincide.any():
+            self.agregar(nuevo)
+            return False
+        self.reemplazar_por_clave(df, claves_eliminar=existentes.loc[coincide, "clave_sync"].dropna())
+        return True
+
+    def importar_excel(self, path: str) -> int:
+        raise NotImplementedError
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        """
+        Upsert por 'clave_sync': elimina las filas cuya clave está en `df` o en
+        `claves_eliminar` e inserta `df` (ya preparado), en una sola operación.
+        """
+        raise NotImplementedError
+
+    def exportar_excel(self, path: str) -> None:
+        escribir_xlsx(path, self.leer_todo())
+
+
+class ExcelHistorialStore(HistorialStore):
+    """
+    Almacén sobre un único Excel (comportamiento original de la app).
+    Cada guardado relee y reescribe el libro completo: O(historial).
+
+    Las lecturas pasan por una caché compartida validada por (mtime, tamaño):
+    el libro solo se vuelve a parsear si cambió en disco por fuera de este
+    proceso; los guardados propios actualizan la copia en memoria.
+
+    Si el libro supera `umbral_streaming` bytes y no hay caché ni espejo
+    vigente, buscar_por_codigo lo recorre por lotes sin cargarlo completo.
+    """
+
+    def __init__(self, path: str, cache: CacheHistorial = None, umbral_streaming: int = UMBRAL_STREAMING_BYTES):
+        self.path = path
+        self.cache = cache if cache is not None else _CACHE_EXCEL
+        self.umbral_streaming = umbral_streaming
+        self._carga = threading.Lock()   # una sola carga en vuelo (p. ej. hilos de precarga)
+
+    def agregar(self, nuevo: dict) -> None:
+        self.agregar_lote([nuevo])
+
+    def agregar_lote(self, nuevos: list) -> int:
+        """Una sola lectura/reescritura del libro para todo el lote."""
+        if not nuevos:
+            return 0
+
+        # 1) Dicts -> DataFrame (una fila por registro)
+        df_nuevo = pd.DataFrame(nuevos)
+
+        # 2) Asegurar columna normalizada
+        df_nuevo["codigo_ue_norm"] = normalizar_codigo_serie(df_nuevo["codigo"])
+
+        # Un solo escritor a la vez (entre sesiones y entre procesos)
+        with bloqueo_exclusivo(self.path):
+            # Copia en caché vigente ANTES de escribir (luego la firma cambia)
+            cacheado = self.cache.obtener(self.path)
+
+            # 3) Leer historial existente (dentro del lock: nunca se pierde una fila)
+            if os.path.exists(self.path):
+                df_hist = pd.read_excel(self.path, engine="openpyxl")
+                df_hist.columns = df_hist.columns.astype(str).str.strip()
+                df_final = pd.concat([df_hist, df_nuevo], ignore_index=True, sort=False)
+            else:
+                df_final = df_nuevo
+
+            # 4) Escribir a un temporal y reemplazar atómicamente
+            with tramo("excel.escritura"):
+                self._escribir(df_final)
+
+            # 5) Actualizar la caché en memoria en vez de forzar un re-parseo
+            if cacheado is None:
+                self.cache.invalidar(self.path)
+            else:
+                # Mismo tratamiento que preparar_historial: las columnas de catálogo siguen categóricas
+                fila = canonizar_historial(coalescer_columnas_duplicadas(adaptar_historial_sharepoint(df_nuevo, copiar=False)))
+                historial = completar_clave_sync(pd.concat([cacheado, fila], ignore_index=True, sort=False))
+                self.cache.guardar(self.path, historial)
+
+        return len(df_nuevo)
+
+    def _escribir(self, df: pd.DataFrame) -> None:
+        escribir_xlsx(self.path, df)
+        # El espejo queda viejo: se reconstruye en la próxima lectura en frío, no en cada guardado
+        invalidar_espejo(self.path)
+
+    def leer_todo(self) -> pd.DataFrame:
+        historial = self.cache.obtener(self.path)
+        if historial is not None:
+            return historial
+
+        with self._carga:
+            # Otro hilo pudo completar la carga mientras se esperaba
+            historial = self.cache.obtener(self.path)
+            if historial is not None:
+                return historial
+
+            # Sin lock de archivo: solo se reemplaza atómicamente, siempre se lee completo.
+            # Se prefiere el espejo columnar si es más reciente que el Excel.
+            firma = firma_archivo(self.path)
+            historial = cargar_con_espejo(self.path, preparar=preparar_historial, usecols=usar_columna)
+            self.cache.guardar(self.path, historial, firma=firma)
+        return historial
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        firma = firma_archivo(self.path)
+        if (
+            firma is not None
+            and firma[1] >= self.umbral_streaming
+            and self.cache.obtener(self.path) is None
+            and not espejo_vigente(self.path)
+        ):
+            from storage.lectura_streaming import buscar_codigo_streaming
+
+            return ordenar_por_fecha(buscar_codigo_streaming(self.path, codigo))
+        return super().buscar_por_codigo(codigo)
+
+    def importar_excel(self, path: str) -> int:
+        df = pd.read_excel(path, engine="openpyxl")
+        with bloqueo_exclusivo(self.path):
+            df_hist = pd.read_excel(self.path, engine="openpyxl") if os.path.exists(self.path) else None
+            df_final = df if df_hist is None else pd.concat([df_hist, df], ignore_index=True, sort=False)
+            self._escribir(df_final)
+            self.cache.invalidar(self.path)
+        return len(df)
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        claves = set(claves_eliminar) | (set(df["clave_sync"]) if not df.empty else set())
+        with bloqueo_exclusivo(self.path):
+            if os.path.exists(self.path):
+                df_hist = pd.read_excel(self.path, engine="openpyxl")
+                df_hist.columns = df_hist.columns.astype(str).str.strip()
+                claves_hist = preparar_historial(df_hist.copy())["clave_sync"]
+                df_hist = df_hist[~claves_hist.isin(claves).to_numpy()]
+                df_final = pd.concat([df_hist, df], ignore_index=True, sort=False)
+            else:
+                df_final = df
+            self._escribir(df_final)
+            self.cache.invalidar(self.path)
+        return len(df)
+
+
+class SQLiteHistorialStore(HistorialStore):
+    """
+    Almacén append-only sobre SQLite en modo WAL.
+
+    - Cada guardado es un único INSERT: la latencia no crece con el historial
+    - Las columnas nuevas se agregan con ALTER TABLE (nunca se reescribe la tabla)
+    - Excel queda solo como formato de importación/exportación
+    - Si la base no existe y se indica `seed_xlsx`, se importa una sola vez
+    """
+
+    def __init__(self, db_path: str, seed_xlsx: str = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._columnas = set()
+
+        with closing(self._conectar()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            columnas_sql = ", ".join(f'"{c}"' for c in COLUMNAS_BASE)
+            con.execute(f'CREATE TABLE IF NOT EXISTS {TABLA_HISTORIAL} ({columnas_sql})')
+            self._columnas = self._leer_columnas(con)
+            self._asegurar_columnas(con, COLUMNAS_BASE)   # bases creadas por versiones previas
+            con.execute(
+                f"CREATE INDEX IF NOT EXISTS {INDICE_CODIGO_FECHA} "
+                f"ON {TABLA_HISTORIAL} (codigo_ue_norm, fecha_recepcion)"
+            )
+            con.execute(f"CREATE INDEX IF NOT EXISTS {INDICE_CLAVE_SYNC} ON {TABLA_HISTORIAL} (clave_sync)")
+            self._claves_a_texto(con)
+            con.commit()
+
+        if seed_xlsx and os.path.exists(seed_xlsx):
+            # Con varios workers arrancando a la vez, solo uno siembra la base
+            with bloqueo_exclusivo(self.db_path):
+                if self._vacio():
+                    self.importar_excel(seed_xlsx)
+
+    # ---------- internos ----------
+    def _conectar(self) -> sqlite3.Connection:
+        # Una conexión por operación: seguro entre hilos/sesiones de Streamlit
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def _vacio(self) -> bool:
+        with closing(self._conectar()) as con:
+            return con.execute(f"SELECT 1 FROM {TABLA_HISTORIAL} LIMIT 1").fetchone() is None
+
+    @staticmethod
+    def _leer_columnas(con: sqlite3.Connection) -> set:
+        return {r[1] for r in con.execute(f"PRAGMA table_info({TABLA_HISTORIAL})")}
+
+    @staticmethod
+    def _claves_a_texto(con: sqlite3.Connection) -> None:
+        """Bases de versiones previas: expediente/N° de IT numéricos (12345.0) -> texto ('12345')."""
+        for c in ("expediente", "numero_it"):
+            con.execute(
+                f'UPDATE {TABLA_HISTORIAL} SET "{c}" = CASE '
+                f'WHEN "{c}" = CAST("{c}" AS INTEGER) THEN CAST(CAST("{c}" AS INTEGER) AS TEXT) '
+                f'ELSE CAST("{c}" AS TEXT) END '
+                f"WHERE typeof(\"{c}\") IN ('integer', 'real')"
+            )
+
+    def _asegurar_columnas(self, con: sqlite3.Connection, columnas) -> None:
+        faltantes = [c for c in columnas if c not in self._columnas]
+        if not faltantes:
+            return
+        self._columnas = self._leer_columnas(con)
+        for c in faltantes:
+            if c not in self._columnas:
+                con.execute(f'ALTER TABLE {TABLA_HISTORIAL} ADD COLUMN "{c}"')
+                self._columnas.add(c)
+
+    def _insertar(self, df: pd.DataFrame, claves_borrar=()) -> int:
+        """INSERT del lote; si se indican `claves_borrar`, se eliminan antes en la misma transacción."""
+        if df.empty and not claves_borrar:
+            return 0
+        columnas = [str(c) for c in df.columns]
+        columnas_sql = ", ".join(f'"{c}"' for c in columnas)
+        marcadores = ", ".join("?" for _ in columnas)
+        conversores = _conversores_sqlite(columnas)
+        filas = [tuple(f(v) for f, v in zip(conversores, fila)) for fila in df.itertuples(index=False, name=None)]
+
+        with self._lock, closing(self._conectar()) as con:
+            if claves_borrar:
+                con.executemany(
+                    f"DELETE FROM {TABLA_HISTORIAL} WHERE clave_sync = ?",
+                    [(c,) for c in claves_borrar],
+                )
+            if filas:
+                self._asegurar_columnas(con, columnas)
+                con.executemany(
+                    f"INSERT INTO {TABLA_HISTORIAL} ({columnas_sql}) VALUES ({marcadores})",
+                    filas,
+                )
+            con.commit()
+        return len(filas)
+
+    # ---------- API ----------
+    def agregar(self, nuevo: dict) -> None:
+        registro = dict(nuevo)
+        registro["codigo_ue_norm"] = normalizar_codigo(registro.get("codigo"))
+        self._insertar(pd.DataFrame([registro]))
+
+    def agregar_lote(self, nuevos: list) -> int:
+        """Todo el lote en una sola transacción (executemany)."""
+        if not nuevos:
+            return 0
+        df = pd.DataFrame(nuevos)
+        df["codigo_ue_norm"] = normalizar_codigo_serie(df["codigo"])
+        return self._insertar(df)
+
+    def leer_todo(self) -> pd.DataFrame:
+        with closing(self._conectar()) as con:
+            return pd.read_sql_query(f"SELECT * FROM {TABLA_HISTORIAL} ORDER BY rowid", con)
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        """Búsqueda por el índice (codigo_ue_norm, fecha_recepcion): no recorre la tabla."""
+        with closing(self._conectar()) as con:
+            return pd.read_sql_query(
+                f"SELECT * FROM {TABLA_HISTORIAL} WHERE codigo_ue_norm = ? "
+                f"ORDER BY fecha_recepcion, rowid",
+                con,
+                params=(normalizar_codigo(codigo),),
+            )
+
+    def ultimo_registro(self, codigo):
+        with closing(self._conectar()) as con:
+            df = pd.read_sql_query(
+                f"SELECT * FROM {TABLA_HISTORIAL} WHERE codigo_ue_norm = ? "
+                f"ORDER BY fecha_recepcion DESC, rowid DESC LIMIT 1",
+                con,
+                params=(normalizar_codigo(codigo),),
+            )
+        return None if df.empty else df.iloc[0]
+
+    def contar_por_codigo(self, codigo) -> int:
+        with closing(self._conectar()) as con:
+            return con.execute(
+                f"SELECT COUNT(*) FROM {TABLA_HISTORIAL} WHERE codigo_ue_norm = ?",
+                (normalizar_codigo(codigo),),
+            ).fetchone()[0]
+
+    def pagina_por_codigo(self, codigo, limite: int = 5, desplazamiento: int = 0,
+                          ordenar_por: str = "fecha_recepcion", descendente: bool = True) -> pd.DataFrame:
+        """LIMIT/OFFSET en SQLite: solo viajan las filas de la página."""
+        validar_orden(ordenar_por)
+        direccion = "DESC" if descendente else "ASC"
+        with closing(self._conectar()) as con:
+            return pd.read_sql_query(
+                f'SELECT * FROM {TABLA_HISTORIAL} WHERE codigo_ue_norm = ? '
+                f'ORDER BY "{ordenar_por}" {direccion}, rowid {direccion} LIMIT ? OFFSET ?',
+                con,
+                params=(normalizar_codigo(codigo), int(limite), int(desplazamiento)),
+            )
+
+    def importar_excel(self, path: str) -> int:
+        """Importa un Excel (formato SharePoint o el generado por la app) en un solo lote."""
+        return self._insertar(preparar_historial(leer_excel_historial(path)))
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        claves = set(claves_eliminar) | (set(df["clave_sync"]) if not df.empty else set())
+        return self._insertar(df, claves_borrar=sorted(claves))
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        """DELETE por clave natural (sobre el índice por código) + INSERT, en una transacción."""
+        df, partes = registro_con_clave(nuevo)
+        if partes is None:
+            self._insertar(df)
+            return False
+        columnas = [str(c) for c in df.columns]
+        columnas_sql = ", ".join(f'"{c}"' for c in columnas)
+        marcadores = ", ".join("?" for _ in columnas)
+        fila = tuple(f(v) for f, v in zip(_conversores_sqlite(columnas), df.iloc[0]))
+        with self._lock, closing(self._conectar()) as con:
+            borradas = con.execute(
+                f"DELETE FROM {TABLA_HISTORIAL} WHERE {condicion_clave_natural('?')}", partes
+            ).rowcount
+            self._asegurar_columnas(con, columnas)
+            con.execute(f"INSERT INTO {TABLA_HISTORIAL} ({columnas_sql}) VALUES ({marcadores})", fila)
+            con.commit()
+        return borradas > 0
+
+
+def crear_historial_store(
+    backend: str, xlsx_path: str, db_path: str = None, dsn: str = None, cache: CacheHistorial = None,
+    particiones_dir: str = None, particion_ue: str = "", proveedor_info_ue=None,
+) -> HistorialStore:
+    """
+    Fábrica de almacenes del historial.
+
+    - "excel":        lee/escribe directamente `xlsx_path` (con `cache`, si se indica)
+    - "sqlite":       usa `db_path` y siembra desde `xlsx_path` la primera vez
+    - "postgres":     Postgres/Supabase en `dsn`, con pool de conexiones propio
+                      (la carga inicial se hace explícitamente con importar_excel)
+    - "particionado": Parquet en `particiones_dir` por año y `particion_ue`
+                      (sector/NG según `proveedor_info_ue`); siembra desde `xlsx_path`
+    """
+    backend = (backend or "").strip().lower()
+    if backend == "excel":
+        return ExcelHistorialStore(xlsx_path, cache=cache)
+    if backend == "sqlite":
+        return SQLiteHistorialStore(db_path, seed_xlsx=xlsx_path)
+    if backend == "postgres":
+        from storage.historial_postgres import PostgresHistorialStore, crear_pool_postgres
+
+        if not dsn:
+            raise ValueError("El backend 'postgres' requiere la cadena de conexión (dsn).")
+        return PostgresHistorialStore(crear_pool_postgres(dsn))
+    if backend == "particionado":
+        from storage.historial_particionado import ParticionadoHistorialStore
+
+        if not particiones_dir:
+            raise ValueError("El backend 'particionado' requiere el directorio de particiones.")
+        return ParticionadoHistorialStore(
+            particiones_dir, dimension_ue=particion_ue, proveedor_info_ue=proveedor_info_ue, seed_xlsx=xlsx_path
+        )
+    raise ValueError(
+        f"Backend de historial desconocido: {backend!r} (usa 'excel', 'sqlite', 'postgres' o 'particionado')."
+    )
@@ -0,0 +1,145 @@
+# ============================================
+# storage/lectura_streaming.py
+# ============================================
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from adapters.historial_sharepoint import adaptar_historial_sharepoint, normalizar_codigo, normalizar_codigo_serie, usar_columna
+from core.formulario import canonizar_historial
+from storage.historial_store import calcular_clave_sync, coalescer_columnas_duplicadas
+
+TAMANO_LOTE = 5000
+
+
+def nombres_unicos(encabezado) -> list:
+    """Encabezado crudo -> nombres de columna: repetidos como 'X', 'X.1', ... (igual que pd.read_excel); sin título -> None."""
+    nombres, vistos = [], {}
+    for c in encabezado:
+        nombre = None if c is None else str(c)
+        if nombre is not None and nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        elif nombre is not None:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+
+def iterar_lotes_crudos(path: str, tamano_lote: int = TAMANO_LOTE, hoja=None):
+    """
+    Como iterar_lotes_excel, pero sin interpretar el encabezado: entrega
+    (encabezado, filas) con las tuplas tal como están en la hoja, incluidas las
+    columnas sin título o repetidas. Las filas completamente vacías se omiten.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[hoja] if hoja else wb.active
+        filas = ws.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        lote = []
+        for fila in filas:
+            if all(v is None for v in fila):
+                continue
+            lote.append(fila)
+            if len(lote) >= tamano_lote:
+                yield encabezado, lote
+                lote = []
+        if lote:
+            yield encabezado, lote
+    finally:
+        wb.close()
+
+
+def iterar_lotes_excel(path: str, tamano_lote: int = TAMANO_LOTE, usecols=usar_columna, hoja=None):
+    """
+    Recorre un Excel en modo solo-lectura de openpyxl y entrega DataFrames de
+    a lo más `tamano_lote` filas (con el encabezado crudo de la primera fila).
+
+    - La memoria pico queda acotada por el lote, no por el tamaño del libro
+    - `usecols(encabezado) -> bool` descarta columnas antes de armar cada lote
+    - Las filas completamente vacías se omiten
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[hoja] if hoja else wb.active
+        filas = ws.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+
+        nombres = nombres_unicos(encabezado)
+
+        posiciones = [
+            i for i, c in enumerate(nombres)
+            if c is not None and (usecols is None or usecols(c))
+        ]
+        columnas = [nombres[i] for i in posiciones]
+
+        lote = []
+        for fila in filas:
+            valores = [fila[i] if i < len(fila) else None for i in posiciones]
+            if all(v is None for v in valores):
+                continue
+            lote.append(valores)
+            if len(lote) >= tamano_lote:
+                yield pd.DataFrame(lote, columns=columnas)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, columns=columnas)
+    finally:
+        wb.close()
+
+
+def buscar_codigo_streaming(
+    path: str,
+    codigo,
+    tamano_lote: int = TAMANO_LOTE,
+    ordenado_por_codigo: bool = False,
+    limite: int = None,
+) -> pd.DataFrame:
+    """
+    Filas del pliego `codigo` leyendo el libro por lotes (adapter + filtro por lote).
+
+    - Solo se conservan las filas del pliego: memoria pico ~ un lote + el resultado
+    - `ordenado_por_codigo=True`: el libro está agrupado por código, así que la
+      lectura se corta apenas termina el bloque del pliego
+    - `limite`: se corta al juntar esa cantidad de filas (en orden del archivo)
+    - Columnas estándar (adaptar_historial_sharepoint) + 'codigo_ue_norm' y 'clave_sync',
+      con estado/vigencia/tipo_pei/etapa_revision canónicos
+    """
+    objetivo = normalizar_codigo(codigo)
+    partes = []
+    total = 0
+    visto = False
+
+    if os.path.exists(path):
+        for lote in iterar_lotes_excel(path, tamano_lote=tamano_lote):
+            df = coalescer_columnas_duplicadas(adaptar_historial_sharepoint(lote, copiar=False))
+            mascara = (normalizar_codigo_serie(df["codigo"]) == objetivo).to_numpy()
+
+            if mascara.any():
+                # Mismos valores canónicos que el resto de las rutas de carga (preparar_historial)
+                coincidencias = canonizar_historial(df[mascara].copy())
+                coincidencias["codigo_ue_norm"] = objetivo
+                partes.append(coincidencias)
+                total += len(coincidencias)
+                visto = True
+                if limite is not None and total >= limite:
+                    break
+                # El bloque del pliego terminó dentro de este lote
+                if ordenado_por_codigo and not mascara[-1]:
+                    break
+            elif ordenado_por_codigo and visto:
+                break
+
+    if not partes:
+        return pd.DataFrame(columns=["codigo_ue_norm", "codigo"])
+    resultado = pd.concat(partes, ignore_index=True)
+    if "clave_sync" not in resultado.columns:
+        # La clave incluye el código: calcularla sobre el pliego equivale a hacerlo sobre todo el libro
+        resultado["clave_sync"] = calcular_clave_sync(resultado)
+    return resultado.head(limite) if limite is not None else resultado
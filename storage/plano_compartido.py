@@ -0,0 +1,240 @@
+# ============================================
+# storage/plano_compartido.py
+# ============================================
+"""
+Plano de datos compartido para despliegues con varios procesos de Streamlit.
+
+Un único proceso escritor publica instantáneas versionadas (Arrow IPC, sin
+compresión) de unidades ejecutoras y del historial; cada worker las mapea en
+memoria y las lee sin copiarlas, de modo que el sistema operativo comparte las
+mismas páginas entre todos los procesos.
+
+    python -m storage.plano_compartido [--cada 30] [--una-vez]
+
+Se activa en la app con IT_PEI_PLANO_COMPARTIDO=<directorio> (el mismo para el
+escritor y los workers).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+import pandas as pd
+
+from core.trazas import contar_cache
+from storage.archivos import bloqueo_exclusivo, escritura_atomica
+from storage.espejo_columnar import tipar_para_arrow
+from storage.historial_store import CacheHistorial, firma_archivo
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:   # sin pyarrow: el modo compartido no está disponible
+    pa = None
+    ipc = None
+
+INSTANTANEA_UNIDADES = "unidades_ejecutoras"
+INSTANTANEA_HISTORIAL = "historial"
+# Versiones anteriores que se conservan (un lector puede estar aún en una de ellas)
+VERSIONES_CONSERVADAS = 3
+
+
+def _ruta_puntero(directorio: str, nombre: str) -> str:
+    return os.path.join(directorio, f"{nombre}.json")
+
+
+def _ruta_version(directorio: str, nombre: str, version: int) -> str:
+    return os.path.join(directorio, f"{nombre}-{version:06d}.arrow")
+
+
+def _firma_puntero(path: str):
+    """(inodo, mtime_ns, tamaño): cambia en cada reemplazo atómico del puntero."""
+    try:
+        st_ = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st_.st_ino, st_.st_mtime_ns, st_.st_size)
+
+
+def leer_puntero(directorio: str, nombre: str):
+    """Puntero de la versión publicada ({"version", "archivo", "filas", "metadatos", ...}) o None."""
+    try:
+        with open(_ruta_puntero(directorio, nombre), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def publicar_instantanea(directorio: str, nombre: str, df: pd.DataFrame, metadatos: dict = None,
+                         conservar: int = VERSIONES_CONSERVADAS) -> int:
+    """
+    Publica una nueva versión de `nombre`. Retorna el número de versión.
+
+    1) Se escribe `<nombre>-<version>.arrow` completo (escritura atómica)
+    2) `<nombre>.json` pasa a apuntar a esa versión (reemplazo atómico): un lector
+       ve la versión anterior completa o la nueva completa, nunca una mezcla
+    3) Se borran las versiones más viejas que las últimas `conservar`; en POSIX
+       los lectores que aún las tienen mapeadas las siguen viendo
+    """
+    if pa is None:
+        raise ImportError("Se requiere pyarrow para publicar instantáneas.")
+    os.makedirs(directorio, exist_ok=True)
+    puntero_path = _ruta_puntero(directorio, nombre)
+
+    with bloqueo_exclusivo(puntero_path):
+        anterior = leer_puntero(directorio, nombre)
+        version = anterior["version"] + 1 if anterior else 1
+        tabla = pa.Table.from_pandas(tipar_para_arrow(df), preserve_index=False)
+
+        ruta = _ruta_version(directorio, nombre, version)
+        with escritura_atomica(ruta) as tmp_path:
+            with pa.OSFile(tmp_path, "wb") as f, ipc.new_file(f, tabla.schema) as escritor:
+                escritor.write_table(tabla)
+
+        puntero = {
+            "version": version,
+            "archivo": os.path.basename(ruta),
+            "filas": len(df),
+            "publicado": time.time(),
+            "metadatos": metadatos or {},
+        }
+        with escritura_atomica(puntero_path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(puntero, f, ensure_ascii=False)
+
+        for vieja in range(version - conservar, 0, -1):
+            try:
+                os.remove(_ruta_version(directorio, nombre, vieja))
+            except FileNotFoundError:
+                break   # las anteriores ya se borraron en publicaciones previas
+            except OSError:
+                pass    # Windows: todavía mapeada por algún lector
+    return version
+
+
+class Instantanea(NamedTuple):
+    """Versión publicada de un conjunto de datos; `df` referencia el archivo mapeado (solo lectura)."""
+    nombre: str
+    version: int
+    metadatos: dict
+    df: pd.DataFrame
+
+
+class LectorPlano:
+    """
+    Vista de un proceso sobre el plano compartido.
+
+    - obtener() solo hace un stat del puntero mientras la versión no cambie
+    - Al publicarse una versión nueva se mapea su archivo y se suelta el anterior
+    - El DataFrame no copia los datos: numéricos, fechas y textos (Arrow) apuntan
+      a las páginas del archivo, compartidas entre procesos
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._vigentes = {}   # nombre -> (firma del puntero, Instantanea)
+
+    def obtener(self, nombre: str):
+        """Instantánea vigente de `nombre`, o None si aún no se publicó ninguna."""
+        if pa is None:
+            return None
+        firma = _firma_puntero(_ruta_puntero(self.directorio, nombre))
+        if firma is None:
+            return None
+        with self._lock:
+            vigente = self._vigentes.get(nombre)
+        if vigente is not None and vigente[0] == firma:
+            contar_cache("plano_compartido", True)
+            return vigente[1]
+
+        puntero = leer_puntero(self.directorio, nombre)
+        if puntero is None:
+            return None
+        if vigente is not None and vigente[1].version == puntero["version"]:
+            instantanea = vigente[1]
+        else:
+            contar_cache("plano_compartido", False)
+            try:
+                tabla = ipc.open_file(pa.memory_map(os.path.join(self.directorio, puntero["archivo"]))).read_all()
+            except FileNotFoundError:
+                # Podada entre la lectura del puntero y la apertura: se sigue con la vigente
+                return vigente[1] if vigente is not None else None
+            instantanea = Instantanea(
+                nombre, puntero["version"], puntero.get("metadatos", {}), tabla.to_pandas(split_blocks=True)
+            )
+        with self._lock:
+            self._vigentes[nombre] = (firma, instantanea)
+        return instantanea
+
+
+class CacheHistorialCompartida(CacheHistorial):
+    """
+    Caché del ExcelHistorialStore que prefiere la instantánea publicada del
+    historial cuando se construyó desde el mismo archivo (misma firma mtime/tamaño).
+    Si el libro cambió y el escritor aún no publicó (p. ej. justo tras un
+    guardado), se usa la caché privada del proceso como antes.
+    """
+
+    def __init__(self, lector: LectorPlano, nombre: str = INSTANTANEA_HISTORIAL, max_entradas: int = 4):
+        super().__init__(max_entradas)
+        self.lector = lector
+        self.nombre = nombre
+
+    def obtener(self, path: str):
+        instantanea = self.lector.obtener(self.nombre)
+        if instantanea is not None and tuple(instantanea.metadatos.get("firma") or ()) == firma_archivo(path):
+            self.invalidar(path)   # la copia privada ya no hace falta
+            return instantanea.df
+        return super().obtener(path)
+
+
+def publicar_si_cambio(directorio: str, nombre: str, path: str, leer) -> int:
+    """
+    Publica `leer()` si el archivo fuente cambió desde la última publicación.
+    La firma se toma ANTES de leer (igual que la caché). Retorna la versión nueva o None.
+    """
+    firma = firma_archivo(path)
+    if firma is None:
+        return None
+    puntero = leer_puntero(directorio, nombre)
+    if puntero is not None and tuple(puntero["metadatos"].get("firma") or ()) == firma:
+        return None
+    return publicar_instantanea(directorio, nombre, leer(), metadatos={"firma": list(firma)})
+
+
+def main(argv=None) -> int:
+    from core import config
+    from storage.historial_store import ExcelHistorialStore
+    from storage.unidades_ejecutoras import UNIDADES_EJECUTORAS_PATH, leer_unidades_ejecutoras
+
+    parser = argparse.ArgumentParser(prog="python -m storage.plano_compartido", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--directorio", default=config.PLANO_COMPARTIDO_DIR or "data/plano")
+    parser.add_argument("--cada", type=float, default=config.PLANO_COMPARTIDO_CADA_S, help="Segundos entre revisiones")
+    parser.add_argument("--una-vez", action="store_true", help="Publica lo que haya cambiado y termina")
+    args = parser.parse_args(argv)
+
+    fuentes = [(INSTANTANEA_UNIDADES, UNIDADES_EJECUTORAS_PATH, leer_unidades_ejecutoras)]
+    if config.HISTORIAL_BACKEND == "excel":
+        # Los backends SQL consultan por índice: los workers no guardan el historial en memoria
+        store = ExcelHistorialStore(config.HISTORIAL_PATH, cache=CacheHistorial(max_entradas=1))
+        fuentes.append((INSTANTANEA_HISTORIAL, config.HISTORIAL_PATH, store.leer_todo))
+
+    # Un solo escritor: otro proceso lanzado con el mismo directorio espera de respaldo
+    os.makedirs(args.directorio, exist_ok=True)
+    with bloqueo_exclusivo(os.path.join(args.directorio, "escritor"), timeout=float("inf")):
+        while True:
+            for nombre, path, leer in fuentes:
+                version = publicar_si_cambio(args.directorio, nombre, path, leer)
+                if version is not None:
+                    print(f"{nombre}: versión {version} publicada", flush=True)
+            if args.una_vez:
+                return 0
+            time.sleep(args.cada)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
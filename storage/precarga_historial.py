@@ -0,0 +1,155 @@
+# ============================================
+# storage/precarga_historial.py
+# ============================================
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as TiempoAgotado
+
+import pandas as pd
+
+from adapters.historial_sharepoint import normalizar_codigo
+from core.trazas import contar_cache, tramo
+from storage.historial_store import HistorialStore, ordenar_por_fecha, validar_orden
+
+
+class HistorialPrecargado(HistorialStore):
+    """
+    Envoltura por sesión de un HistorialStore con precarga en segundo plano.
+
+    - precargar(codigos) envía a `pool` (compartido por el proceso) la lectura del
+      historial de cada pliego que no esté ya en caché o en vuelo; sin `pool` no
+      se precarga nada y todas las lecturas van al store
+    - Las lecturas de un pliego precargado (conteo, página, último registro) se
+      resuelven en memoria; si no está listo, van al store como siempre
+    - LRU acotado a `max_pliegos`; las entradas más viejas que `max_edad_s` se
+      descartan (ven escrituras de otras sesiones)
+    - Los guardados de esta sesión invalidan la entrada del pliego
+    """
+
+    def __init__(self, store: HistorialStore, pool, max_pliegos: int = 64,
+                 max_edad_s: float = 120.0, espera_s: float = 2.0):
+        self.store = store
+        self.pool = pool
+        self.max_pliegos = max_pliegos
+        self.max_edad_s = max_edad_s
+        self.espera_s = espera_s
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # codigo_norm -> (instante, Future)
+
+    # ---------- precarga ----------
+    def _leer(self, codigo) -> pd.DataFrame:
+        with tramo("historial.precarga"):
+            return self.store.buscar_por_codigo(codigo)
+
+    def _vigente(self, entrada) -> bool:
+        return time.monotonic() - entrada[0] < self.max_edad_s
+
+    def precargar(self, codigos) -> int:
+        """Programa la lectura de los pliegos que falten. Retorna cuántos se enviaron al pool."""
+        if self.pool is None:
+            return 0
+        enviados = 0
+        with self._lock:
+            for codigo in list(codigos)[:self.max_pliegos]:
+                clave = normalizar_codigo(codigo)
+                entrada = self._entradas.get(clave)
+                if entrada is not None and self._vigente(entrada):
+                    continue
+                self._entradas[clave] = (time.monotonic(), self.pool.submit(self._leer, codigo))
+                self._entradas.move_to_end(clave)
+                enviados += 1
+            while len(self._entradas) > self.max_pliegos:
+                _, (_, futuro) = self._entradas.popitem(last=False)
+                futuro.cancel()
+        return enviados
+
+    def invalidar(self, codigo=None) -> None:
+        with self._lock:
+            if codigo is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(normalizar_codigo(codigo), None)
+
+    def _listo(self, codigo):
+        """Historial precargado del pliego, o None si no hay (o falló la lectura)."""
+        clave = normalizar_codigo(codigo)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and not self._vigente(entrada):
+                del self._entradas[clave]
+                entrada = None
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+        if entrada is None:
+            contar_cache("precarga_historial", False)
+            return None
+        try:
+            df = entrada[1].result(timeout=self.espera_s)
+        except TiempoAgotado:
+            contar_cache("precarga_historial", False)
+            return None
+        except Exception:
+            self.invalidar(codigo)
+            contar_cache("precarga_historial", False)
+            return None
+        contar_cache("precarga_historial", True)
+        return df
+
+    # ---------- lectura ----------
+    def leer_todo(self) -> pd.DataFrame:
+        return self.store.leer_todo()
+
+    def leer_por_anio(self, anios) -> pd.DataFrame:
+        return self.store.leer_por_anio(anios)
+
+    def buscar_por_codigo(self, codigo) -> pd.DataFrame:
+        df = self._listo(codigo)
+        return df if df is not None else self.store.buscar_por_codigo(codigo)
+
+    def ultimo_registro(self, codigo):
+        df = self._listo(codigo)
+        if df is None:
+            return self.store.ultimo_registro(codigo)
+        return None if df.empty else df.iloc[-1]
+
+    def contar_por_codigo(self, codigo) -> int:
+        df = self._listo(codigo)
+        return len(df) if df is not None else self.store.contar_por_codigo(codigo)
+
+    def pagina_por_codigo(self, codigo, limite: int = 5, desplazamiento: int = 0,
+                          ordenar_por: str = "fecha_recepcion", descendente: bool = True) -> pd.DataFrame:
+        df = self._listo(codigo)
+        if df is None:
+            return self.store.pagina_por_codigo(codigo, limite, desplazamiento, ordenar_por, descendente)
+        validar_orden(ordenar_por)
+        df = ordenar_por_fecha(df, ordenar_por)
+        if descendente:
+            df = df.iloc[::-1]
+        return df.iloc[desplazamiento:desplazamiento + limite].reset_index(drop=True)
+
+    # ---------- escritura (delegada; invalida el pliego) ----------
+    def agregar(self, nuevo: dict) -> None:
+        self.store.agregar(nuevo)
+        self.invalidar(nuevo.get("codigo"))
+
+    def agregar_lote(self, nuevos: list) -> int:
+        n = self.store.agregar_lote(nuevos)
+        for nuevo in nuevos:
+            self.invalidar(nuevo.get("codigo"))
+        return n
+
+    def agregar_o_reemplazar(self, nuevo: dict) -> bool:
+        reemplazado = self.store.agregar_o_reemplazar(nuevo)
+        self.invalidar(nuevo.get("codigo"))
+        return reemplazado
+
+    def importar_excel(self, path: str) -> int:
+        n = self.store.importar_excel(path)
+        self.invalidar()
+        return n
+
+    def reemplazar_por_clave(self, df: pd.DataFrame, claves_eliminar=()) -> int:
+        n = self.store.reemplazar_por_clave(df, claves_eliminar)
+        self.invalidar()
+        return n
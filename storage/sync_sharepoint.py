@@ -0,0 +1,208 @@
+# ============================================
+# storage/sync_sharepoint.py
+# ============================================
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from storage.archivos import bloqueo_exclusivo, escritura_atomica
+from storage.historial_store import HistorialStore, leer_excel_historial, preparar_historial
+
+# Columnas derivadas por la app: no forman parte del hash de la fila de SharePoint
+_COLUMNAS_DERIVADAS = ["codigo_ue_norm", "clave_sync"]
+
+
+# =====================================
+# Fuentes (SharePoint real o sustitutos locales)
+# =====================================
+def leer_encabezado_crudo(path_o_buffer) -> list:
+    """Primera fila de la primera hoja tal cual: todas las columnas, también las que la app no lee."""
+    wb = load_workbook(path_o_buffer, read_only=True, data_only=True)
+    try:
+        fila = list(next(wb.worksheets[0].iter_rows(max_row=1, values_only=True), ()))
+    finally:
+        wb.close()
+    while fila and fila[-1] is None:
+        fila.pop()
+    return ["" if c is None else str(c) for c in fila]
+
+
+def leer_export(path_o_buffer) -> pd.DataFrame:
+    """
+    Export de SharePoint -> DataFrame con las columnas que usa la app y el
+    encabezado crudo completo en `attrs["encabezado_crudo"]` (para huella_esquema).
+    """
+    encabezado = leer_encabezado_crudo(path_o_buffer)
+    if hasattr(path_o_buffer, "seek"):
+        path_o_buffer.seek(0)
+    df = leer_excel_historial(path_o_buffer)
+    df.attrs["encabezado_crudo"] = encabezado
+    return df
+
+
+class FuenteArchivo:
+    """Export de SharePoint en disco. Versión = (mtime, tamaño)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def descargar(self, version_previa=None):
+        """Retorna (df_crudo, version); df_crudo es None si no cambió desde `version_previa`."""
+        st_ = os.stat(self.path)
+        version = f"{st_.st_mtime_ns}-{st_.st_size}"
+        if version == version_previa:
+            return None, version
+        return leer_export(self.path), version
+
+
+class FuenteHTTP:
+    """
+    Export de SharePoint por HTTP(S) con GET condicional (ETag / Last-Modified):
+    si el servidor responde 304 no se descarga nada.
+    """
+
+    def __init__(self, url: str, headers: dict = None, timeout: float = 60):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+
+    def descargar(self, version_previa=None):
+        previa = json.loads(version_previa) if version_previa else {}
+        headers = dict(self.headers)
+        if previa.get("etag"):
+            headers["If-None-Match"] = previa["etag"]
+        if previa.get("last_modified"):
+            headers["If-Modified-Since"] = previa["last_modified"]
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url, headers=headers), timeout=self.timeout) as r:
+                contenido = r.read()
+                version = json.dumps({
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "sha1": hashlib.sha1(contenido).hexdigest(),
+                }, sort_keys=True)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, version_previa
+            raise
+
+        # Sin ETag/Last-Modified: se compara el contenido
+        if previa.get("sha1") == json.loads(version)["sha1"]:
+            return None, version
+        return leer_export(io.BytesIO(contenido)), version
+
+
+def crear_fuente(origen: str):
+    """URL http(s) -> FuenteHTTP; cualquier otra cosa -> FuenteArchivo."""
+    if origen.startswith(("http://", "https://")):
+        return FuenteHTTP(origen)
+    return FuenteArchivo(origen)
+
+
+# =====================================
+# Estado (marca de agua) de la sincronización
+# =====================================
+def huella_esquema(columnas) -> str:
+    """
+    Huella del encabezado crudo (todas las columnas del export, no solo las que
+    lee la app): si cambia, se hace una resincronización completa.
+    """
+    return hashlib.sha1("\x1f".join(str(c) for c in columnas).encode("utf-8")).hexdigest()
+
+
+def cargar_estado(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"esquema": None, "version_fuente": None, "hashes": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_estado(path: str, estado: dict) -> None:
+    with escritura_atomica(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False)
+
+
+def hash_filas(df: pd.DataFrame) -> pd.Series:
+    """Hash por fila (vectorizado) de los valores de SharePoint, en hexadecimal."""
+    datos = df.drop(columns=[c for c in _COLUMNAS_DERIVADAS if c in df.columns])
+    datos = datos.astype(object).where(datos.notna(), None).astype(str)
+    return pd.util.hash_pandas_object(datos, index=False).map("{:016x}".format)
+
+
+# =====================================
+# Motor de sincronización incremental
+# =====================================
+def sincronizar_historial(store: HistorialStore, fuente, estado_path: str) -> dict:
+    """
+    Trae desde `fuente` solo las filas nuevas o modificadas y las aplica al store.
+
+    - Si la fuente no cambió (misma versión / HTTP 304), no se lee nada
+    - Cada fila se identifica por calcular_clave_sync (Id_UE + Expediente + ...)
+      y se compara su hash con la marca de agua guardada en `estado_path`
+    - Solo las filas con hash distinto se insertan (upsert por clave); las
+      claves que desaparecieron de la fuente se eliminan
+    - Si cambia el encabezado (esquema), se reemplazan todas las filas sincronizadas
+    """
+    inicio = time.perf_counter()
+    with bloqueo_exclusivo(estado_path):
+        estado = cargar_estado(estado_path)
+        df_raw, version = fuente.descargar(estado.get("version_fuente"))
+        if df_raw is None:
+            return {"sin_cambios": True, "segundos": time.perf_counter() - inicio}
+
+        esquema = huella_esquema(df_raw.attrs.get("encabezado_crudo", df_raw.columns))
+        completo = esquema != estado.get("esquema")
+        hashes_previos = {} if completo else estado.get("hashes", {})
+
+        df = preparar_historial(df_raw)
+        hashes = hash_filas(df)
+        claves = df["clave_sync"]
+
+        cambiados = (claves.map(hashes_previos).fillna("") != hashes).to_numpy()
+        eliminadas = set(estado.get("hashes", {})) - set(claves)
+
+        store.reemplazar_por_clave(df[cambiados], claves_eliminar=sorted(eliminadas))
+
+        guardar_estado(estado_path, {
+            "esquema": esquema,
+            "version_fuente": version,
+            "hashes": dict(zip(claves, hashes)),
+            "ultima_sync": datetime.now().isoformat(timespec="seconds"),
+        })
+
+    return {
+        "sin_cambios": False,
+        "completo": completo,
+        "filas_fuente": len(df),
+        "nuevas_o_modificadas": int(cambiados.sum()),
+        "eliminadas": len(eliminadas),
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+if __name__ == "__main__":
+    # python -m storage.sync_sharepoint <export.xlsx | URL> [estado.json]
+    from storage.historial_store import crear_historial_store
+
+    origen = sys.argv[1]
+    estado_path = sys.argv[2] if len(sys.argv) > 2 else "data/historial_sync_estado.json"
+    store = crear_historial_store(
+        os.environ.get("HISTORIAL_BACKEND", "sqlite"),
+        xlsx_path="data/historial_it_pei.xlsx",
+        db_path=os.environ.get("HISTORIAL_DB_PATH", "data/historial_it_pei.sqlite"),
+        dsn=os.environ.get("HISTORIAL_POSTGRES_DSN", ""),
+        particiones_dir=os.environ.get("HISTORIAL_PARTICIONES_DIR", "data/historial_particionado"),
+        particion_ue=os.environ.get("HISTORIAL_PARTICION_UE", "sector"),
+    )
+    print(sincronizar_historial(store, crear_fuente(origen), estado_path))
@@ -0,0 +1,94 @@
+# ============================================
+# storage/unidades_ejecutoras.py
+# ============================================
+import os
+from typing import NamedTuple
+
+import pandas as pd
+
+from storage.espejo_columnar import cargar_con_espejo, ruta_espejo
+
+UNIDADES_EJECUTORAS_PATH = "data/unidades_ejecutoras.xlsx"
+
+
+def preparar_unidades_ejecutoras(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Limpieza única de unidades_ejecutoras (se guarda ya limpia en el espejo):
+    - 'codigo' y 'NG' como texto sin espacios
+    - 'Responsable_Institucional' sin nulos ni espacios (si existe)
+    """
+    df["codigo"] = df["codigo"].astype(str).str.strip()
+    df["NG"] = df["NG"].astype(str).str.strip()
+    if "Responsable_Institucional" in df.columns:
+        df["Responsable_Institucional"] = (
+            df["Responsable_Institucional"]
+            .fillna("")
+            .astype(str)
+            .str.strip()
+        )
+    return df
+
+
+def leer_unidades_ejecutoras(path: str = UNIDADES_EJECUTORAS_PATH) -> pd.DataFrame:
+    """Unidades ejecutoras ya limpias, desde el espejo columnar si está vigente."""
+    return cargar_con_espejo(path, preparar=preparar_unidades_ejecutoras)
+
+
+def version_unidades_ejecutoras(path: str = UNIDADES_EJECUTORAS_PATH) -> tuple:
+    """Versión de los datos (mtime del Excel y de su espejo): clave para las cachés."""
+    versiones = []
+    for ruta in (path, ruta_espejo(path)):
+        versiones.append(os.path.getmtime(ruta) if os.path.exists(ruta) else None)
+    return tuple(versiones)
+
+
+class IndiceUnidades(NamedTuple):
+    """
+    Estructuras de búsqueda precalculadas sobre unidades_ejecutoras.
+
+    - responsables: lista ordenada de responsables (sin vacíos)
+    - opciones_por_responsable: responsable -> ["codigo - nombre", ...]
+    - codigos_por_responsable: responsable -> [codigo, ...] (mismo orden)
+    - info_por_codigo: codigo -> {"nombre", "sector", "NG", "responsable"}
+    - opcion_a_codigo: "codigo - nombre" -> codigo
+    """
+    responsables: list
+    opciones_por_responsable: dict
+    codigos_por_responsable: dict
+    info_por_codigo: dict
+    opcion_a_codigo: dict
+
+
+def construir_indice_unidades(df: pd.DataFrame) -> IndiceUnidades:
+    """Construye el índice de una sola vez (por versión de datos), sin iterrows."""
+    if "Responsable_Institucional" not in df.columns:
+        raise ValueError("Falta la columna 'Responsable_Institucional' en unidades_ejecutoras.xlsx")
+
+    codigos = df["codigo"].astype(str).str.strip()
+    nombres = df["nombre"].astype(str).str.strip()
+    responsables_col = df["Responsable_Institucional"].astype(str)
+    sectores = df["sector"].astype(str) if "sector" in df.columns else pd.Series("", index=df.index)
+    opciones = codigos + " - " + nombres
+
+    opciones_por_responsable = {}
+    codigos_por_responsable = {}
+    for resp, idx in responsables_col.groupby(responsables_col, sort=False, observed=True).groups.items():
+        if not resp:
+            continue
+        opciones_por_responsable[resp] = opciones.loc[idx].tolist()
+        codigos_por_responsable[resp] = codigos.loc[idx].tolist()
+
+    info_por_codigo = {
+        cod: {"nombre": nom, "sector": sec, "NG": ng, "responsable": resp}
+        for cod, nom, sec, ng, resp in zip(
+            codigos, nombres, sectores, df["NG"].astype(str), responsables_col
+        )
+    }
+
+    return IndiceUnidades(
+        responsables=sorted(opciones_por_responsable),
+        opciones_por_responsable=opciones_por_responsable,
+        codigos_por_responsable=codigos_por_responsable,
+        info_por_codigo=info_por_codigo,
+        opcion_a_codigo=dict(zip(opciones, codigos)),
+    )
@@ -0,0 +1,84 @@
+# ============================================
+# storage/validacion.py
+# ============================================
+import re
+
+import pandas as pd
+
+# Reglas del formulario (app.py), compartidas con la carga masiva
+PATRON_PERIODO = re.compile(r"^\d{4}-\d{4}$")
+
+# Campos obligatorios para registrar un IT como 'Emitido'
+CAMPOS_EMISION = {
+    "expediente": "Expediente (SGD)",
+    "fecha_it": "Fecha de I.T",
+    "numero_it": "Número de I.T",
+}
+
+
+def _vacio(v) -> bool:
+    if v is None:
+        return True
+    try:
+        if pd.isna(v):
+            return True
+    except (TypeError, ValueError):
+        pass
+    return not str(v).strip()
+
+
+def periodo_valido(periodo) -> bool:
+    """Vacío o con el formato 2025-2027."""
+    return _vacio(periodo) or bool(PATRON_PERIODO.match(str(periodo).strip()))
+
+
+def es_emitido(estado) -> bool:
+    return not _vacio(estado) and str(estado).strip().lower() == "emitido"
+
+
+def faltantes_para_emitir(registro: dict) -> list:
+    """Etiquetas de los campos de CAMPOS_EMISION que faltan en `registro`."""
+    return [etiqueta for campo, etiqueta in CAMPOS_EMISION.items() if _vacio(registro.get(campo))]
+
+
+def validar_registro(registro: dict) -> list:
+    """Errores de un registro según las reglas del formulario (lista vacía si es válido)."""
+    errores = []
+    if not periodo_valido(registro.get("periodo")):
+        errores.append("Periodo con formato inválido (usa 2025-2027)")
+    if es_emitido(registro.get("estado")):
+        faltantes = faltantes_para_emitir(registro)
+        if faltantes:
+            errores.append("Emitido sin " + ", ".join(faltantes))
+    return errores
+
+
+def validar_historial(df: pd.DataFrame) -> pd.Series:
+    """
+    Versión vectorizada de validar_registro para un historial con columnas estándar.
+    Retorna, por fila, los errores separados por '; ' ('' si la fila es válida).
+    """
+    def texto(col):
+        if col not in df.columns:
+            return pd.Series("", index=df.index, dtype=object)
+        serie = df[col]
+        return serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+
+    errores = pd.Series("", index=df.index, dtype=object)
+
+    periodo = texto("periodo")
+    malo = (periodo != "") & ~periodo.str.match(PATRON_PERIODO.pattern)
+    errores = errores.mask(malo, "Periodo con formato inválido (usa 2025-2027)")
+
+    # Mismo texto que validar_registro: "Emitido sin A, B, C"
+    emitido = texto("estado").str.lower() == "emitido"
+    faltantes = pd.Series("", index=df.index, dtype=object)
+    for campo, etiqueta in CAMPOS_EMISION.items():
+        falta = emitido & (texto(campo) == "")
+        faltantes = faltantes.mask(falta & (faltantes != ""), faltantes + ", " + etiqueta)
+        faltantes = faltantes.mask(falta & (faltantes == ""), etiqueta)
+    emision = ("Emitido sin " + faltantes).where(faltantes != "", "")
+
+    errores = errores.mask((errores != "") & (emision != ""), errores + "; " + emision)
+    errores = errores.mask((errores == "") & (emision != ""), emision)
+    return errores
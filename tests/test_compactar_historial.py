@@ -0,0 +1,27 @@
+# ============================================
+# tests/test_compactar_historial.py
+# ============================================
+from openpyxl import Workbook, load_workbook
+
+from storage.compactar_historial import compactar_excel
+
+
+def test_compactar_conserva_la_ultima_fila_y_las_columnas_crudas(tmp_path):
+    path = str(tmp_path / "historial.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Id_UE", "Expediente", "Número de I.T", "Fecha de recepción", None, "Nota", "Nota"])
+    ws.append([1534, "E-1", "IT-1", "2024-01-02", "x1", "a", "b"])
+    ws.append([1534, "E-1", "IT-1", "2024-01-02", "x2", "c", "d"])   # misma clave: queda esta
+    ws.append([1535, None, None, None, "x3", "e", "f"])               # sin clave: nunca es duplicada
+    wb.save(path)
+
+    resultado = compactar_excel(path)
+
+    assert (resultado["leidas"], resultado["escritas"], resultado["duplicadas"]) == (3, 2, 1)
+    filas = list(load_workbook(path).active.iter_rows(values_only=True))
+    assert filas == [
+        ("Id_UE", "Expediente", "Número de I.T", "Fecha de recepción", None, "Nota", "Nota"),
+        (1534, "E-1", "IT-1", "2024-01-02", "x2", "c", "d"),
+        (1535, None, None, None, "x3", "e", "f"),
+    ]
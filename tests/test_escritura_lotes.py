@@ -0,0 +1,79 @@
+# ============================================
+# tests/test_escritura_lotes.py
+# ============================================
+import json
+
+from storage.archivos import bloqueo_exclusivo
+from storage.escritura_lotes import HistorialStoreEnLotes
+from storage.historial_store import SQLiteHistorialStore
+
+
+def _registro(expediente, **extra):
+    return {"codigo": "1534", "nombre": "UE", "expediente": expediente, "numero_it": "IT-1",
+            "fecha_recepcion": "2024-01-02", **extra}
+
+
+def _escribir_journal(path, registros, truncado=""):
+    with open(path, "w", encoding="utf-8") as f:
+        for registro in registros:
+            f.write(json.dumps(registro) + "\n")
+        f.write(truncado)
+
+
+def _expedientes(store):
+    return sorted(store.leer_todo()["expediente"])
+
+
+def test_reencola_journals_huerfanos_una_sola_vez(tmp_path):
+    base = SQLiteHistorialStore(str(tmp_path / "h.sqlite"))
+    journal = str(tmp_path / "journal.jsonl")
+    # Journal compartido de versiones previas, lote en vuelo y journal de un proceso caído
+    _escribir_journal(journal, [_registro("LEGADO")])
+    _escribir_journal(f"{journal}.111-caido.flushing", [_registro("EN-VUELO")])
+    _escribir_journal(f"{journal}.111-caido", [_registro("CAIDO")], truncado='{"codigo": "15')
+
+    store = HistorialStoreEnLotes(base, journal, max_espera_s=60)
+    assert sorted(r["expediente"] for r in store._pendientes) == ["CAIDO", "EN-VUELO", "LEGADO"]
+    assert _expedientes(store) == ["CAIDO", "EN-VUELO", "LEGADO"]   # se leen antes de volcar
+    store.cerrar()
+    assert _expedientes(base) == ["CAIDO", "EN-VUELO", "LEGADO"]
+
+    segundo = HistorialStoreEnLotes(base, journal, max_espera_s=60)
+    assert segundo._pendientes == []
+    segundo.cerrar()
+    assert _expedientes(base) == ["CAIDO", "EN-VUELO", "LEGADO"]
+    journals = [p.name for p in tmp_path.iterdir() if p.name.startswith("journal") and not p.name.endswith(".lock")]
+    assert journals == []
+
+
+def test_no_adopta_el_journal_de_un_proceso_vivo(tmp_path):
+    base = SQLiteHistorialStore(str(tmp_path / "h.sqlite"))
+    journal = str(tmp_path / "journal.jsonl")
+    ajeno = f"{journal}.222-vivo"
+    _escribir_journal(ajeno, [_registro("VIVO")])
+
+    with bloqueo_exclusivo(ajeno, timeout=0):   # el otro proceso mantiene su lock de por vida
+        store = HistorialStoreEnLotes(base, journal, max_espera_s=60)
+        assert store._pendientes == []
+        store.cerrar()
+    assert base.leer_todo().empty
+
+    store = HistorialStoreEnLotes(base, journal, max_espera_s=60)   # ya terminó: se adopta
+    store.cerrar()
+    assert _expedientes(base) == ["VIVO"]
+
+
+def test_upsert_encolado_no_duplica(tmp_path):
+    base = SQLiteHistorialStore(str(tmp_path / "h.sqlite"))
+    store = HistorialStoreEnLotes(base, str(tmp_path / "journal.jsonl"), max_espera_s=60)
+
+    assert store.agregar_o_reemplazar(_registro("E-1", estado="En proceso")) is False
+    assert store.agregar_o_reemplazar(_registro("E-1", estado="Emitido")) is True
+    assert store.contar_por_codigo("1534") == 1   # lo pendiente ya se ve deduplicado
+    store.volcar()
+    assert store.agregar_o_reemplazar(_registro("E-1", estado="Emitido")) is True
+    store.cerrar()
+
+    df = base.buscar_por_codigo("1534")
+    assert len(df) == 1
+    assert df.iloc[0]["estado"] == "Emitido"
@@ -0,0 +1,55 @@
+# ============================================
+# tests/test_historial_particionado.py
+# ============================================
+import os
+
+import pytest
+
+from storage.historial_particionado import ParticionadoHistorialStore
+
+pytest.importorskip("pyarrow")   # el backend particionado lo requiere
+
+INFO_UE = {"1534": {"sector": "SALUD"}, "1535": {"sector": "EDUCACION"}}
+
+
+def _registro(codigo, expediente, fecha, **extra):
+    return {"codigo": codigo, "nombre": "UE", "expediente": expediente, "numero_it": "IT",
+            "fecha_recepcion": fecha, **extra}
+
+
+def _store_con_datos(tmp_path, dimension_ue=""):
+    store = ParticionadoHistorialStore(str(tmp_path), dimension_ue=dimension_ue, proveedor_info_ue=lambda: (1, INFO_UE))
+    store.agregar_lote([
+        _registro("1534", "A-2023", "2023-05-01", año=2023),
+        _registro("1535", "B-2023", "2023-06-01", año=2023),
+        _registro("1534", "A-2024", "2024-02-01", año=2024),
+        _registro("1535", "B-2024", "2024-03-01"),   # sin 'año': partición por fecha_recepcion
+    ])
+    leidas = []
+    leer = store._cache.leer
+    store._cache.leer = lambda ruta: leidas.append(ruta) or leer(ruta)
+    return store, leidas
+
+
+def _anios_leidos(leidas):
+    return {segmento for ruta in leidas for segmento in ruta.split(os.sep) if segmento.startswith("anio=")}
+
+
+def test_leer_por_anio_solo_abre_ese_anio(tmp_path):
+    store, leidas = _store_con_datos(tmp_path)
+    df = store.leer_por_anio([2024])
+    assert sorted(df["expediente"]) == ["A-2024", "B-2024"]
+    assert _anios_leidos(leidas) == {"anio=2024"}
+
+
+def test_buscar_por_codigo_poda_por_sector(tmp_path):
+    store, leidas = _store_con_datos(tmp_path, dimension_ue="sector")
+    df = store.buscar_por_codigo("1534")
+    assert df["expediente"].tolist() == ["A-2023", "A-2024"]
+    assert all(f"{os.sep}sector=SALUD{os.sep}" in ruta for ruta in leidas)
+
+
+def test_upsert_reescribe_la_particion(tmp_path):
+    store, _ = _store_con_datos(tmp_path)
+    assert store.agregar_o_reemplazar(_registro("1534", "A-2024", "2024-02-01", año=2024, estado="Emitido")) is True
+    assert store.leer_por_anio([2024])["expediente"].value_counts().to_dict() == {"A-2024": 1, "B-2024": 1}
@@ -0,0 +1,70 @@
+# ============================================
+# tests/test_historial_store.py
+# ============================================
+import pandas as pd
+import pytest
+
+from storage.historial_postgres import PoolSQLite, PostgresHistorialStore
+from storage.historial_store import (
+    CacheHistorial,
+    ExcelHistorialStore,
+    SQLiteHistorialStore,
+    filtrar_anios,
+)
+
+BACKENDS = ["excel", "sqlite", "postgres", "particionado"]
+
+
+def crear_store(backend, tmp_path):
+    if backend == "excel":
+        return ExcelHistorialStore(str(tmp_path / "historial.xlsx"), cache=CacheHistorial())
+    if backend == "sqlite":
+        return SQLiteHistorialStore(str(tmp_path / "historial.sqlite"))
+    if backend == "postgres":
+        return PostgresHistorialStore(PoolSQLite(str(tmp_path / "postgres.sqlite")), dialecto="sqlite")
+    pytest.importorskip("pyarrow")
+    from storage.historial_particionado import ParticionadoHistorialStore
+
+    return ParticionadoHistorialStore(str(tmp_path / "particiones"), proveedor_info_ue=lambda: (1, {}))
+
+
+def _registro(**extra):
+    return {"codigo": "1534", "nombre": "UE", "expediente": "E-1", "numero_it": "IT-1",
+            "fecha_recepcion": "2024-01-02", "estado": "En proceso", **extra}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_upsert_agrega_y_luego_reemplaza(backend, tmp_path):
+    store = crear_store(backend, tmp_path)
+    store.agregar(_registro(expediente="OTRO"))
+
+    assert store.agregar_o_reemplazar(_registro()) is False
+    assert store.agregar_o_reemplazar(_registro(estado="Emitido")) is True
+
+    df = store.buscar_por_codigo("1534")
+    assert sorted(df["expediente"]) == ["E-1", "OTRO"]
+    assert df.loc[df["expediente"] == "E-1", "estado"].tolist() == ["Emitido"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_upsert_sin_clave_siempre_agrega(backend, tmp_path):
+    store = crear_store(backend, tmp_path)
+    assert store.agregar_o_reemplazar(_registro(expediente="", numero_it="")) is False
+    assert store.agregar_o_reemplazar(_registro(expediente="", numero_it="")) is False
+    assert store.contar_por_codigo("1534") == 2
+
+
+def test_upsert_sqlite_con_claves_numericas(tmp_path):
+    store = SQLiteHistorialStore(str(tmp_path / "historial.sqlite"))
+    store.agregar(_registro(expediente=12345.0, numero_it=7.0))
+    assert store.agregar_o_reemplazar(_registro(expediente="12345", numero_it="7")) is True
+    assert store.contar_por_codigo("1534") == 1
+
+
+def test_filtrar_anios_usa_fecha_recepcion_si_falta_el_anio():
+    df = pd.DataFrame({
+        "año": ["2024", None, "x", None],
+        "fecha_recepcion": ["2023-05-01", "2024-02-03", "2024-01-01 00:00:00", None],
+    })
+    assert filtrar_anios(df, [2024]).index.tolist() == [0, 1, 2]
+    assert filtrar_anios(df.drop(columns="año"), ["2024"]).index.tolist() == [1, 2]
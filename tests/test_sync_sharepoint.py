@@ -0,0 +1,63 @@
+# ============================================
+# tests/test_sync_sharepoint.py
+# ============================================
+import os
+
+from openpyxl import Workbook
+
+from storage.historial_store import SQLiteHistorialStore
+from storage.sync_sharepoint import FuenteArchivo, sincronizar_historial
+
+ENCABEZADO = ["Id_UE", "Expediente", "Número de I.T", "Fecha de recepción", "Estado", "Columna que la app no lee"]
+FILAS = [
+    [1534, "E-1", "IT-1", "2024-01-02", "En proceso", "x"],
+    [1535, "E-2", "IT-2", "2024-02-03", "En proceso", "x"],
+    [1536, "E-3", "IT-3", "2024-03-04", "Emitido", "x"],
+]
+
+
+def _escribir_export(path, filas, encabezado=ENCABEZADO):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(encabezado)
+    for fila in filas:
+        ws.append(fila)
+    wb.save(path)
+    # La fuente detecta cambios por (mtime, tamaño): se fuerza un mtime distinto
+    st_ = os.stat(path)
+    os.utime(path, ns=(st_.st_atime_ns, st_.st_mtime_ns + 1_000_000_000))
+
+
+def _sincronizar(tmp_path, store):
+    return sincronizar_historial(store, FuenteArchivo(str(tmp_path / "export.xlsx")), str(tmp_path / "estado.json"))
+
+
+def test_sincroniza_solo_filas_modificadas_y_eliminadas(tmp_path):
+    store = SQLiteHistorialStore(str(tmp_path / "historial.sqlite"))
+    _escribir_export(tmp_path / "export.xlsx", FILAS)
+    primera = _sincronizar(tmp_path, store)
+    assert primera["completo"] and primera["nuevas_o_modificadas"] == 3
+
+    assert _sincronizar(tmp_path, store)["sin_cambios"]
+
+    modificadas = [FILAS[0], [1535, "E-2", "IT-2", "2024-02-03", "Emitido", "x"]]   # E-3 se elimina
+    _escribir_export(tmp_path / "export.xlsx", modificadas)
+    segunda = _sincronizar(tmp_path, store)
+    assert not segunda["completo"]
+    assert segunda["nuevas_o_modificadas"] == 1
+    assert segunda["eliminadas"] == 1
+
+    df = store.leer_todo()
+    assert sorted(df["expediente"]) == ["E-1", "E-2"]
+    assert df.loc[df["expediente"] == "E-2", "estado"].tolist() == ["Emitido"]
+
+
+def test_cambio_en_columna_no_leida_fuerza_sync_completa(tmp_path):
+    store = SQLiteHistorialStore(str(tmp_path / "historial.sqlite"))
+    _escribir_export(tmp_path / "export.xlsx", FILAS)
+    _sincronizar(tmp_path, store)
+
+    _escribir_export(tmp_path / "export.xlsx", FILAS, encabezado=ENCABEZADO[:-1] + ["Columna renombrada"])
+    resultado = _sincronizar(tmp_path, store)
+    assert resultado["completo"]
+    assert len(store.leer_todo()) == 3
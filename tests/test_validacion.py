@@ -0,0 +1,25 @@
+# ============================================
+# tests/test_validacion.py
+# ============================================
+import pandas as pd
+
+from storage.validacion import validar_historial, validar_registro
+
+CASOS = [
+    {"estado": "Emitido", "periodo": "2025-2027", "expediente": "E-1", "fecha_it": "2025-01-02", "numero_it": "IT-1"},
+    {"estado": "Emitido", "periodo": "2025-2027", "expediente": "E-1", "fecha_it": None, "numero_it": ""},
+    {"estado": "emitido", "periodo": "", "expediente": None, "fecha_it": None, "numero_it": None},
+    {"estado": "Emitido", "periodo": "2025", "expediente": " ", "fecha_it": "2025-01-02", "numero_it": None},
+    {"estado": "En revisión", "periodo": "25-27", "expediente": None, "fecha_it": None, "numero_it": None},
+    {"estado": None, "periodo": None, "expediente": None, "fecha_it": None, "numero_it": None},
+]
+
+
+def test_validar_historial_igual_a_validar_registro():
+    esperados = ["; ".join(validar_registro(caso)) for caso in CASOS]
+    assert validar_historial(pd.DataFrame(CASOS)).tolist() == esperados
+
+
+def test_mensaje_de_emision_lista_todos_los_faltantes():
+    errores = validar_historial(pd.DataFrame([CASOS[2]]))
+    assert errores.iloc[0] == "Emitido sin Expediente (SGD), Fecha de I.T, Número de I.T"